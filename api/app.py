@@ -1,7 +1,9 @@
 import os
 import json
-import requests
 import logging
+import queue
+import threading
+import time
 from logging.handlers import RotatingFileHandler
 from datetime import datetime, timedelta
 from typing import Optional
@@ -11,12 +13,21 @@ from model.metric import MetricModel
 from model.repository import RepositoryModel
 from model.analysis_request import AnalysisRequestModel
 from model.metric_category import MetricCategory
+from model.job import JobModel, JobStatusEnum
+from model.import_batch import ImportBatchModel
 from clustering.cluster import get_cluster
 from clustering.advanced_cluster import get_enhanced_cluster
 from middleware.validation import validate_json, validate_email, validate_github_url
-from services.github_processor import GitHubProcessor
+from services.archive_cache import default_archive_cache
+from services.github_client import get_github_client
+from services.instrumentation import set_metrics_sink
+from services.job_events import JobEventHub
+from services.job_queue import enqueue_repository, start_in_process_workers
+from services.process_stats import ARCHIVE_CACHE, ETAG_CACHE, RATE_LIMIT, combined_stats
+from services.bulk_import import InvalidImport, parse_repo_list, import_repositories, batch_report
 from dotenv import load_dotenv
 from db import db
+from migrations import create_schema
 from nanoid import generate
 from waitress import serve
 
@@ -25,14 +36,14 @@ from flask import Flask, Response, request, jsonify, make_response
 from flask_cors import CORS
 app = Flask(__name__)
 
-# CORS with credentials for session cookies
+# CORS with credentials for session cookies; Retry-After is readable so clients can back off
 load_dotenv()
 FRONTEND_ORIGIN = os.environ.get('FRONTEND_ORIGIN')
 if FRONTEND_ORIGIN:
-  CORS(app, supports_credentials=True, origins=[FRONTEND_ORIGIN])
+  CORS(app, supports_credentials=True, origins=[FRONTEND_ORIGIN], expose_headers=['Retry-After'])
 else:
   # fallback: allow all (dev only). Consider setting FRONTEND_ORIGIN in prod
-  CORS(app, supports_credentials=True)
+  CORS(app, supports_credentials=True, expose_headers=['Retry-After'])
 
 # Load environment variables
 load_dotenv()
@@ -51,6 +62,10 @@ app.logger.addHandler(file_handler)
 app.logger.setLevel(logging.INFO)
 app.logger.info('HealthyEnv startup')
 
+# Per-stage analysis metrics (time, bytes, files, memory) go to the app log
+set_metrics_sink(lambda subject, stages: app.logger.info(
+    f'Analysis stages for {subject}: {json.dumps(stages, sort_keys=True)}'))
+
 # Database settings
 db_user = os.environ['DB_USER']
 db_password = os.environ['DB_PASSWORD']
@@ -134,17 +149,29 @@ def _delete_session(sid: Optional[str]):
     SESSIONS.pop(sid, None)
 
 
-# Creates database tables after first request
+# Creates database tables and applies pending schema migrations after first request
 @app.before_first_request
 def create_db():
   with app.app_context():
-    from model.dataset import DatasetModel
-    from model.repository import RepositoryModel
-    from model.metric import MetricModel
-    from model.metric_repo import MetricRepoModel
-    from model.analysis_request import AnalysisRequestModel
-    from model.metric_category import MetricCategory
-    db.create_all()
+    applied = create_schema()
+    if applied:
+      app.logger.info(f'Applied schema migrations {applied}')
+
+
+# Worker threads inside the API process, for development without worker.py
+JOB_IN_PROCESS_WORKERS = int(os.environ.get('JOB_IN_PROCESS_WORKERS', '0'))
+
+@app.before_first_request
+def start_job_workers():
+  if JOB_IN_PROCESS_WORKERS > 0:
+    start_in_process_workers(app, JOB_IN_PROCESS_WORKERS)
+    app.logger.info(f'Started {JOB_IN_PROCESS_WORKERS} in-process job workers')
+
+
+def _job_accepted(body: dict, job):
+  """202 response for queued work, pointing at the job to poll"""
+  body['job'] = job.to_dict()
+  return jsonify(body), 202, {'Location': f'/jobs/{job.id}'}
 
 
 @app.route('/datasets/<dataset_id>/cluster/<path:repo>')
@@ -272,7 +299,7 @@ def auth_github():
 
   code = request.args['code'] # Save the code to a variable
 
-  r = requests.post(url = 'https://github.com/login/oauth/access_token', params = {
+  r = get_github_client().post(url = 'https://github.com/login/oauth/access_token', params = {
     'code': code,
     'client_id': os.environ['GH_CLIENT_ID'],
     'client_secret': os.environ['GH_CLIENT_SECRET']
@@ -294,7 +321,7 @@ def auth_github_session():
     return jsonify({'error': 'Missing code'}), 400
 
   # Exchange code for token
-  r = requests.post(
+  r = get_github_client().post(
     url='https://github.com/login/oauth/access_token',
     params={
       'code': code,
@@ -316,7 +343,7 @@ def auth_github_session():
     'Accept': 'application/vnd.github+json',
     'X-GitHub-Api-Version': '2022-11-28'
   }
-  uresp = requests.get('https://api.github.com/user', headers=gh_headers)
+  uresp = get_github_client().get('https://api.github.com/user', headers=gh_headers)
   if uresp.status_code != 200:
     return jsonify({'error': 'Failed to fetch GitHub user'}), 502
   user = uresp.json() or {}
@@ -324,7 +351,7 @@ def auth_github_session():
   # Try to get a primary email
   email = None
   try:
-    eresp = requests.get('https://api.github.com/user/emails', headers=gh_headers)
+    eresp = get_github_client().get('https://api.github.com/user/emails', headers=gh_headers)
     if eresp.status_code == 200:
       emails = eresp.json() or []
       primary = next((e for e in emails if e.get('primary')), None)
@@ -407,7 +434,7 @@ def my_repos():
       'X-GitHub-Api-Version': '2022-11-28'
     }
     # Up to 100 repos; frontend can handle client-side filtering/pagination for now
-    resp = requests.get('https://api.github.com/user/repos?per_page=100&sort=updated', headers=headers)
+    resp = get_github_client().get('https://api.github.com/user/repos?per_page=100&sort=updated', headers=headers)
     return Response(resp.text, status=resp.status_code, mimetype='application/json')
   except Exception as e:
     app.logger.error(f'/me/repos error: {str(e)}')
@@ -473,26 +500,13 @@ def request_and_process(dataset_id: str):
       repo_url
     )
     db.session.add(analysis_request)
-    db.session.commit()
+    db.session.flush()
 
-    # 2) Mark IN PROGRESS
-    from model.analysis_request import AnalysisStatusEnum
-    analysis_request.status = AnalysisStatusEnum.IN_PROGRESS
+    # 2) Queue processing; a worker moves the request to IN PROGRESS and DONE
+    job = enqueue_repository(analysis_request)
     db.session.commit()
 
-    # 3) Process repository
-    processor = GitHubProcessor()
-    processor.add_repository_to_dataset(
-      dataset_id=dataset_id,
-      repo_url=repo_url,
-      submitter_name=analysis_request.name
-    )
-
-    # 4) Mark DONE
-    analysis_request.status = AnalysisStatusEnum.DONE
-    db.session.commit()
-
-    return jsonify({'request': analysis_request.to_dict(), 'status': 'DONE'}), 200
+    return _job_accepted({'request': analysis_request.to_dict(), 'status': 'RECEIVED'}, job)
   except Exception as e:
     # User asked to proceed without error-state expansion. We'll rollback and return 500.
     app.logger.error(f'request_and_process error: {str(e)}')
@@ -500,6 +514,57 @@ def request_and_process(dataset_id: str):
     return ErrorResponses.internal_server_error()
 
 
+@app.route('/datasets/<dataset_id>/import', methods=['POST'])
+@require_auth
+def import_repos(dataset_id: str):
+  """Queue a list of repositories for the dataset as one import batch
+
+  The list is either a JSON body with 'repo_urls' (an array, or text with one
+  URL per line) or an uploaded 'file' (text, CSV or JSON). Responds with the
+  batch report; GET /imports/<batch_id> follows its progress.
+  """
+  if not DatasetModel.find_dataset(dataset_id):
+    return ErrorResponses.non_existent_dataset
+
+  try:
+    upload = request.files.get('file')
+    if upload:
+      entries = parse_repo_list(upload.read().decode('utf-8', errors='replace'))
+    else:
+      repo_urls = (request.get_json(silent=True) or {}).get('repo_urls')
+      if isinstance(repo_urls, str):
+        entries = parse_repo_list(repo_urls)
+      elif isinstance(repo_urls, list):
+        entries = [str(url) for url in repo_urls]
+      else:
+        return ErrorResponses.bad_request("Provide 'repo_urls' or upload a 'file' with the repositories to import.")
+
+    batch = import_repositories(
+      dataset_id,
+      entries,
+      request.he_user.get('name') or request.he_user.get('login'),
+      request.he_user.get('email') or f"{request.he_user.get('login')}@users.noreply.github.com",
+      author=request.he_user.get('login')
+    )
+    return jsonify(batch_report(batch)), 202, {'Location': f'/imports/{batch.id}'}
+  except InvalidImport as e:
+    db.session.rollback()
+    return ErrorResponses.bad_request(str(e))
+  except Exception as e:
+    app.logger.error(f'import_repos error: {str(e)}')
+    db.session.rollback()
+    return ErrorResponses.internal_server_error()
+
+
+@app.route('/imports/<batch_id>', methods=['GET'])
+def get_import(batch_id):
+  """Per-repository outcomes, counts and throughput of an import batch"""
+  batch = ImportBatchModel.get_by_id(batch_id)
+  if not batch:
+    return ErrorResponses.not_found('Import not found')
+  return Response(json.dumps(batch_report(batch)), status=200, mimetype='application/json')
+
+
 # Stats / CI endpoint
 @app.route('/stats/bootstrap_ci', methods=['POST'])
 def stats_bootstrap_ci():
@@ -593,23 +658,15 @@ def update_request_status(request_id):
     if not analysis_request:
       return ErrorResponses.not_found('Analysis request not found')
     
-    analysis_request.status = new_status
-    
-    # If status is changed to DONE, automatically process the repository
+    # Changing the status to DONE queues the repository for processing; the
+    # worker sets IN PROGRESS and DONE, or RECEIVED again so the admin can retry
     if new_status == 'DONE':
-      try:
-        processor = GitHubProcessor()
-        processor.add_repository_to_dataset(
-          dataset_id=analysis_request.id_target_dataset,
-          repo_url=analysis_request.repo_url,
-          submitter_name=analysis_request.name
-        )
-        app.logger.info(f'Repository {analysis_request.repo_url} successfully processed and added to dataset {analysis_request.id_target_dataset}')
-      except Exception as processing_error:
-        app.logger.error(f'Error processing repository {analysis_request.repo_url}: {str(processing_error)}')
-        # Don't fail the status update if processing fails
-        # The admin can retry later
+      job = enqueue_repository(analysis_request)
+      db.session.commit()
+      app.logger.info(f'Request {request_id} queued for processing as job {job.id}')
+      return _job_accepted(analysis_request.to_dict(), job)
     
+    analysis_request.status = new_status
     db.session.commit()
     
     app.logger.info(f'Request {request_id} status updated to {new_status}')
@@ -655,32 +712,155 @@ def process_request_manually(request_id):
     if not analysis_request:
       return ErrorResponses.not_found('Analysis request not found')
     
-    processor = GitHubProcessor()
-    repository = processor.add_repository_to_dataset(
-      dataset_id=analysis_request.id_target_dataset,
-      repo_url=analysis_request.repo_url,
-      submitter_name=analysis_request.name
-    )
-    
-    # Update status to DONE
-    analysis_request.status = 'DONE'
+    # The worker records the repository id and name in the job result
+    job = enqueue_repository(analysis_request)
     db.session.commit()
     
-    app.logger.info(f'Request {request_id} manually processed successfully')
-    return Response(
-      json.dumps({
-        'message': 'Repository processed and added to dataset successfully',
-        'repository_id': repository.id,
-        'repository_name': repository.name
-      }),
-      status=200,
-      mimetype='application/json'
-    )
+    app.logger.info(f'Request {request_id} queued for processing as job {job.id}')
+    return _job_accepted({'message': 'Repository queued for processing'}, job)
     
   except Exception as e:
     app.logger.error(f'Error manually processing request: {str(e)}')
     db.session.rollback()
     return ErrorResponses.internal_server_error()
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+  """State, attempts and result of a background job"""
+  job = JobModel.get_by_id(job_id)
+  if not job:
+    return ErrorResponses.not_found('Job not found')
+  return Response(json.dumps(job.to_dict()), status=200, mimetype='application/json')
+
+# One thread per process checks the jobs followed by event streams this often (see JobEventHub);
+# idle streams send a comment so proxies keep them open
+JOB_EVENTS_POLL_SECONDS = float(os.environ.get('JOB_EVENTS_POLL_SECONDS', '0.5'))
+JOB_EVENTS_KEEPALIVE_SECONDS = 15
+# Request threads of the API server (the serve call at the end of this file). Each open stream
+# holds one, so streams may take up to three quarters of them, leaving the rest for other
+# requests; a stream is closed after JOB_EVENTS_MAX_SECONDS (clients reconnect)
+API_SERVER_THREADS = int(os.environ.get('API_SERVER_THREADS', '64'))
+JOB_EVENTS_MAX_STREAMS = int(os.environ.get('JOB_EVENTS_MAX_STREAMS') or max(1, API_SERVER_THREADS * 3 // 4))
+JOB_EVENTS_MAX_SECONDS = float(os.environ.get('JOB_EVENTS_MAX_SECONDS', '300'))
+JOB_EVENTS_RETRY_SECONDS = 5
+_job_event_streams = threading.BoundedSemaphore(JOB_EVENTS_MAX_STREAMS)
+job_event_hub = JobEventHub(app, JOB_EVENTS_POLL_SECONDS)
+
+def _job_event(event: str, state: dict) -> str:
+  return f"event: {event}\ndata: {json.dumps(state)}\n\n"
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+  """Stream the stage and progress of a job as Server-Sent Events until it finishes
+
+  Every change is sent as a 'progress' event carrying the job as returned by
+  /jobs/<job_id>; an 'end' event with the final state closes the stream. A
+  stream open for JOB_EVENTS_MAX_SECONDS is closed with a 'timeout' event, and
+  past JOB_EVENTS_MAX_STREAMS open streams new ones are refused with a 503 and
+  a Retry-After header.
+  """
+  job = JobModel.get_by_id(job_id)
+  if not job:
+    return ErrorResponses.not_found('Job not found')
+  if job.status in (JobStatusEnum.SUCCEEDED, JobStatusEnum.FAILED):
+    # Nothing left to wait for: the final state is the whole stream
+    return Response(
+      _job_event('end', job.to_dict()),
+      status=200,
+      mimetype='text/event-stream',
+      headers={'Cache-Control': 'no-cache'}
+    )
+  if not _job_event_streams.acquire(blocking=False):
+    return ErrorResponses.service_unavailable(
+      f'Too many open job event streams; poll /jobs/{job_id} instead or retry later.', JOB_EVENTS_RETRY_SECONDS)
+
+  updates = job_event_hub.subscribe(job_id)
+  def close():
+    job_event_hub.unsubscribe(job_id, updates)
+    _job_event_streams.release()
+  try:
+    # Read after subscribing, so a change in between reaches the stream one way or the other
+    db.session.refresh(job)
+    state = job.to_dict()
+  except Exception:
+    close()
+    raise
+
+  def events():
+    last_state = state
+    started = time.monotonic()
+    yield f"retry: {JOB_EVENTS_RETRY_SECONDS * 1000}\n\n"
+    yield _job_event('progress', state)
+    while True:
+      remaining = JOB_EVENTS_MAX_SECONDS - (time.monotonic() - started)
+      if remaining <= 0:
+        yield _job_event('timeout', last_state)
+        return
+      try:
+        update = updates.get(timeout=min(JOB_EVENTS_KEEPALIVE_SECONDS, remaining))
+      except queue.Empty:
+        yield ": keep-alive\n\n"
+        continue
+      if update is None:
+        # The job was deleted
+        return
+      if update == last_state:
+        continue
+      last_state = update
+      yield _job_event('progress', update)
+      if update['status'] in (JobStatusEnum.SUCCEEDED.value, JobStatusEnum.FAILED.value):
+        yield _job_event('end', update)
+        return
+
+  # The stream does not use the request's database session, which is released when this returns
+  response = Response(
+    events(),
+    status=200,
+    mimetype='text/event-stream',
+    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+  )
+  # Called by the server when the stream ends or the client goes away, even before the first event
+  response.call_on_close(close)
+  return response
+
+# Caches and the token pool count in the memory of each process; job workers and the scheduler publish
+# theirs (see services.process_stats), and these endpoints add them to the API's own
+@app.route('/admin/archive-cache', methods=['GET'])
+def archive_cache_stats():
+  """Hit rate of the downloaded archive cache over the API, job worker and scheduler processes, and its disk usage as seen by the API"""
+  cache = default_archive_cache()
+  if not cache:
+    return Response(json.dumps({'enabled': False}), status=200, mimetype='application/json')
+  return Response(
+    json.dumps(dict(combined_stats(ARCHIVE_CACHE, cache.stats()), enabled=True)),
+    status=200,
+    mimetype='application/json'
+  )
+
+@app.route('/admin/etag-cache', methods=['GET'])
+def etag_cache_stats():
+  """Revalidation hit rate of the GitHub metadata ETag cache over the API, job worker and scheduler processes, and its size as seen by the API"""
+  cache = get_github_client().conditional_cache
+  if not cache:
+    return Response(json.dumps({'enabled': False}), status=200, mimetype='application/json')
+  return Response(
+    json.dumps(dict(combined_stats(ETAG_CACHE, cache.stats()), enabled=True)),
+    status=200,
+    mimetype='application/json'
+  )
+
+@app.route('/admin/rate-limit', methods=['GET'])
+def rate_limit_stats():
+  """Remaining GitHub quota of each pooled token and the pacing counters, over the API, job worker and scheduler processes"""
+  pool = get_github_client().token_pool
+  if not pool:
+    return Response(json.dumps({'enabled': False}), status=200, mimetype='application/json')
+  return Response(
+    json.dumps(dict(combined_stats(RATE_LIMIT, pool.stats()), enabled=True)),
+    status=200,
+    mimetype='application/json'
+  )
+
 if __name__ == '__main__':
   app.run(debug=True)
-  # serve(app, host='0.0.0.0', port=8000)
\ No newline at end of file
+  # serve(app, host='0.0.0.0', port=8000, threads=API_SERVER_THREADS)
\ No newline at end of file
@@ -28,3 +28,15 @@ def validate_email(email):
 def validate_github_url(url):
     pattern = r'^https://github\.com/[a-zA-Z0-9_-]+/[a-zA-Z0-9_.-]+/?$'
     return re.match(pattern, url) is not None
+
+_GITHUB_REPO_RE = re.compile(
+    r'^(?:(?:https?://)?(?:www\.)?github\.com/|git@github\.com:)?'
+    r'(?P<owner>[a-zA-Z0-9_-]+)/(?P<repo>[a-zA-Z0-9_.-]+?)(?:\.git)?(?:/.*)?$'
+)
+
+def normalize_github_url(value):
+    """Canonical https://github.com/owner/repo URL of a repository URL, clone URL or owner/repo, or None"""
+    match = _GITHUB_REPO_RE.match(value.strip()) if value else None
+    if not match or match.group('repo') in ('.', '..'):
+        return None
+    return f"https://github.com/{match.group('owner')}/{match.group('repo')}"
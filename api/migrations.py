@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations, applied after db.create_all
+
+db.create_all creates missing tables but never changes existing ones, so the
+columns, indexes and constraints added to the models after a database was
+created are added here. Each migration runs once, in version order, and is
+recorded in the schema_version table. Migrations look at the live schema
+before changing it, so on a database create_all just built they only record
+their version.
+
+Usage:
+    python migrations.py [--status]
+"""
+
+import argparse
+import logging
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, Text, inspect, select, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from db import db
+
+_metadata = MetaData()
+_schema_version = Table(
+    'schema_version', _metadata,
+    Column('version', Integer, primary_key=True, autoincrement=False),
+    Column('description', String(200)),
+    Column('applied_at', DateTime)
+)
+
+
+# Conflicting metric_repo duplicates listed by a failed migration 3
+DUPLICATES_LISTED = 50
+
+
+class MigrationError(Exception):
+    """A migration that cannot be applied without a person resolving the data first"""
+
+
+def _quote(conn, name):
+    return conn.dialect.identifier_preparer.quote(name)
+
+
+def _add_column(conn, table: str, name: str, type_):
+    if name in {column['name'] for column in inspect(conn).get_columns(table)}:
+        return
+    conn.execute(text(f"ALTER TABLE {_quote(conn, table)} ADD COLUMN {_quote(conn, name)} "
+                      f"{type_.compile(dialect=conn.dialect)}"))
+
+
+def _has_index(conn, table: str, columns, unique=False):
+    """Whether an index (or unique constraint, when unique) on exactly these columns exists, in this order"""
+    inspector = inspect(conn)
+    found = [index['column_names'] for index in inspector.get_indexes(table) if index['unique'] or not unique]
+    found += [constraint['column_names'] for constraint in inspector.get_unique_constraints(table)]
+    return list(columns) in found
+
+
+def _create_index(conn, name: str, table: str, columns, unique=False):
+    if _has_index(conn, table, columns, unique):
+        return
+    conn.execute(text(f"CREATE {'UNIQUE ' if unique else ''}INDEX {_quote(conn, name)} ON {_quote(conn, table)} "
+                      f"({', '.join(_quote(conn, column) for column in columns)})"))
+
+
+def _repository_columns(conn):
+    _add_column(conn, 'repository', 'last_commit_sha', String(40))
+    _add_column(conn, 'repository', 'code_metrics', Text())
+    _add_column(conn, 'repository', 'pushed_at', DateTime())
+    _add_column(conn, 'repository', 'last_refreshed_at', DateTime())
+
+
+def _queue_tables(conn):
+    from model.analysis_snapshot import AnalysisSnapshotModel
+    from model.import_batch import ImportBatchModel
+    from model.job import JobModel
+    from model.refresh_checkpoint import RefreshCheckpointModel
+    # import_batch before job, which references it
+    for model in (AnalysisSnapshotModel, ImportBatchModel, JobModel, RefreshCheckpointModel):
+        model.__table__.create(conn, checkfirst=True)
+    # Job tables created before progress reporting and import batches
+    _add_column(conn, 'job', 'stage', String(40))
+    _add_column(conn, 'job', 'progress', Text())
+    _add_column(conn, 'job', 'id_import_batch', String(10))
+
+
+def _metric_repo_unique(conn):
+    """Unique (id_repo, id_metric) on metric_repo, removing the duplicates that hold the same value
+
+    Rows have no timestamp, so of duplicates with different values none is
+    known to be the latest: the migration then fails and lists them.
+    """
+    if _has_index(conn, 'metric_repo', ('id_repo', 'id_metric'), unique=True):
+        return
+    # One row per (id_repo, id_metric, value); the derived table lets MySQL delete from the table it reads
+    removed = conn.execute(text(
+        "DELETE FROM metric_repo WHERE id NOT IN ("
+        "SELECT id FROM (SELECT MIN(id) AS id FROM metric_repo GROUP BY id_repo, id_metric, value) AS keep)"
+    )).rowcount
+    if removed:
+        logging.info(f"Removed {removed} metric_repo rows repeating the value of another row")
+
+    conflicts = conn.execute(text(
+        "SELECT id_repo, id_metric, COUNT(*) FROM metric_repo GROUP BY id_repo, id_metric "
+        "HAVING COUNT(*) > 1 ORDER BY id_repo, id_metric"
+    )).all()
+    if conflicts:
+        lines = []
+        for id_repo, id_metric, _ in conflicts[:DUPLICATES_LISTED]:
+            rows = conn.execute(text(
+                "SELECT id, value FROM metric_repo WHERE id_repo = :id_repo AND id_metric = :id_metric ORDER BY id"
+            ), {'id_repo': id_repo, 'id_metric': id_metric}).all()
+            lines.append(f"  repository {id_repo} metric {id_metric}: "
+                         + ', '.join(f"id {id} = {value}" for id, value in rows))
+        if len(conflicts) > DUPLICATES_LISTED:
+            lines.append(f"  ... and {len(conflicts) - DUPLICATES_LISTED} more")
+        raise MigrationError(
+            f"metric_repo has {len(conflicts)} (id_repo, id_metric) pairs with different values. Delete the "
+            "stale rows (or all but one, then refresh those repositories) and run python migrations.py again:\n"
+            + '\n'.join(lines))
+    _create_index(conn, 'uq_metric_repo_repo_metric', 'metric_repo', ('id_repo', 'id_metric'), unique=True)
+
+
+def _hot_path_indexes(conn):
+    _create_index(conn, 'ix_repository_dataset_name', 'repository', ('dataset_id', 'name'))
+    _create_index(conn, 'ix_repository_last_refreshed_at', 'repository', ('last_refreshed_at',))
+    _create_index(conn, 'ix_analysis_request_email', 'analysis_request', ('email',))
+    _create_index(conn, 'ix_job_status_run_after', 'job', ('status', 'run_after'))
+    _create_index(conn, 'ix_job_analysis_request', 'job', ('id_analysis_request',))
+    _create_index(conn, 'ix_job_import_batch', 'job', ('id_import_batch',))
+
+
+def _process_stats_table(conn):
+    from model.process_stats import ProcessStatsModel
+    ProcessStatsModel.__table__.create(conn, checkfirst=True)
+
+
+# (version, description, upgrade(connection)); append new migrations, never edit applied ones
+MIGRATIONS = [
+    (1, 'Commit snapshot and refresh columns of repository', _repository_columns),
+    (2, 'Job queue, analysis snapshot, import batch and refresh checkpoint tables', _queue_tables),
+    (3, 'Unique (id_repo, id_metric) on metric_repo', _metric_repo_unique),
+    (4, 'Indexes for repository, analysis request and job lookups', _hot_path_indexes),
+    (5, 'Process stats table', _process_stats_table),
+]
+
+
+def applied_versions(engine) -> set:
+    with engine.begin() as conn:
+        _schema_version.create(conn, checkfirst=True)
+        return {version for (version,) in conn.execute(select(_schema_version.c.version))}
+
+
+def pending_migrations(engine) -> List[int]:
+    """Versions not applied yet, without creating or changing anything"""
+    with engine.connect() as conn:
+        if not inspect(conn).has_table(_schema_version.name):
+            return [version for version, _, _ in MIGRATIONS]
+        applied = {version for (version,) in conn.execute(select(_schema_version.c.version))}
+    return [version for version, _, _ in MIGRATIONS if version not in applied]
+
+
+def migrate(engine=None) -> List[int]:
+    """Apply pending migrations in version order
+
+    Another process (the API, a worker) may be migrating at the same time; a
+    migration that fails because it already ran there is skipped.
+
+    Returns:
+        The versions applied
+
+    Raises:
+        MigrationError: If a migration needs the data resolved first; it is rolled back
+    """
+    engine = engine or db.engine
+    applied = applied_versions(engine)
+    done = []
+    for version, description, upgrade in MIGRATIONS:
+        if version in applied:
+            continue
+        logging.info(f"Applying schema migration {version}: {description}")
+        try:
+            with engine.begin() as conn:
+                upgrade(conn)
+                conn.execute(_schema_version.insert().values(
+                    version=version, description=description, applied_at=datetime.now()))
+        except SQLAlchemyError:
+            if version in applied_versions(engine):
+                logging.info(f"Schema migration {version} was applied by another process")
+                continue
+            raise
+        done.append(version)
+    return done
+
+
+def create_schema() -> List[int]:
+    """Create missing tables, then apply pending migrations; runs inside an app context
+
+    Returns:
+        The migration versions applied
+    """
+    # create_all only knows the tables of imported models
+    from model.dataset import DatasetModel
+    from model.repository import RepositoryModel
+    from model.metric import MetricModel
+    from model.metric_repo import MetricRepoModel
+    from model.analysis_request import AnalysisRequestModel
+    from model.metric_category import MetricCategory
+    from model.job import JobModel
+    from model.analysis_snapshot import AnalysisSnapshotModel
+    from model.import_batch import ImportBatchModel
+    from model.refresh_checkpoint import RefreshCheckpointModel
+    from model.process_stats import ProcessStatsModel
+    db.create_all()
+    return migrate(db.engine)
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Apply pending database schema migrations')
+    parser.add_argument('--status', action='store_true', help='List migrations and whether they are applied')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+    from app import app
+    with app.app_context():
+        if args.status:
+            applied = applied_versions(db.engine)
+            for version, description, _ in MIGRATIONS:
+                print(f"{version:>3} {'applied' if version in applied else 'pending':<8} {description}")
+            return 0
+        try:
+            done = create_schema()
+        except MigrationError as e:
+            logging.error(str(e))
+            return 1
+        logging.info(f"Applied migrations {done}" if done else "Schema is up to date")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
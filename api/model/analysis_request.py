@@ -2,7 +2,7 @@ from ast import For
 import enum
 import json
 from datetime import datetime
-from sqlalchemy import ForeignKey, Enum
+from sqlalchemy import ForeignKey, Enum, Index
 from db import db
 
 class AnalysisStatusEnum(enum.Enum):
@@ -12,6 +12,9 @@ class AnalysisStatusEnum(enum.Enum):
 
 class AnalysisRequestModel(db.Model):
   __tablename__ = 'analysis_request'
+  __table_args__ = (
+    Index('ix_analysis_request_email', 'email'),
+  )
 
   id = db.Column(db.String(10), primary_key=True)
   id_target_dataset = db.Column(db.String(10), ForeignKey('dataset.id'))
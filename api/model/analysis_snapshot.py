@@ -0,0 +1,95 @@
+import enum
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import Enum
+from sqlalchemy.exc import IntegrityError
+from db import db
+
+class SnapshotStatusEnum(enum.Enum):
+  RUNNING = 'RUNNING'
+  DONE = 'DONE'
+
+class AnalysisSnapshotModel(db.Model):
+  """Code metrics of one commit of a repository, shared by every dataset that contains it
+
+  A RUNNING row is the claim of the process analysing the commit; its
+  updated_at is the heartbeat other processes check before taking it over.
+  """
+  __tablename__ = 'analysis_snapshot'
+
+  key = db.Column(db.String(255), primary_key=True)
+  name = db.Column(db.String(200))
+  commit_sha = db.Column(db.String(40))
+  status = db.Column(Enum(SnapshotStatusEnum), nullable=False)
+  code_metrics = db.Column(db.Text)
+  worker = db.Column(db.String(80))
+  created_at = db.Column(db.DateTime, default=datetime.now)
+  updated_at = db.Column(db.DateTime, default=datetime.now)
+
+
+  def __init__(self, key, name, commit_sha, worker):
+    self.key = key
+    self.name = name
+    self.commit_sha = commit_sha
+    self.status = SnapshotStatusEnum.RUNNING
+    self.worker = worker
+    self.created_at = datetime.now()
+    self.updated_at = datetime.now()
+
+
+  def get_code_metrics(self):
+    return json.loads(self.code_metrics) if self.code_metrics else None
+
+
+  @classmethod
+  def get(cls, key):
+    return cls.query.filter_by(key=key).first()
+
+  @classmethod
+  def claim(cls, key, name, commit_sha, worker, lease_seconds):
+    """Claim the analysis of key for worker
+
+    Returns:
+      True if worker now holds the claim: the row did not exist, or its
+      holder stopped sending heartbeats for longer than lease_seconds
+    """
+    now = datetime.now()
+    try:
+      # A plain INSERT, as the session may already hold the existing row
+      db.session.execute(cls.__table__.insert().values(
+        key=key, name=name, commit_sha=commit_sha, status=SnapshotStatusEnum.RUNNING,
+        worker=worker, created_at=now, updated_at=now))
+      db.session.commit()
+      return True
+    except IntegrityError:
+      db.session.rollback()
+
+    taken = cls.query.filter(
+      cls.key == key,
+      cls.status == SnapshotStatusEnum.RUNNING,
+      cls.updated_at < now - timedelta(seconds=lease_seconds)
+    ).update({'worker': worker, 'updated_at': now}, synchronize_session=False)
+    db.session.commit()
+    return bool(taken)
+
+  @classmethod
+  def heartbeat(cls, key, worker):
+    cls.query.filter_by(key=key, worker=worker, status=SnapshotStatusEnum.RUNNING).update(
+      {'updated_at': datetime.now()}, synchronize_session=False)
+    db.session.commit()
+
+  @classmethod
+  def publish(cls, key, worker, code_metrics):
+    cls.query.filter_by(key=key, worker=worker, status=SnapshotStatusEnum.RUNNING).update({
+      'status': SnapshotStatusEnum.DONE,
+      'code_metrics': json.dumps(code_metrics),
+      'updated_at': datetime.now()
+    }, synchronize_session=False)
+    db.session.commit()
+
+  @classmethod
+  def release(cls, key, worker):
+    """Drop a claim without a result, so a waiting process can analyse the commit itself"""
+    cls.query.filter_by(key=key, worker=worker, status=SnapshotStatusEnum.RUNNING).delete(
+      synchronize_session=False)
+    db.session.commit()
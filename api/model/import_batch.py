@@ -0,0 +1,34 @@
+import json
+from datetime import datetime
+from sqlalchemy import ForeignKey
+from db import db
+
+class ImportBatchModel(db.Model):
+  """A bulk import of repositories into a dataset; its jobs carry the batch id"""
+  __tablename__ = 'import_batch'
+
+  id = db.Column(db.String(10), primary_key=True)
+  dataset_id = db.Column(db.String(10), ForeignKey('dataset.id'))
+  author = db.Column(db.String(80))
+  submitted = db.Column(db.Integer)
+  skipped = db.Column(db.Text)
+  created_at = db.Column(db.DateTime, default=datetime.now)
+
+
+  def __init__(self, id, dataset_id, author, submitted, skipped):
+    self.id = id
+    self.dataset_id = dataset_id
+    self.author = author
+    self.submitted = submitted
+    self.skipped = json.dumps(skipped)
+    self.created_at = datetime.now()
+
+
+  def get_skipped(self):
+    """Entries not queued, as {'repo_url', 'outcome', 'reason'} dictionaries"""
+    return json.loads(self.skipped) if self.skipped else []
+
+
+  @classmethod
+  def get_by_id(cls, batch_id):
+    return cls.query.filter_by(id=batch_id).first()
@@ -0,0 +1,286 @@
+import enum
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import ForeignKey, Enum, Index, bindparam, func, or_, update
+from nanoid import generate
+from db import db
+
+class JobStatusEnum(enum.Enum):
+  QUEUED = 'QUEUED'
+  RUNNING = 'RUNNING'
+  SUCCEEDED = 'SUCCEEDED'
+  FAILED = 'FAILED'
+
+ACTIVE_STATUSES = (JobStatusEnum.QUEUED, JobStatusEnum.RUNNING)
+
+class JobModel(db.Model):
+  """Background job persisted in the database, claimed by one worker at a time"""
+  __tablename__ = 'job'
+  __table_args__ = (
+    # claim_next looks for queued jobs due to run; requeue_stale for running ones
+    Index('ix_job_status_run_after', 'status', 'run_after'),
+    Index('ix_job_analysis_request', 'id_analysis_request'),
+    Index('ix_job_import_batch', 'id_import_batch'),
+  )
+
+  id = db.Column(db.String(10), primary_key=True)
+  kind = db.Column(db.String(40), nullable=False)
+  payload = db.Column(db.Text)
+  id_analysis_request = db.Column(db.String(10), ForeignKey('analysis_request.id'))
+  id_import_batch = db.Column(db.String(10), ForeignKey('import_batch.id'))
+  status = db.Column(Enum(JobStatusEnum), nullable=False)
+  attempts = db.Column(db.Integer, default=0)
+  max_attempts = db.Column(db.Integer, default=3)
+  error = db.Column(db.Text)
+  result = db.Column(db.Text)
+  worker = db.Column(db.String(80))
+  stage = db.Column(db.String(40))
+  progress = db.Column(db.Text)
+  run_after = db.Column(db.DateTime, default=datetime.now)
+  heartbeat_at = db.Column(db.DateTime)
+  created_at = db.Column(db.DateTime, default=datetime.now)
+  updated_at = db.Column(db.DateTime, default=datetime.now)
+  started_at = db.Column(db.DateTime)
+  finished_at = db.Column(db.DateTime)
+
+
+  def __init__(self, id, kind, payload, id_analysis_request=None, max_attempts=3, id_import_batch=None):
+    self.id = id
+    self.kind = kind
+    self.payload = json.dumps(payload)
+    self.id_analysis_request = id_analysis_request
+    self.id_import_batch = id_import_batch
+    self.status = JobStatusEnum.QUEUED
+    self.stage = 'queued'
+    self.attempts = 0
+    self.max_attempts = max_attempts
+    self.run_after = datetime.now()
+    self.created_at = datetime.now()
+    self.updated_at = datetime.now()
+
+
+  def get_payload(self):
+    return json.loads(self.payload) if self.payload else {}
+
+  def get_result(self):
+    return json.loads(self.result) if self.result else None
+
+  def get_progress(self):
+    return json.loads(self.progress) if self.progress else {}
+
+  def to_dict(self):
+    """Convert to dictionary for JSON serialization"""
+    return {
+      'id': self.id,
+      'kind': self.kind,
+      'id_request': self.id_analysis_request,
+      'status': self.status.value,
+      'stage': self.stage,
+      'progress': self.get_progress(),
+      'attempts': self.attempts,
+      'max_attempts': self.max_attempts,
+      'error': self.error,
+      'result': self.get_result(),
+      'created_at': self.created_at.isoformat() if self.created_at else None,
+      'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+      'started_at': self.started_at.isoformat() if self.started_at else None,
+      'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+    }
+
+
+  def _finish(self, values: dict, worker: str = None) -> bool:
+    """Apply values if the job is still running under worker (by default the one loaded)
+
+    Once the lease of a slow worker expires the job may have been requeued,
+    and claimed by another worker; the UPDATE then matches no row and the
+    outcome of this attempt is dropped.
+
+    Returns:
+      Whether the job was updated; the caller commits
+    """
+    updated = JobModel.query.filter_by(id=self.id, status=JobStatusEnum.RUNNING, worker=worker or self.worker).update(
+      values, synchronize_session=False)
+    # Reload on next access: the row holds either these values or another worker's
+    db.session.expire(self)
+    return bool(updated)
+
+  def succeed(self, result=None, worker: str = None) -> bool:
+    """Record the result of the running attempt; False when the job no longer belongs to worker
+
+    Pass the worker that claimed the job: the instance reloads after a commit
+    and may by then name another worker.
+    """
+    now = datetime.now()
+    return self._finish({
+      'status': JobStatusEnum.SUCCEEDED,
+      'stage': 'done',
+      'progress': None,
+      'result': json.dumps(result) if result is not None else None,
+      'error': None,
+      'finished_at': now,
+      'updated_at': now
+    }, worker)
+
+  def fail(self, error: str, retry_delay: float = None, worker: str = None) -> bool:
+    """Record a failed attempt, queueing a retry after retry_delay seconds while attempts remain
+
+    Returns:
+      False when the job no longer belongs to worker (see succeed)
+    """
+    now = datetime.now()
+    retry = retry_delay is not None and self.attempts < self.max_attempts
+    return self._finish(self._failure_values(error, now, retry, retry_delay or 0), worker)
+
+  @staticmethod
+  def _failure_values(error: str, now: datetime, retry: bool, retry_delay: float = 0) -> dict:
+    values = {'error': error, 'updated_at': now, 'progress': None}
+    if retry:
+      values.update(status=JobStatusEnum.QUEUED, stage='queued', worker=None,
+                    run_after=now + timedelta(seconds=retry_delay))
+    else:
+      values.update(status=JobStatusEnum.FAILED, stage='failed', finished_at=now)
+    return values
+
+
+  @classmethod
+  def enqueue(cls, kind: str, payload: dict, id_analysis_request=None, max_attempts=3, id_import_batch=None):
+    """Add a queued job to the session; the caller commits it, e.g. with the request it belongs to"""
+    job = cls(generate(size=10), kind, payload, id_analysis_request, max_attempts, id_import_batch)
+    db.session.add(job)
+    return job
+
+  @classmethod
+  def get_by_id(cls, job_id):
+    return cls.query.filter_by(id=job_id).first()
+
+  @classmethod
+  def find_active_for_request(cls, request_id):
+    """Queued or running job of an analysis request, if any"""
+    return cls.query.filter(
+      cls.id_analysis_request == request_id,
+      cls.status.in_(ACTIVE_STATUSES)
+    ).first()
+
+  @classmethod
+  def find_by_import_batch(cls, batch_id):
+    return cls.query.filter_by(id_import_batch=batch_id).order_by(cls.created_at).all()
+
+  @classmethod
+  def find_queued_in_batch(cls, batch_id, created_from, limit):
+    """Queued jobs of an import batch created at or after created_from, oldest first"""
+    return cls.query.filter(
+      cls.id_import_batch == batch_id,
+      cls.status == JobStatusEnum.QUEUED,
+      cls.created_at >= created_from
+    ).order_by(cls.created_at).limit(limit).all()
+
+  @classmethod
+  def set_queued_payloads(cls, payloads: dict):
+    """Replace the payloads (job id -> payload) of jobs still queued, in one executemany; the caller commits"""
+    if not payloads:
+      return
+    db.session.execute(
+      update(cls.__table__).where(
+        cls.__table__.c.id == bindparam('job_id'),
+        cls.__table__.c.status == JobStatusEnum.QUEUED
+      ).values(payload=bindparam('job_payload')),
+      [{'job_id': job_id, 'job_payload': json.dumps(payload)} for job_id, payload in payloads.items()]
+    )
+
+  @classmethod
+  def claim_next(cls, worker: str, candidates: int = 5, batch_concurrency: int = 0, id_import_batch: str = None):
+    """Claim the oldest runnable job for worker, or return None when the queue is empty
+
+    The claim is a conditional UPDATE on the job's status, so when several
+    workers race for a job exactly one of them gets it. With batch_concurrency,
+    jobs of an import batch that already has that many jobs running are passed
+    over, so a large import leaves workers for other submissions; racing
+    workers may exceed the limit by a job or two. With id_import_batch only
+    jobs of that import batch are claimed.
+    """
+    now = datetime.now()
+    runnable = cls.query.with_entities(cls.id).filter(
+      cls.status == JobStatusEnum.QUEUED,
+      cls.run_after <= now
+    )
+    if id_import_batch:
+      runnable = runnable.filter(cls.id_import_batch == id_import_batch)
+    if batch_concurrency > 0:
+      busy_batches = db.session.query(cls.id_import_batch).filter(
+        cls.status == JobStatusEnum.RUNNING,
+        cls.id_import_batch.isnot(None)
+      ).group_by(cls.id_import_batch).having(func.count(cls.id) >= batch_concurrency)
+      runnable = runnable.filter(or_(cls.id_import_batch.is_(None), cls.id_import_batch.notin_(busy_batches)))
+    queued = runnable.order_by(cls.created_at).limit(candidates).all()
+
+    for (job_id,) in queued:
+      claimed = cls.query.filter_by(id=job_id, status=JobStatusEnum.QUEUED).update({
+        'status': JobStatusEnum.RUNNING,
+        'worker': worker,
+        'attempts': cls.attempts + 1,
+        'stage': 'started',
+        'progress': None,
+        'started_at': now,
+        'heartbeat_at': now,
+        'updated_at': now,
+      }, synchronize_session=False)
+      db.session.commit()
+      if claimed:
+        return cls.get_by_id(job_id)
+    return None
+
+  @classmethod
+  def heartbeat(cls, job_id, worker: str = None):
+    """Extend the lease of a running job, only while worker (when given) runs it"""
+    query = cls.query.filter_by(id=job_id, status=JobStatusEnum.RUNNING)
+    if worker:
+      query = query.filter_by(worker=worker)
+    query.update({'heartbeat_at': datetime.now()}, synchronize_session=False)
+    db.session.commit()
+
+  @classmethod
+  def set_progress(cls, job_id, stage: str, details: dict):
+    """Record the stage a running job is in, with details such as bytes received or files analysed"""
+    now = datetime.now()
+    cls.query.filter_by(id=job_id, status=JobStatusEnum.RUNNING).update({
+      'stage': stage,
+      'progress': json.dumps(details),
+      'heartbeat_at': now,
+      'updated_at': now
+    }, synchronize_session=False)
+    db.session.commit()
+
+  @classmethod
+  def requeue_stale(cls, lease_seconds: float):
+    """Requeue running jobs whose worker stopped sending heartbeats, or fail them when out of attempts
+
+    Each job is changed by an UPDATE conditional on it still being run by the
+    same worker with an expired lease, so reapers racing each other, or a
+    heartbeat arriving meanwhile, leave it alone.
+
+    Returns:
+      The jobs that were requeued or failed
+    """
+    now = datetime.now()
+    cutoff = now - timedelta(seconds=lease_seconds)
+    stale = cls.query.with_entities(cls.id, cls.worker).filter(
+      cls.status == JobStatusEnum.RUNNING,
+      cls.heartbeat_at < cutoff
+    ).all()
+    reaped = []
+    for job_id, worker in stale:
+      error = f'Worker {worker} stopped responding'
+      lost = cls.query.filter(
+        cls.id == job_id,
+        cls.status == JobStatusEnum.RUNNING,
+        cls.worker == worker,
+        cls.heartbeat_at < cutoff
+      )
+      changed = lost.filter(cls.attempts < cls.max_attempts).update(
+        cls._failure_values(error, now, retry=True), synchronize_session=False)
+      changed = changed or lost.filter(cls.attempts >= cls.max_attempts).update(
+        cls._failure_values(error, now, retry=False), synchronize_session=False)
+      if changed:
+        reaped.append(job_id)
+    db.session.commit()
+    return [cls.get_by_id(job_id) for job_id in reaped]
@@ -1,8 +1,27 @@
-from sqlalchemy import ForeignKey
+import os
+from sqlalchemy import ForeignKey, UniqueConstraint, inspect
+from sqlalchemy.dialects import mysql, sqlite
+from nanoid import generate
 from db import db
 
+# Rows per INSERT statement of bulk_upsert
+METRIC_UPSERT_CHUNK_SIZE = int(os.environ.get('METRIC_UPSERT_CHUNK_SIZE', '500'))
+
+_UPSERT_INSERTS = {'mysql': mysql.insert, 'sqlite': sqlite.insert}
+
+# Engines (by URL) whose metric_repo table is known to have the unique key bulk_upsert needs
+_unique_key_checked = set()
+
+def _has_unique_key(bind):
+  inspector = inspect(bind)
+  keys = [index['column_names'] for index in inspector.get_indexes('metric_repo') if index['unique']]
+  keys += [constraint['column_names'] for constraint in inspector.get_unique_constraints('metric_repo')]
+  return any(sorted(columns) == ['id_metric', 'id_repo'] for columns in keys)
+
 class MetricRepoModel(db.Model):
   __tablename__ = 'metric_repo'
+  # One value per metric of a repository, which bulk_upsert relies on; also serves get_repos_metrics' id_repo lookups
+  __table_args__ = (UniqueConstraint('id_repo', 'id_metric', name='uq_metric_repo_repo_metric'),)
 
   id = db.Column(db.String(10), primary_key=True)
   id_metric = db.Column(db.String(10), ForeignKey('metric.id'))
@@ -19,4 +38,53 @@ class MetricRepoModel(db.Model):
 
   @classmethod
   def get_repos_metrics(cls, ids_list: list):
-    return list(cls.query.filter(MetricRepoModel.id_repo.in_(ids_list)).all())
\ No newline at end of file
+    return list(cls.query.filter(MetricRepoModel.id_repo.in_(ids_list)).all())
+
+
+  @classmethod
+  def bulk_insert(cls, rows):
+    """Insert (id_metric, id_repo, value) rows with one executemany, bypassing the ORM unit of work"""
+    if not rows:
+      return
+    db.session.execute(cls.__table__.insert(), [
+      {'id': generate(size=10), 'id_metric': id_metric, 'id_repo': id_repo, 'value': value}
+      for id_metric, id_repo, value in rows
+    ])
+
+
+  @classmethod
+  def bulk_upsert(cls, rows, chunk_size: int = METRIC_UPSERT_CHUNK_SIZE):
+    """Insert or update (id_repo, id_metric, value) rows, one statement per chunk_size rows
+
+    Uses INSERT ... ON DUPLICATE KEY UPDATE on MySQL and INSERT ... ON CONFLICT
+    DO UPDATE on SQLite, keyed on the (id_repo, id_metric) unique constraint;
+    existing rows keep their id. The caller commits.
+
+    Returns:
+      The number of rows written
+
+    Raises:
+      RuntimeError: If metric_repo lacks the unique key, as on a database created
+        before it and not migrated; the upsert would silently insert duplicates
+    """
+    rows = list(rows)
+    bind = db.session.get_bind()
+    dialect = bind.dialect.name
+    if dialect not in _UPSERT_INSERTS:
+      raise NotImplementedError(f'bulk_upsert does not support {dialect}')
+    if str(bind.url) not in _unique_key_checked:
+      if not _has_unique_key(bind):
+        raise RuntimeError('metric_repo has no unique key on (id_repo, id_metric); run python migrations.py first')
+      _unique_key_checked.add(str(bind.url))
+
+    for start in range(0, len(rows), chunk_size):
+      stmt = _UPSERT_INSERTS[dialect](cls.__table__).values([
+        {'id': generate(size=10), 'id_repo': id_repo, 'id_metric': id_metric, 'value': value}
+        for id_repo, id_metric, value in rows[start:start + chunk_size]
+      ])
+      if dialect == 'mysql':
+        stmt = stmt.on_duplicate_key_update(value=stmt.inserted.value)
+      else:
+        stmt = stmt.on_conflict_do_update(index_elements=['id_repo', 'id_metric'], set_={'value': stmt.excluded.value})
+      db.session.execute(stmt)
+    return len(rows)
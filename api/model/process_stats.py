@@ -0,0 +1,46 @@
+import json
+from datetime import datetime, timedelta
+from db import db
+
+class ProcessStatsModel(db.Model):
+  """Counters one process (the API, a job worker, the scheduler) last published, by kind
+
+  Caches and the token pool count in the memory of the process using them;
+  each process writes its counters here so the admin endpoints can report all
+  of them. updated_at tells a running process from one that stopped.
+  """
+  __tablename__ = 'process_stats'
+
+  process = db.Column(db.String(120), primary_key=True)
+  kind = db.Column(db.String(40), primary_key=True)
+  stats = db.Column(db.Text)
+  updated_at = db.Column(db.DateTime, default=datetime.now)
+
+
+  @classmethod
+  def publish(cls, process, stats_by_kind):
+    """Replace the counters of process with stats_by_kind ({kind: stats}); the caller commits"""
+    cls.query.filter_by(process=process).delete(synchronize_session=False)
+    if not stats_by_kind:
+      return
+    now = datetime.now()
+    db.session.execute(cls.__table__.insert(), [
+      {'process': process, 'kind': kind, 'stats': json.dumps(stats), 'updated_at': now}
+      for kind, stats in stats_by_kind.items()
+    ])
+
+  @classmethod
+  def recent(cls, kind, max_age_seconds):
+    """(process, stats, updated_at) of the processes that published kind within max_age_seconds"""
+    rows = cls.query.filter(
+      cls.kind == kind,
+      cls.updated_at >= datetime.now() - timedelta(seconds=max_age_seconds)
+    ).order_by(cls.process).all()
+    return [(row.process, json.loads(row.stats), row.updated_at) for row in rows]
+
+  @classmethod
+  def prune(cls, max_age_seconds):
+    """Delete the counters of processes that stopped publishing; the caller commits"""
+    cls.query.filter(
+      cls.updated_at < datetime.now() - timedelta(seconds=max_age_seconds)
+    ).delete(synchronize_session=False)
@@ -0,0 +1,42 @@
+from datetime import datetime
+from sqlalchemy import ForeignKey
+from db import db
+
+class RefreshCheckpointModel(db.Model):
+  """Repository whose metrics refresh finished, written with its results so a stopped run can resume"""
+  __tablename__ = 'refresh_checkpoint'
+
+  dataset_id = db.Column(db.String(10), ForeignKey('dataset.id'), primary_key=True)
+  id_repo = db.Column(db.String(100), primary_key=True)
+  outcome = db.Column(db.String(20))
+  message = db.Column(db.Text)
+  updated_at = db.Column(db.DateTime, default=datetime.now)
+
+
+  @classmethod
+  def completed_ids(cls, dataset_id):
+    """Ids of the dataset's repositories refreshed or skipped by the current run; failed ones are retried"""
+    rows = db.session.query(cls.id_repo).filter(
+      cls.dataset_id == dataset_id,
+      cls.outcome != 'failed'
+    ).all()
+    return {id_repo for (id_repo,) in rows}
+
+  @classmethod
+  def clear(cls, dataset_id):
+    cls.query.filter_by(dataset_id=dataset_id).delete(synchronize_session=False)
+
+  @classmethod
+  def record(cls, dataset_id, outcomes):
+    """Add (id_repo, outcome, message) checkpoints, replacing earlier ones of the same repositories; the caller commits"""
+    if not outcomes:
+      return
+    now = datetime.now()
+    cls.query.filter(
+      cls.dataset_id == dataset_id,
+      cls.id_repo.in_([id_repo for id_repo, _, _ in outcomes])
+    ).delete(synchronize_session=False)
+    db.session.execute(cls.__table__.insert(), [
+      {'dataset_id': dataset_id, 'id_repo': id_repo, 'outcome': outcome, 'message': message, 'updated_at': now}
+      for id_repo, outcome, message in outcomes
+    ])
@@ -1,8 +1,15 @@
-from sqlalchemy import ForeignKey
+import json
+from sqlalchemy import ForeignKey, Index, func
 from db import db
 
 class RepositoryModel(db.Model):
   __tablename__ = 'repository'
+  __table_args__ = (
+    # find_repository(_by_name) and the bulk import's existence check
+    Index('ix_repository_dataset_name', 'dataset_id', 'name'),
+    # The refresh scheduler visits the stalest repositories first
+    Index('ix_repository_last_refreshed_at', 'last_refreshed_at'),
+  )
 
   id = db.Column(db.String(100), primary_key=True)
   dataset_id = db.Column(db.String(10), ForeignKey('dataset.id'))
@@ -14,6 +21,11 @@ class RepositoryModel(db.Model):
   open_issues = db.Column(db.Integer)
   contributors = db.Column(db.Integer)
   commits = db.Column(db.Integer)
+  last_commit_sha = db.Column(db.String(40))
+  code_metrics = db.Column(db.Text)
+  # GitHub's last push to the repository and the last time its metrics were collected
+  pushed_at = db.Column(db.DateTime)
+  last_refreshed_at = db.Column(db.DateTime)
 
 
   def __init__(self, id, id_dataset, name, language, loc=0, stars=0, forks=0, open_issues=0, contributors=0, commits=0):
@@ -44,6 +56,19 @@ class RepositoryModel(db.Model):
     }
   
 
+  def get_code_metrics(self):
+    """Return the code-quality snapshot stored with the last analysed commit"""
+    if not self.code_metrics:
+      return None
+    try:
+      return json.loads(self.code_metrics)
+    except ValueError:
+      return None
+
+  def set_code_metrics(self, code_metrics):
+    self.code_metrics = json.dumps(code_metrics) if code_metrics else None
+
+
   @classmethod
   def get_dataset_repos_json(cls, dataset_id: str):
     repositories = cls.query.filter_by(dataset_id=dataset_id)
@@ -87,3 +112,15 @@ class RepositoryModel(db.Model):
   def find_repository_by_name(cls, dataset_id: str, repo_name: str):
     """Find repository by name and return the model instance"""
     return cls.query.filter_by(dataset_id=dataset_id, name=repo_name).first()
+
+  @classmethod
+  def find_existing_names(cls, dataset_id: str, repo_names):
+    """Lower-cased names among repo_names of repositories already in the dataset, in one query"""
+    lowered = list({name.lower() for name in repo_names})
+    if not lowered:
+      return set()
+    rows = db.session.query(cls.name).filter(
+      cls.dataset_id == dataset_id,
+      func.lower(cls.name).in_(lowered)
+    ).all()
+    return {name.lower() for (name,) in rows}
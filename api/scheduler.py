@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Run the refresh scheduler, which keeps repository metrics current by refreshing
+only the repositories whose upstream changed, within an hourly API and CPU budget
+
+Usage:
+    python scheduler.py [--dataset ID] [--once] [--interval SECONDS] [--workers N]
+"""
+
+import argparse
+import logging
+import signal
+import threading
+
+
+def main():
+    """Main function"""
+    from services.refresh_scheduler import (REFRESH_SCHEDULER_INTERVAL_SECONDS, REFRESH_SCHEDULER_WORKERS,
+                                            RefreshScheduler)
+
+    parser = argparse.ArgumentParser(description='Refresh changed repositories within an hourly budget')
+    parser.add_argument('--dataset', help='Only refresh repositories of this dataset')
+    parser.add_argument('--once', action='store_true', help='Run a single pass and exit')
+    parser.add_argument('--interval', type=float, default=REFRESH_SCHEDULER_INTERVAL_SECONDS,
+                        help='Seconds between passes')
+    parser.add_argument('--workers', type=int, default=REFRESH_SCHEDULER_WORKERS,
+                        help='Repositories refreshed at once')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(threadName)s: %(message)s')
+
+    from app import app, create_db
+    from services.github_processor import GitHubProcessor
+    from services.process_stats import process_name, publish, start_stats_publisher
+
+    # The API creates tables on its first request; the scheduler may start first
+    create_db()
+    with app.app_context():
+        if not GitHubProcessor().authenticated:
+            logging.error("The scheduler checks repositories through GitHub GraphQL, which needs GITHUB_TOKEN or GITHUB_TOKENS")
+            return 1
+
+    scheduler = RefreshScheduler(app, dataset_id=args.dataset, workers=args.workers)
+    if args.once:
+        scheduler.run_once()
+        # The admin endpoints of the API report the cache and quota counters of this pass
+        with app.app_context():
+            publish(process_name('scheduler'))
+        return 0
+
+    start_stats_publisher(app, 'scheduler')
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    scheduler.run(stop, args.interval)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
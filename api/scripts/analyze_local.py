@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Analyse local directories, git checkouts or .zip/.tar.gz archives without network access
+
+Prints one JSON object per path (JSON Lines) with the code quality metrics and
+per-stage timings, so a fixed corpus can be profiled or mirrored repositories
+pre-analysed in batch. A large tree can also be split into N shards analysed by
+separate jobs (--shard I/N) whose outputs are combined with --merge.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import logging
+import time
+from services.code_analysis_service import CodeAnalysisService, DEFAULT_SAMPLE_THRESHOLD_FILES, DEFAULT_SAMPLE_SIZE
+from services.metrics_aggregate import MetricsAggregate
+
+# Logs go to stderr so stdout stays machine-readable
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+logger = logging.getLogger(__name__)
+
+
+def analyze(service, path, workers=1):
+    """Analyse one path and return its JSON record"""
+    start = time.perf_counter()
+    try:
+        metrics = service.analyze_path(path, workers)
+        record = {'path': path, 'ok': True, 'metrics': metrics, 'stages': metrics.pop('stages', {})}
+    except Exception as e:
+        logger.error(f"Failed to analyse {path}: {str(e)}")
+        record = {'path': path, 'ok': False, 'error': str(e)}
+    record['seconds'] = time.perf_counter() - start
+    return record
+
+
+def analyze_shard(service, path, shard_index, shard_count):
+    """Analyse one directory shard of a local tree and return its mergeable aggregate"""
+    start = time.perf_counter()
+    try:
+        aggregate = service.analyze_shard(path, shard_index, shard_count)
+        record = {'path': path, 'ok': True, 'shard': [shard_index, shard_count], 'aggregate': aggregate.to_dict()}
+    except Exception as e:
+        logger.error(f"Failed to analyse shard {shard_index}/{shard_count} of {path}: {str(e)}")
+        record = {'path': path, 'ok': False, 'error': str(e)}
+    record['seconds'] = time.perf_counter() - start
+    return record
+
+
+def merge_shards(service, shard_files):
+    """Merge shard records written by --shard runs into final metrics for each path"""
+    aggregates = {}
+    for shard_file in shard_files:
+        with open(shard_file) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if not record.get('ok'):
+                    raise ValueError(f"{shard_file} contains a failed shard of {record.get('path')}")
+                aggregate = MetricsAggregate.from_dict(record['aggregate'])
+                if record['path'] in aggregates:
+                    aggregates[record['path']].merge(aggregate)
+                else:
+                    aggregates[record['path']] = aggregate
+
+    return [
+        {'path': path, 'ok': True, 'metrics': service.finalize_aggregate(aggregate)}
+        for path, aggregate in aggregates.items()
+    ]
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Analyse local source trees or archives and print JSON metrics')
+    parser.add_argument('paths', nargs='+',
+                        help='Directories, git checkouts or .zip/.tar.gz archives (shard record files with --merge)')
+    parser.add_argument('--workers', type=int, default=1, help='Analyse directory shards in this many processes')
+    parser.add_argument('--shard', help='Only analyse shard I of N (as I/N) of each directory and print its aggregate')
+    parser.add_argument('--merge', action='store_true', help='Merge the shard records in the given files into final metrics')
+    parser.add_argument('--sample-threshold', type=int, default=DEFAULT_SAMPLE_THRESHOLD_FILES,
+                        help='Sample repositories with more source files than this (0 disables sampling)')
+    parser.add_argument('--sample-size', type=int, default=DEFAULT_SAMPLE_SIZE, help='Approximate number of files to sample')
+    parser.add_argument('--seed', type=int, help='Random seed for reproducible sampling')
+    parser.add_argument('--measure-memory', action='store_true', help='Report the tracemalloc peak of each analysis')
+    parser.add_argument('--pretty', action='store_true', help='Indent the JSON output')
+    args = parser.parse_args()
+
+    service = CodeAnalysisService(
+        measure_memory=args.measure_memory,
+        sample_threshold_files=args.sample_threshold,
+        sample_size=args.sample_size,
+        sample_seed=args.seed
+    )
+
+    if args.merge:
+        records = merge_shards(service, args.paths)
+    elif args.shard:
+        shard_index, shard_count = (int(part) for part in args.shard.split('/'))
+        records = (analyze_shard(service, path, shard_index, shard_count) for path in args.paths)
+    else:
+        records = (analyze(service, path, args.workers) for path in args.paths)
+
+    failures = 0
+    for record in records:
+        if not record['ok']:
+            failures += 1
+        print(json.dumps(record, indent=2 if args.pretty else None, sort_keys=True), flush=True)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-repository GitHub API latency of bare requests calls against the pooled GitHubClient
+
+A local stub server answers the metadata requests made for each repository.
+It sleeps for --connect-latency on every new connection, emulating the TCP and
+TLS handshakes a keep-alive connection avoids, and for --latency on every
+request. --fail-every makes it answer every Nth request with a 502 to exercise
+the client's retries.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from services.github_client import GitHubClient
+
+# The API calls GitHubProcessor.get_repo_metrics makes for one repository
+REPO_PATHS = (
+    '/repos/{owner}/{repo}',
+    '/repos/{owner}/{repo}/languages',
+    '/repos/{owner}/{repo}/contributors',
+    '/repos/{owner}/{repo}/commits?per_page=1',
+    '/repos/{owner}/{repo}/commits/main'
+)
+
+
+def make_stub_server(connect_latency, latency, fail_every):
+    """Return a keep-alive HTTP/1.1 stub server bound to an ephemeral local port"""
+    counter = {'requests': 0, 'connections': 0}
+    lock = threading.Lock()
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Send each response in one segment, so Nagle and delayed ACKs do not stall keep-alive
+        wbufsize = -1
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            super().setup()
+            with lock:
+                counter['connections'] += 1
+            time.sleep(connect_latency)
+
+        def do_GET(self):
+            with lock:
+                counter['requests'] += 1
+                failing = fail_every and counter['requests'] % fail_every == 0
+            time.sleep(latency)
+            body = json.dumps({} if failing else {'full_name': self.path, 'default_branch': 'main'}).encode('utf-8')
+            self.send_response(502 if failing else 200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    return server, counter
+
+
+def fetch_repo(get, base_url, index):
+    """Make the metadata calls of one repository and return their wall time"""
+    start = time.perf_counter()
+    for path in REPO_PATHS:
+        response = get(base_url + path.format(owner='owner', repo=f'repo{index}'))
+        response.content
+    return time.perf_counter() - start
+
+
+def run(name, get, base_url, repos, concurrency, counter):
+    counter['requests'] = counter['connections'] = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(lambda index: fetch_repo(get, base_url, index), range(repos)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(f"{name:>7}: {repos} repos in {elapsed:.2f}s  "
+          f"per repo mean {statistics.mean(latencies) * 1000:.1f}ms  "
+          f"p50 {latencies[len(latencies) // 2] * 1000:.1f}ms  "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}ms  "
+          f"connections {counter['connections']}  requests {counter['requests']}")
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Compare bare requests calls with the pooled GitHub client')
+    parser.add_argument('--repos', type=int, default=50, help='Number of repositories to fetch metadata for')
+    parser.add_argument('--concurrency', type=int, default=4, help='Repositories fetched in parallel')
+    parser.add_argument('--connect-latency', type=float, default=0.03,
+                        help='Seconds the stub spends on each new connection (handshake emulation)')
+    parser.add_argument('--latency', type=float, default=0.005, help='Seconds the stub spends on each request')
+    parser.add_argument('--fail-every', type=int, default=0, help='Answer every Nth request with a 502')
+    args = parser.parse_args()
+
+    server, counter = make_stub_server(args.connect_latency, args.latency, args.fail_every)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    try:
+        run('bare', lambda url: requests.get(url, timeout=30), base_url, args.repos, args.concurrency, counter)
+        client = GitHubClient(pool_size=args.concurrency, backoff_base=0.01)
+        run('pooled', client.get, base_url, args.repos, args.concurrency, counter)
+    finally:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Check that the hot query paths are served by indexes instead of full table scans
+
+Runs EXPLAIN (EXPLAIN QUERY PLAN on SQLite) for the queries behind clustering,
+repository lookups, user requests and the job queue, as the models build them,
+and reports the plan of each. A path whose plan scans a whole table while an
+index could serve it makes the script exit with 1.
+
+On MySQL the optimizer may still choose a scan for tables of a few rows; run
+it against a database of realistic size, or read the possible_keys column.
+
+The script only reads the database: when migrations are pending it exits with
+2 without checking, as the plans would lack their indexes.
+
+Usage:
+    python scripts/check_query_plans.py [--database-url URL]
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime
+from flask import Flask
+from sqlalchemy import text
+from db import db
+from migrations import pending_migrations
+from model.analysis_request import AnalysisRequestModel
+from model.job import JobModel, JobStatusEnum
+from model.metric_repo import MetricRepoModel
+from model.repository import RepositoryModel
+from dotenv import load_dotenv
+import logging
+
+# Load environment variables
+load_dotenv()
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def mysql_url():
+    db_user = os.environ['DB_USER']
+    db_password = os.environ['DB_PASSWORD']
+    db_host = os.environ['DB_HOST']
+    db_name = os.environ['DB_NAME']
+    return f'mysql+pymysql://{db_user}:{db_password}@{db_host}/{db_name}'
+
+
+def hot_queries():
+    """(name, query) of the hot paths, built the way the models build them"""
+    return [
+        ('MetricRepoModel.get_repos_metrics', MetricRepoModel.query.filter(
+            MetricRepoModel.id_repo.in_(['repo000001', 'repo000002']))),
+        ('RepositoryModel.find_repository', RepositoryModel.query.filter_by(
+            dataset_id='dataset001', name='owner/repo')),
+        ('AnalysisRequestModel.get_requests_by_id_json', AnalysisRequestModel.query.filter_by(
+            email='someone@example.com')),
+        ('JobModel.claim_next', JobModel.query.with_entities(JobModel.id).filter(
+            JobModel.status == JobStatusEnum.QUEUED,
+            JobModel.run_after <= datetime.now()
+        ).order_by(JobModel.created_at)),
+        ('JobModel.find_active_for_request', JobModel.query.filter(
+            JobModel.id_analysis_request == 'request001',
+            JobModel.status.in_([JobStatusEnum.QUEUED, JobStatusEnum.RUNNING]))),
+    ]
+
+
+def explain(query):
+    """(plan lines, full scan) of a query on the current database"""
+    dialect = db.engine.dialect
+    sql = str(query.statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    if dialect.name == 'sqlite':
+        rows = db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}')).mappings().all()
+        lines = [row['detail'] for row in rows]
+        # SEARCH uses an index to find rows; SCAN reads the whole table (or index)
+        return lines, any(line.startswith('SCAN') and 'TEMP B-TREE' not in line for line in lines)
+    rows = db.session.execute(text(f'EXPLAIN {sql}')).mappings().all()
+    lines = [f"table={row['table']} type={row['type']} key={row['key']} possible_keys={row['possible_keys']} "
+             f"rows={row['rows']}" for row in rows]
+    return lines, any(row['type'] == 'ALL' and not row['possible_keys'] for row in rows)
+
+
+def main():
+    """Main function"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Check the query plans of the hot query paths')
+    parser.add_argument('--database-url', help='SQLAlchemy URL of the database (default: the DB_* settings)')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url or mysql_url()
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+    with app.app_context():
+        # Plans are only meaningful once the indexes of the migrations exist
+        pending = pending_migrations(db.engine)
+        if pending:
+            logger.error(f"Schema migrations {pending} are not applied to this database; "
+                         f"run python migrations.py first, then check again")
+            return 2
+
+        full_scans = []
+        for name, query in hot_queries():
+            lines, full_scan = explain(query)
+            print(f"{'FULL SCAN' if full_scan else 'indexed':<10} {name}")
+            for line in lines:
+                print(f"           {line}")
+            if full_scan:
+                full_scans.append(name)
+
+        if full_scans:
+            logger.error(f"Full table scans in: {', '.join(full_scans)}")
+            return 1
+        logger.info("All hot query paths use indexes")
+        return 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Import a list of repositories into a dataset
+
+Sources are files (text with one URL per line, CSV with a repo_url column, or a
+JSON list), '-' for standard input, or repository URLs / owner/repo names.
+The repositories are queued as one import batch for the job workers; with
+--workers the script runs that many workers itself, which only take the jobs
+of this import, waits for the batch and prints the outcome of every
+repository and the throughput.
+
+Usage:
+    python scripts/import_repositories.py DATASET_ID repos.txt [owner/repo ...] [--workers N]
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from db import db
+from migrations import create_schema
+from model.dataset import DatasetModel
+from model.import_batch import ImportBatchModel
+from services.bulk_import import InvalidImport, parse_repo_list, import_repositories, batch_report
+from services.job_queue import start_in_process_workers
+from dotenv import load_dotenv
+import logging
+import time
+
+# Load environment variables
+load_dotenv()
+
+app = Flask(__name__)
+
+# Database settings
+db_user = os.environ['DB_USER']
+db_password = os.environ['DB_PASSWORD']
+db_host = os.environ['DB_HOST']
+db_name = os.environ['DB_NAME']
+app.config['SQLALCHEMY_DATABASE_URI'] = f'mysql+pymysql://{db_user}:{db_password}@{db_host}/{db_name}'
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+db.init_app(app)
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def read_entries(sources):
+    """Repository entries of the files, '-' (standard input) and URLs given on the command line"""
+    entries = []
+    for source in sources:
+        if source == '-':
+            entries.extend(parse_repo_list(sys.stdin.read()))
+        elif os.path.isfile(source):
+            with open(source, encoding='utf-8') as f:
+                entries.extend(parse_repo_list(f.read()))
+        else:
+            entries.append(source)
+    return entries
+
+
+def wait_for_batch(batch_id, poll_seconds):
+    """Log the batch's progress until none of its jobs is queued or running, then return its report"""
+    last_counts = None
+    while True:
+        # End the transaction so the workers' updates become visible
+        db.session.rollback()
+        report = batch_report(ImportBatchModel.get_by_id(batch_id))
+        counts = report['summary']['counts']
+        if counts != last_counts:
+            logger.info(f"Import {batch_id}: " + ', '.join(f"{count} {outcome}" for outcome, count in sorted(counts.items())))
+            last_counts = counts
+        if report['finished']:
+            return report
+        time.sleep(poll_seconds)
+
+
+def print_report(report):
+    for repository in report['repositories']:
+        detail = repository.get('error') or repository.get('reason') or repository.get('repository_id') or ''
+        print(f"{repository['outcome']:<10} {repository['repo_url']} {detail}")
+    summary = report['summary']
+    throughput = report['throughput']
+    print(f"\n{summary['entries']} entries: {summary['queued']} queued, {summary['skipped']} skipped")
+    print(', '.join(f"{count} {outcome}" for outcome, count in sorted(summary['counts'].items())))
+    if throughput['elapsed_seconds'] is not None:
+        print(f"{throughput['elapsed_seconds']}s elapsed, {throughput['repos_per_minute']} repositories per minute")
+
+
+def main():
+    """Main function"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Import a list of repositories into a dataset')
+    parser.add_argument('dataset_id', help='Dataset ID to import into')
+    parser.add_argument('sources', nargs='+', help="Files with repository URLs, '-' for stdin, or repository URLs")
+    parser.add_argument('--submitter', default='bulk import', help='Submitter name recorded on the analysis requests')
+    parser.add_argument('--email', default='bulk-import@users.noreply.github.com', help='Submitter email recorded on the analysis requests')
+    parser.add_argument('--author', help='Author recorded on the import batch')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Run N job workers for this import in this process and wait for it (JOB_BATCH_CONCURRENCY still caps the batch)')
+    parser.add_argument('--wait', action='store_true', help='Wait for the import to finish on the external workers')
+    parser.add_argument('--poll', type=float, default=5.0, help='Seconds between progress checks while waiting')
+
+    args = parser.parse_args()
+
+    with app.app_context():
+        # The schema may be newer than the API's last start
+        create_schema()
+
+        if not DatasetModel.find_dataset(args.dataset_id):
+            logger.error(f"Dataset {args.dataset_id} not found")
+            return 1
+
+        try:
+            batch = import_repositories(args.dataset_id, read_entries(args.sources), args.submitter, args.email, args.author)
+        except InvalidImport as e:
+            logger.error(str(e))
+            return 1
+        report = batch_report(batch)
+        logger.info(f"Import {batch.id}: {report['summary']['queued']} repositories queued, "
+                    f"{report['summary']['skipped']} skipped")
+
+        if args.workers > 0:
+            stop = start_in_process_workers(app, args.workers, id_import_batch=batch.id)
+            report = wait_for_batch(batch.id, args.poll)
+            stop.set()
+        elif args.wait:
+            report = wait_for_batch(batch.id, args.poll)
+
+        print_report(report)
+        return 0 if not report['summary']['counts'].get('failed') else 2
+
+if __name__ == "__main__":
+    exit(main())
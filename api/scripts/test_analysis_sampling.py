@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Test the stratified sampling of very large repositories
+
+Checks that StratifiedSample allocates exactly the requested number of files,
+also with many strata too small for a file of their own, and that a sampled
+analysis never skips sampled files for max_files.
+
+Usage:
+    python scripts/test_analysis_sampling.py
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tempfile
+from services.analysis_sampling import POOLED_STRATUM, StratifiedSample, allocate, file_values
+from services.code_analysis_service import CodeAnalysisService
+
+
+def test_allocation_adds_up():
+    quotas = allocate({'a': 500, 'b': 300, 'c': 150, 'd': 50}, 37)
+    assert sum(quotas.values()) == 37, quotas
+    assert quotas['a'] > quotas['b'] > quotas['c'] >= quotas['d'] >= 1, quotas
+
+
+def test_many_tiny_strata():
+    # 300 strata of one file next to one of 1000: each tiny stratum would round up to a file of its own
+    files = [(('Python', f'dir{index}'), f'dir{index}/module.py') for index in range(300)]
+    files += [(('Python', 'src'), f'src/module{index}.py') for index in range(1000)]
+    sample = StratifiedSample(files, 50, seed=1)
+
+    assert len(sample.selected) == 50, len(sample.selected)
+    assert POOLED_STRATUM in sample.strata
+    assert sum(stratum.population for stratum in sample.strata.values()) == len(files)
+
+    # Every file of a stratum holding the same values: the estimate is exact
+    for stratum, _ in sample.selected:
+        sample.record(stratum, file_values({'lines': 10}, None, 100))
+    totals, _ = sample.extrapolate()
+    assert round(totals['total_files']) == len(files), totals['total_files']
+    assert round(totals['total_lines']) == 10 * len(files), totals['total_lines']
+
+
+def test_sampled_analysis_respects_max_files():
+    with tempfile.TemporaryDirectory() as directory:
+        for index in range(120):
+            path = os.path.join(directory, f'dir{index}')
+            os.makedirs(path)
+            with open(os.path.join(path, 'module.py'), 'w') as f:
+                f.write("def f(x):\n    return x\n")
+        service = CodeAnalysisService(sample_threshold_files=50, sample_size=30, max_files=20, sample_seed=1)
+        metrics = service._analyze_codebase(directory)
+
+        assert metrics['sample_size'] == 20, metrics['sample_size']
+        assert 'max_files' not in metrics['skipped_by_reason'], metrics['skipped_by_reason']
+        assert metrics['total_files'] == 120, metrics['total_files']
+
+
+def main():
+    """Main function"""
+    test_allocation_adds_up()
+    test_many_tiny_strata()
+    test_sampled_analysis_respects_max_files()
+    print("✅ Samples hold exactly the requested number of files")
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Test that job event streams share one poll of the job table
+
+Subscribes several streams to two jobs of a temporary SQLite database and
+checks that one poll loads both jobs in a single query, that each stream gets
+only the changes of its own job, and that a deleted job ends its streams.
+
+Usage:
+    python scripts/test_job_events.py
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import queue
+import tempfile
+from flask import Flask
+from sqlalchemy import event
+from db import db
+from migrations import create_schema
+from model.job import JobModel, JobStatusEnum
+from services.job_events import JobEventHub
+
+
+def make_app(database_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        create_schema()
+        db.session.add(JobModel('job0000001', 'add_repository', {}))
+        db.session.add(JobModel('job0000002', 'add_repository', {}))
+        db.session.commit()
+    return app
+
+
+def drain(subscriber):
+    states = []
+    while True:
+        try:
+            states.append(subscriber.get_nowait())
+        except queue.Empty:
+            return states
+
+
+def test_one_query_per_poll():
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(os.path.join(directory, 'jobs.db'))
+        # The hub's own thread sleeps for the whole test; polls are driven here
+        hub = JobEventHub(app, interval=3600)
+        first = [hub.subscribe('job0000001') for _ in range(3)]
+        second = hub.subscribe('job0000002')
+
+        with app.app_context():
+            queries = []
+            event.listen(db.engine, 'before_cursor_execute', lambda *args: queries.append(args[2]))
+            hub.poll()
+            assert len(queries) == 1, queries
+            assert all([state['status'] for state in drain(subscriber)] == ['QUEUED'] for subscriber in first + [second])
+
+            # Only the job that changed is handed out, to its own streams
+            JobModel.query.filter_by(id='job0000001').update({'status': JobStatusEnum.RUNNING, 'stage': 'analysing'})
+            db.session.commit()
+            hub.poll()
+            assert all([state['stage'] for state in drain(subscriber)] == ['analysing'] for subscriber in first)
+            assert drain(second) == []
+
+            # An unsubscribed stream gets nothing more; a deleted job ends the others
+            hub.unsubscribe('job0000001', first[0])
+            JobModel.query.filter_by(id='job0000001').delete()
+            db.session.commit()
+            hub.poll()
+            assert drain(first[0]) == []
+            assert all(drain(subscriber) == [None] for subscriber in first[1:])
+            db.session.remove()
+
+
+def main():
+    """Main function"""
+    test_one_query_per_poll()
+    print("✅ Job event streams share one query per poll")
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
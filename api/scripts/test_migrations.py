@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test the metric_repo unique key migration on a database with duplicate rows
+
+Builds a temporary SQLite database whose metric_repo table predates the
+unique (id_repo, id_metric) key and holds duplicates, then checks that the
+migration removes only rows repeating another row's value, refuses (and
+rolls back) while duplicates disagree, and applies once they are resolved.
+
+Usage:
+    python scripts/test_migrations.py
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tempfile
+from flask import Flask
+from sqlalchemy import inspect, text
+from db import db
+from migrations import MigrationError, applied_versions, create_schema
+
+# (id, id_repo, id_metric, value) of a metric_repo table filled before the unique key
+LEGACY_ROWS = [
+    ('row0000001', 'repo000001', 'metric0001', 10.0),
+    ('row0000002', 'repo000001', 'metric0001', 10.0),
+    ('row0000003', 'repo000001', 'metric0001', 10.0),
+    ('row0000004', 'repo000001', 'metric0002', 1.5),
+    ('row0000005', 'repo000002', 'metric0001', 7.0),
+    ('row0000006', 'repo000002', 'metric0001', 8.0),
+]
+
+
+def make_app(database_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context(), db.engine.begin() as conn:
+        conn.execute(text("CREATE TABLE metric_repo (id VARCHAR(10) PRIMARY KEY, id_metric VARCHAR(10), "
+                          "id_repo VARCHAR(10), value FLOAT)"))
+        for id, id_repo, id_metric, value in LEGACY_ROWS:
+            conn.execute(text("INSERT INTO metric_repo (id, id_repo, id_metric, value) VALUES (:id, :id_repo, :id_metric, :value)"),
+                         {'id': id, 'id_repo': id_repo, 'id_metric': id_metric, 'value': value})
+    return app
+
+
+def metric_repo_rows():
+    with db.engine.connect() as conn:
+        return sorted(tuple(row) for row in conn.execute(text("SELECT id, id_repo, id_metric, value FROM metric_repo")))
+
+
+def has_unique_key():
+    return any(index['unique'] and index['column_names'] == ['id_repo', 'id_metric']
+               for index in inspect(db.engine).get_indexes('metric_repo'))
+
+
+def test_metric_repo_duplicates():
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(os.path.join(directory, 'legacy.db'))
+        with app.app_context():
+            # Conflicting values: nothing is deleted and the key is not created
+            try:
+                create_schema()
+                raise AssertionError('migration applied despite conflicting duplicates')
+            except MigrationError as e:
+                assert 'repository repo000002 metric metric0001: id row0000005 = 7.0, id row0000006 = 8.0' in str(e), str(e)
+                assert 'repo000001' not in str(e), str(e)
+            assert metric_repo_rows() == sorted(LEGACY_ROWS)
+            assert 3 not in applied_versions(db.engine)
+            assert not has_unique_key()
+
+            # Once a person removes the stale row, repeated values collapse to one row and the key is created
+            with db.engine.begin() as conn:
+                conn.execute(text("DELETE FROM metric_repo WHERE id = 'row0000005'"))
+            create_schema()
+            assert metric_repo_rows() == [
+                ('row0000001', 'repo000001', 'metric0001', 10.0),
+                ('row0000004', 'repo000001', 'metric0002', 1.5),
+                ('row0000006', 'repo000002', 'metric0001', 8.0),
+            ], metric_repo_rows()
+            assert 3 in applied_versions(db.engine)
+            assert has_unique_key()
+            db.session.remove()
+
+
+def main():
+    """Main function"""
+    test_metric_repo_duplicates()
+    print("✅ The metric_repo migration keeps every distinct value until duplicates are resolved")
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Test that the cache and quota counters of every process reach the admin endpoints
+
+Publishes the counters of two worker processes to a temporary SQLite database,
+one of them long stopped, and checks that combined_stats adds the running
+worker's counters to those of the calling process, recomputes the hit rate,
+keeps the latest quota seen for each token, and leaves the stopped one out.
+
+Usage:
+    python scripts/test_process_stats.py
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tempfile
+from datetime import datetime, timedelta
+from flask import Flask
+from db import db
+from migrations import create_schema
+from model.process_stats import ProcessStatsModel
+from services.process_stats import ARCHIVE_CACHE, RATE_LIMIT, combined_stats
+
+
+def make_app(database_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        create_schema()
+    return app
+
+
+def quota(remaining, reset_at):
+    return {'token': '...abcd', 'quotas': {'core': {'limit': 5000, 'remaining': remaining, 'reset_at': reset_at}}}
+
+
+def test_counters_of_running_processes_are_summed():
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(os.path.join(directory, 'stats.db'))
+        with app.app_context():
+            ProcessStatsModel.publish('worker@host:1', {
+                ARCHIVE_CACHE: {'hits': 6, 'misses': 2, 'evictions': 1, 'bytes': 10},
+                RATE_LIMIT: {'requests': 40, 'paced_seconds': 1.5, 'reset_waits': 0, 'tokens': [quota(4000, 2000.0)]}
+            })
+            ProcessStatsModel.publish('worker@host:2', {ARCHIVE_CACHE: {'hits': 100, 'misses': 0, 'evictions': 0}})
+            ProcessStatsModel.query.filter_by(process='worker@host:2').update(
+                {'updated_at': datetime.now() - timedelta(days=1)})
+            db.session.commit()
+
+            archive = combined_stats(ARCHIVE_CACHE, {'hits': 0, 'misses': 2, 'evictions': 0, 'bytes': 99})
+            assert (archive['hits'], archive['misses'], archive['evictions']) == (6, 4, 1), archive
+            assert archive['hit_rate'] == 0.6, archive
+            # Disk usage is the calling process's view
+            assert archive['bytes'] == 99, archive
+            assert [process['process'].split('@')[0] for process in archive['processes']] == ['api', 'worker'], archive
+
+            # The quota of a token is the latest window's lowest remaining, whichever process saw it
+            limits = combined_stats(RATE_LIMIT, {'requests': 2, 'paced_seconds': 0.25, 'reset_waits': 1,
+                                                 'tokens': [quota(4990, 1000.0)]})
+            assert (limits['requests'], limits['paced_seconds'], limits['reset_waits']) == (42, 1.75, 1), limits
+            assert limits['tokens'] == [quota(4000, 2000.0)], limits['tokens']
+            db.session.remove()
+
+
+def main():
+    """Main function"""
+    test_counters_of_running_processes_are_summed()
+    print("✅ The admin counters add up over the running processes")
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
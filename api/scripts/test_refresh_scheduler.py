@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Test that a scheduled refresh pass survives a repository whose refresh fails
+
+Runs one RefreshScheduler pass over a temporary SQLite database with a stub
+processor instead of GitHub: the refresh of one repository raises, and the
+other repositories of the pass must still be refreshed and saved. A second
+pass checks repositories one per batch while the check of one batch raises,
+and the other batches must still be checked and refreshed.
+
+Usage:
+    python scripts/test_refresh_scheduler.py
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tempfile
+from flask import Flask
+from db import db
+from migrations import create_schema
+from model.dataset import DatasetModel
+from model.metric import MetricModel
+from model.metric_category import MetricCategory
+from model.metric_repo import MetricRepoModel
+from model.repository import RepositoryModel
+import services.refresh_scheduler as refresh_scheduler
+from services.refresh_scheduler import RefreshBudget, RefreshScheduler
+
+BROKEN = 'owner/broken'
+NAMES = ['owner/first', BROKEN, 'owner/second']
+
+
+class StubProcessor:
+    """Upstream metadata and metrics of NAMES; refreshing BROKEN raises"""
+
+    def fetch_metadata_batch(self, repos, timer=None):
+        return {f"{owner}/{name}".lower(): {'head_sha': 'b' * 40, 'pushed_at': '2026-01-02T00:00:00Z'}
+                for owner, name in repos}
+
+    def get_repo_metrics(self, owner, name, last_commit_sha=None, cached_code_metrics=None, metadata=None):
+        if f"{owner}/{name}" == BROKEN:
+            raise RuntimeError('archive download failed')
+        return {
+            'language': 'Python', 'loc': 100, 'stars': 10, 'forks': 1, 'open_issues': 0,
+            'contributors': 2, 'commits': 30, 'pushed_at': '2026-01-02T00:00:00Z',
+            'commit_sha': 'b' * 40, 'code_metrics': None, 'stages': {'metadata': {'seconds': 0.1, 'requests': 3}}
+        }
+
+
+class FailingCheckProcessor(StubProcessor):
+    """StubProcessor whose metadata query fails for any batch holding BROKEN"""
+
+    def fetch_metadata_batch(self, repos, timer=None):
+        if BROKEN in (f"{owner}/{name}" for owner, name in repos):
+            raise RuntimeError('GraphQL error RATE_LIMITED')
+        return super().fetch_metadata_batch(repos, timer)
+
+
+def make_app(database_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        create_schema()
+        db.session.add(MetricCategory('category01', 'Popularity', 'Popularity'))
+        db.session.add(MetricModel('metric0001', 'Stars', 'Stars', True, 'category01'))
+        db.session.add(DatasetModel('dataset001', 'Dataset', 'Dataset', len(NAMES), 'test'))
+        for index, name in enumerate(NAMES):
+            db.session.add(RepositoryModel(f'repo{index:06d}', 'dataset001', name, 'Python'))
+        db.session.commit()
+    return app
+
+
+def test_failed_refresh_does_not_abort_the_pass():
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(os.path.join(directory, 'scheduler.db'))
+        scheduler = RefreshScheduler(app, budget=RefreshBudget(api_per_hour=0, cpu_seconds_per_hour=0),
+                                     workers=2, processor_factory=StubProcessor)
+
+        counts = scheduler.run_once()
+
+        assert counts['failed'] == 1, counts
+        assert counts['refreshed'] == len(NAMES) - 1, counts
+        with app.app_context():
+            for repo in RepositoryModel.query.all():
+                refreshed = repo.name != BROKEN
+                assert (repo.last_refreshed_at is not None) == refreshed, repo.name
+                assert (MetricRepoModel.query.filter_by(id_repo=repo.id).count() == 1) == refreshed, repo.name
+            db.session.remove()
+
+
+def test_failed_check_does_not_abort_the_pass():
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(os.path.join(directory, 'scheduler.db'))
+        scheduler = RefreshScheduler(app, budget=RefreshBudget(api_per_hour=0, cpu_seconds_per_hour=0),
+                                     workers=2, processor_factory=FailingCheckProcessor)
+
+        batch_size = refresh_scheduler.GRAPHQL_BATCH_SIZE
+        refresh_scheduler.GRAPHQL_BATCH_SIZE = 1
+        try:
+            counts = scheduler.run_once()
+        finally:
+            refresh_scheduler.GRAPHQL_BATCH_SIZE = batch_size
+
+        assert counts['unchecked'] == 1, counts
+        assert counts['refreshed'] == len(NAMES) - 1, counts
+        with app.app_context():
+            for repo in RepositoryModel.query.all():
+                checked = repo.name != BROKEN
+                assert (repo.pushed_at is not None) == checked, repo.name
+                assert (repo.last_refreshed_at is not None) == checked, repo.name
+            db.session.remove()
+
+
+def main():
+    """Main function"""
+    test_failed_refresh_does_not_abort_the_pass()
+    test_failed_check_does_not_abort_the_pass()
+    print("✅ A failed check or refresh leaves the rest of the pass to finish")
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
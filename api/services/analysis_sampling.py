@@ -0,0 +1,190 @@
+import math
+import random
+from collections import Counter, defaultdict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+# Two-sided 95% normal quantile used for the confidence intervals
+Z_95 = 1.96
+
+# Additive metrics that are extrapolated from the sample, with the intervals reported for them
+EXTRAPOLATED_FIELDS = (
+    'total_files',
+    'total_lines',
+    'cyclomatic_complexity',
+    'technical_debt',
+    'code_smells',
+    'function_count',
+    'class_count',
+    'comment_lines',
+    'function_length_sum',
+    'function_length_count',
+    'skipped_files',
+    'skipped_bytes',
+    'source_files',
+    'test_files'
+)
+# Stratum of the files of strata too small to be sampled on their own
+POOLED_STRATUM = ('pooled',)
+
+# Per-reason skip counts are recorded as '<prefix><reason>' fields and extrapolated like the others
+_SKIPPED_PREFIX = 'skipped:'
+REPORTED_INTERVALS = (
+    'total_files',
+    'total_lines',
+    'cyclomatic_complexity',
+    'technical_debt',
+    'code_smells',
+    'function_count',
+    'class_count'
+)
+
+
+def file_values(file_metric: Optional[Dict], skip_reason: Optional[str], file_size: int,
+                is_test: bool = False) -> Dict:
+    """Per-file contribution to each additive metric; skipped or failed files only count as source files"""
+    values = {'source_files': 1, 'test_files': 1 if is_test else 0}
+    if skip_reason:
+        values.update({'skipped_files': 1, 'skipped_bytes': file_size, _SKIPPED_PREFIX + skip_reason: 1})
+        return values
+    if not file_metric:
+        return values
+    functions = file_metric.get('functions', [])
+    values.update({
+        'total_files': 1,
+        'total_lines': file_metric.get('lines', 0),
+        'cyclomatic_complexity': file_metric.get('complexity', 0),
+        'technical_debt': file_metric.get('debt_score', 0),
+        'code_smells': file_metric.get('code_smells', 0),
+        'function_count': file_metric.get('function_count', 0),
+        'class_count': file_metric.get('class_count', 0),
+        'comment_lines': file_metric.get('comment_lines', 0),
+        'function_length_sum': sum(f.get('length', 0) for f in functions),
+        'function_length_count': len(functions)
+    })
+    return values
+
+
+class _Stratum:
+    def __init__(self, population: int):
+        self.population = population
+        self.sampled = 0
+        self.sums = Counter()
+        self.squares = Counter()
+
+    def record(self, values: Dict):
+        self.sampled += 1
+        for field, value in values.items():
+            self.sums[field] += value
+            self.squares[field] += value * value
+
+    def estimate(self, field: str) -> Tuple[float, float]:
+        """Estimated stratum total and its variance for one field"""
+        if not self.sampled:
+            return 0.0, 0.0
+        mean = self.sums[field] / self.sampled
+        total = self.population * mean
+        if self.sampled < 2 or self.sampled >= self.population:
+            return total, 0.0
+        sample_variance = (self.squares[field] - self.sampled * mean * mean) / (self.sampled - 1)
+        finite_population = 1 - self.sampled / self.population
+        variance = self.population ** 2 * finite_population * max(sample_variance, 0.0) / self.sampled
+        return total, variance
+
+
+def allocate(sizes: Dict[Hashable, int], sample_size: int) -> Dict[Hashable, int]:
+    """Files to sample per stratum, in proportion to its size and adding up to exactly sample_size
+
+    Every stratum gets at least one file, so sizes must hold no more strata
+    than sample_size; the rest is shared by largest remainder.
+    """
+    population = sum(sizes.values())
+    ideal = {stratum: sample_size * size / population for stratum, size in sizes.items()}
+    quotas = {stratum: max(1, math.floor(share)) for stratum, share in ideal.items()}
+    by_remainder = sorted(sizes, key=lambda stratum: (quotas[stratum] - ideal[stratum], str(stratum)))
+    for stratum in by_remainder[:sample_size - sum(quotas.values())]:
+        quotas[stratum] += 1
+    return quotas
+
+
+class StratifiedSample:
+    """Stratified random sample of source files with extrapolation of additive metrics
+
+    The sample is allocated to strata in proportion to their size (at least one
+    file each, see allocate) and totals are estimated with the stratified
+    estimator sum(N_h * mean_h), with normal-approximation 95% confidence
+    intervals. Strata too small for a file of their own are pooled into
+    POOLED_STRATUM, so the sample holds exactly sample_size files.
+    """
+
+    def __init__(self, files: List[Tuple[Hashable, object]], sample_size: int, seed: Optional[int] = None):
+        members = defaultdict(list)
+        for stratum, item in files:
+            members[stratum].append(item)
+
+        rng = random.Random(seed)
+        self.population = len(files)
+        sample_size = min(sample_size, self.population)
+        # A stratum whose proportional share is below one file joins the pool
+        small = [stratum for stratum, items in members.items()
+                 if sample_size * len(items) < self.population] if sample_size else []
+        if len(small) > 1:
+            pooled = members[POOLED_STRATUM]
+            for stratum in small:
+                pooled.extend(members.pop(stratum))
+
+        quotas = allocate({stratum: len(items) for stratum, items in members.items()}, sample_size) if sample_size else {}
+        self.strata = {}
+        self.selected = []
+        for stratum in sorted(members, key=str):
+            items = members[stratum]
+            self.strata[stratum] = _Stratum(len(items))
+            self.selected.extend((stratum, item) for item in rng.sample(items, quotas.get(stratum, 0)))
+
+    @property
+    def sample_fraction(self) -> float:
+        return len(self.selected) / self.population if self.population else 1.0
+
+    def record(self, stratum: Hashable, values: Dict):
+        """Record the file_values() of one analysed sample file"""
+        self.strata[stratum].record(values)
+
+    def extrapolate(self) -> Tuple[Dict, Dict]:
+        """Return estimated totals and 95% confidence intervals for the additive metrics"""
+        totals = {}
+        intervals = {}
+        reasons = sorted({field for stratum in self.strata.values() for field in stratum.sums
+                          if field.startswith(_SKIPPED_PREFIX)})
+        for field in EXTRAPOLATED_FIELDS + tuple(reasons):
+            total = 0.0
+            variance = 0.0
+            for stratum in self.strata.values():
+                stratum_total, stratum_variance = stratum.estimate(field)
+                total += stratum_total
+                variance += stratum_variance
+            totals[field] = total
+            margin = Z_95 * math.sqrt(variance)
+            intervals[field] = [max(0.0, total - margin), total + margin]
+        return totals, {field: intervals[field] for field in REPORTED_INTERVALS}
+
+    def apply(self, metrics: Dict) -> Dict:
+        """Replace additive metrics computed on the sample with whole-repository estimates"""
+        totals, intervals = self.extrapolate()
+        for field in REPORTED_INTERVALS:
+            metrics[field] = round(totals[field])
+        metrics['skipped_files'] = round(totals['skipped_files'])
+        metrics['skipped_bytes'] = round(totals['skipped_bytes'])
+        metrics['skipped_by_reason'] = {
+            field[len(_SKIPPED_PREFIX):]: round(total) for field, total in totals.items()
+            if field.startswith(_SKIPPED_PREFIX) and round(total)
+        }
+        metrics['source_files'] = round(totals['source_files'])
+        metrics['test_files'] = round(totals['test_files'])
+        metrics['comment_ratio'] = (totals['comment_lines'] / totals['total_lines']) * 100 if totals['total_lines'] > 0 else 0
+        if totals['function_length_count']:
+            metrics['avg_function_length'] = totals['function_length_sum'] / totals['function_length_count']
+        metrics['sampled'] = True
+        metrics['sample_fraction'] = self.sample_fraction
+        metrics['sample_size'] = len(self.selected)
+        metrics['population_files'] = self.population
+        metrics['confidence_intervals'] = intervals
+        return metrics
@@ -0,0 +1,82 @@
+"""
+Registry of language analyser plugins, keyed by file extension
+
+Plugins are registered by module path and class name together with their cost
+class, and are only imported (and their patterns compiled) the first time a
+file with one of their extensions is analysed. Extensions and cost classes are
+known without loading anything, so the file walk and the work scheduler do not
+pay for languages a repository does not contain.
+"""
+
+import importlib
+import threading
+from typing import Dict, FrozenSet, NamedTuple, Tuple
+
+# Cost classes and the relative analysis time per byte used to balance parallel work
+COST_LIGHT = 'light'
+COST_HEAVY = 'heavy'
+COST_WEIGHTS = {
+    COST_LIGHT: 1,
+    COST_HEAVY: 2
+}
+
+
+class AnalyzerRegistration(NamedTuple):
+    module: str
+    class_name: str
+    cost: str
+
+
+_registry: Dict[str, AnalyzerRegistration] = {}
+_loaded = {}
+_lock = threading.Lock()
+
+
+def register(extensions: Tuple[str, ...], module: str, class_name: str, cost: str = COST_LIGHT):
+    """Register an analyser class, imported lazily from module, for the given extensions"""
+    if cost not in COST_WEIGHTS:
+        raise ValueError(f"Unknown analyser cost class: {cost}")
+    registration = AnalyzerRegistration(module, class_name, cost)
+    with _lock:
+        for extension in extensions:
+            _registry[extension.lower()] = registration
+
+
+def supported_extensions() -> FrozenSet[str]:
+    return frozenset(_registry)
+
+
+def cost_weight(extension: str) -> int:
+    """Relative cost per byte of analysing a file with this extension"""
+    registration = _registry.get(extension)
+    return COST_WEIGHTS[registration.cost] if registration else COST_WEIGHTS[COST_LIGHT]
+
+
+def get_analyzer(extension: str):
+    """Return the shared analyser instance for an extension, loading its plugin on first use
+
+    Raises:
+        KeyError: If no analyser is registered for the extension
+    """
+    registration = _registry[extension]
+    analyzer = _loaded.get(registration)
+    if analyzer is None:
+        with _lock:
+            analyzer = _loaded.get(registration)
+            if analyzer is None:
+                module = importlib.import_module(registration.module)
+                analyzer = getattr(module, registration.class_name)()
+                _loaded[registration] = analyzer
+    return analyzer
+
+
+# Built-in analysers
+register(('.py',), 'services.analyzers.python', 'PythonAnalyzer', COST_HEAVY)
+register(('.js', '.ts'), 'services.analyzers.javascript', 'JavaScriptAnalyzer')
+register(('.java', '.cs'), 'services.analyzers.java', 'JavaAnalyzer')
+register(('.c', '.cpp'), 'services.analyzers.c', 'CAnalyzer')
+register(('.go',), 'services.analyzers.go', 'GoAnalyzer')
+register(('.rs',), 'services.analyzers.rust', 'RustAnalyzer')
+register(('.kt', '.kts'), 'services.analyzers.kotlin', 'KotlinAnalyzer')
+register(('.rb',), 'services.analyzers.ruby', 'RubyAnalyzer')
+register(('.php',), 'services.analyzers.php', 'PHPAnalyzer')
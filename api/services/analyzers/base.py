@@ -0,0 +1,86 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+_DEBT_RE = re.compile(r'TODO|FIXME|HACK|XXX|BUG', re.IGNORECASE)
+
+# Lines longer than this count as a code smell
+LONG_LINE_LENGTH = 120
+
+
+def calculate_technical_debt(content: str) -> int:
+    """Calculate technical debt score based on TODO/FIXME comments"""
+    return len(_DEBT_RE.findall(content))
+
+
+def extract_code_blocks(content: str) -> List[str]:
+    """Extract blocks of 5+ consecutive non-empty, non-comment lines for duplication analysis"""
+    blocks = []
+    current_block = []
+    for line in content.splitlines():
+        line = line.strip()
+        if line and not line.startswith('#') and not line.startswith('//'):
+            current_block.append(line)
+        else:
+            if len(current_block) >= 5:
+                blocks.append('\n'.join(current_block))
+            current_block = []
+
+    if len(current_block) >= 5:
+        blocks.append('\n'.join(current_block))
+
+    return blocks
+
+
+class RegexAnalyzer:
+    """Simplified pattern-based analyser, configured by class attributes
+
+    Subclasses list their patterns as strings; they are compiled once when the
+    analyser is instantiated by the registry, and the instance is shared.
+    """
+
+    language = ''
+    # Each pattern's matches count as comment lines
+    comment_patterns: Tuple[str, ...] = (r'//.*', r'(?s)/\*.*?\*/')
+    # Each pattern's matches count as functions
+    function_patterns: Tuple[str, ...] = ()
+    class_pattern: Optional[str] = None
+    # Keywords whose occurrences estimate cyclomatic complexity
+    complexity_keywords: Tuple[str, ...] = ()
+    # Per-line smell patterns; None disables smell detection (including long lines)
+    smell_patterns: Optional[Tuple[str, ...]] = None
+
+    def __init__(self):
+        self._comment_res = [re.compile(pattern) for pattern in self.comment_patterns]
+        self._function_res = [re.compile(pattern) for pattern in self.function_patterns]
+        self._class_re = re.compile(self.class_pattern) if self.class_pattern else None
+        self._complexity_re = (re.compile(r'\b(?:' + '|'.join(self.complexity_keywords) + r')\b')
+                               if self.complexity_keywords else None)
+        self._smell_res = [re.compile(pattern) for pattern in self.smell_patterns or ()]
+
+    def analyze(self, content: str) -> Dict:
+        """Return the file metrics of one source file's content"""
+        return {
+            'lines': len(content.splitlines()),
+            'complexity': len(self._complexity_re.findall(content)) if self._complexity_re else 0,
+            'function_count': sum(len(pattern.findall(content)) for pattern in self._function_res),
+            'class_count': len(self._class_re.findall(content)) if self._class_re else 0,
+            'comment_lines': sum(len(pattern.findall(content)) for pattern in self._comment_res),
+            'debt_score': calculate_technical_debt(content),
+            'code_smells': self.detect_code_smells(content),
+            'functions': [],
+            'code_blocks': extract_code_blocks(content)
+        }
+
+    def detect_code_smells(self, content: str) -> int:
+        """Count long lines and lines matching one of the smell patterns"""
+        if self.smell_patterns is None:
+            return 0
+        smells = 0
+        for line in content.splitlines():
+            line = line.strip()
+            if len(line) > LONG_LINE_LENGTH:
+                smells += 1
+            for pattern in self._smell_res:
+                if pattern.search(line):
+                    smells += 1
+        return smells
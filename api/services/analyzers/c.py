@@ -0,0 +1,9 @@
+from services.analyzers.base import RegexAnalyzer
+
+
+class CAnalyzer(RegexAnalyzer):
+    """C and C++ (simplified analysis)"""
+
+    language = 'C/C++'
+    function_patterns = (r'\w+\s+\w+\s*\([^)]*\)\s*{',)
+    complexity_keywords = ('if', 'else', 'for', 'while', 'switch', 'goto')
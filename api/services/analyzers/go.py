@@ -0,0 +1,11 @@
+from services.analyzers.base import RegexAnalyzer
+
+
+class GoAnalyzer(RegexAnalyzer):
+    """Go (simplified analysis)"""
+
+    language = 'Go'
+    function_patterns = (r'func\s+\w+\s*\(',)
+    # Structs are Go's equivalent to classes
+    class_pattern = r'type\s+\w+\s+struct'
+    complexity_keywords = ('if', 'else', 'for', 'switch', 'select', 'go')
@@ -0,0 +1,11 @@
+from services.analyzers.base import RegexAnalyzer
+
+
+class JavaAnalyzer(RegexAnalyzer):
+    """Java, and C# with its similar syntax (simplified analysis)"""
+
+    language = 'Java'
+    function_patterns = (r'(public|private|protected)?\s*(static)?\s*\w+\s+\w+\s*\(',)
+    class_pattern = r'class\s+\w+'
+    complexity_keywords = ('if', 'else', 'for', 'while', 'switch', 'catch', 'try')
+    smell_patterns = (r'System\.out\.println',)
@@ -0,0 +1,17 @@
+from services.analyzers.base import RegexAnalyzer
+
+
+class JavaScriptAnalyzer(RegexAnalyzer):
+    """JavaScript/TypeScript (simplified analysis)"""
+
+    language = 'JavaScript'
+    function_patterns = (
+        r'function\s+\w+\s*\(',
+        r'\w+\s*:\s*function\s*\(',
+        r'\w+\s*=>\s*{',
+        r'const\s+\w+\s*=\s*\('
+    )
+    class_pattern = r'class\s+\w+'
+    complexity_keywords = ('if', 'else', 'for', 'while', 'switch', 'catch', 'try')
+    # Console output and var usage (should use let/const)
+    smell_patterns = (r'console\.log', r'^var\s+')
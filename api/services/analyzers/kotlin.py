@@ -0,0 +1,12 @@
+from services.analyzers.base import RegexAnalyzer
+
+
+class KotlinAnalyzer(RegexAnalyzer):
+    """Kotlin (simplified analysis)"""
+
+    language = 'Kotlin'
+    function_patterns = (r'\bfun\s+(?:<[^>]*>\s*)?[\w.]+\s*\(',)
+    class_pattern = r'\b(?:class|object|interface)\s+\w+'
+    complexity_keywords = ('if', 'else', 'for', 'while', 'when', 'catch', 'try')
+    # Console output and non-null assertions
+    smell_patterns = (r'\bprintln\(', r'!!')
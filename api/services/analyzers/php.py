@@ -0,0 +1,13 @@
+from services.analyzers.base import RegexAnalyzer
+
+
+class PHPAnalyzer(RegexAnalyzer):
+    """PHP (simplified analysis)"""
+
+    language = 'PHP'
+    comment_patterns = (r'//.*', r'(?m)^\s*#(?!\[).*', r'(?s)/\*.*?\*/')
+    function_patterns = (r'\bfunction\s+&?\w+\s*\(',)
+    class_pattern = r'\b(?:class|interface|trait)\s+\w+'
+    complexity_keywords = ('if', 'elseif', 'else', 'for', 'foreach', 'while', 'switch', 'case', 'catch', 'try')
+    # Debug output
+    smell_patterns = (r'\b(?:var_dump|print_r|dd)\(',)
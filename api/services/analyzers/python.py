@@ -0,0 +1,217 @@
+import ast
+import re
+from typing import Dict, List
+
+from services.analyzers.base import LONG_LINE_LENGTH, calculate_technical_debt
+
+_MAGIC_NUMBER_RE = re.compile(r'\b\d{2,}\b')
+
+# Expression nodes without sub-expressions worth visiting
+_LEAF_EXPRESSIONS = (ast.Name, ast.Constant)
+
+
+class PythonMetricsVisitor(ast.NodeVisitor):
+    """Single-pass collector of function, class and nesting metrics for a Python AST
+
+    Each decision point is charged to the innermost enclosing function only, so
+    nested functions are visited once instead of once per enclosing function.
+    """
+
+    def __init__(self):
+        self.functions = []
+        self.class_count = 0
+        self.max_nesting = 0
+        self._function_stack = []
+        self._depth = 0
+
+    def visit(self, node: ast.AST):
+        if isinstance(node, ast.expr):
+            self._visit_expression(node)
+        else:
+            super().visit(node)
+
+    def _visit_expression(self, node: ast.expr):
+        # Expressions cannot contain statements, so only boolean operators matter
+        # here; an explicit stack avoids the per-node dispatch of generic_visit
+        bool_ops = 0
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if current.__class__ in _LEAF_EXPRESSIONS:
+                continue
+            if current.__class__ is ast.BoolOp:
+                bool_ops += len(current.values) - 1
+            for field in current._fields:
+                value = getattr(current, field, None)
+                if isinstance(value, list):
+                    stack.extend(item for item in value if isinstance(item, ast.AST))
+                elif isinstance(value, ast.AST) and not isinstance(value, ast.expr_context):
+                    stack.append(value)
+        if bool_ops:
+            self._add_complexity(bool_ops)
+
+    def _add_complexity(self, amount: int):
+        if self._function_stack:
+            self._function_stack[-1]['complexity'] += amount
+
+    def _visit_nested(self, statements: List[ast.AST]):
+        if not statements:
+            return
+        self._depth += 1
+        if self._depth > self.max_nesting:
+            self.max_nesting = self._depth
+        if self._function_stack and self._depth > self._function_stack[-1]['nesting']:
+            self._function_stack[-1]['nesting'] = self._depth
+        for statement in statements:
+            self.visit(statement)
+        self._depth -= 1
+
+    def _visit_function(self, node):
+        end_lineno = getattr(node, 'end_lineno', None)
+        record = {
+            'name': node.name,
+            'complexity': 1,  # Base complexity
+            'length': end_lineno - node.lineno if end_lineno else 10,
+            'nesting': 0
+        }
+        self.functions.append(record)
+
+        for decorator in node.decorator_list:
+            self.visit(decorator)
+        self.visit(node.args)
+
+        # Nesting is measured relative to the function body
+        outer_depth = self._depth
+        self._depth = 0
+        self._function_stack.append(record)
+        for statement in node.body:
+            self.visit(statement)
+        self._function_stack.pop()
+        self._depth = outer_depth
+
+    visit_FunctionDef = _visit_function
+    visit_AsyncFunctionDef = _visit_function
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        self.class_count += 1
+        self.generic_visit(node)
+
+    def visit_If(self, node: ast.If):
+        self._add_complexity(1)
+        self.visit(node.test)
+        self._visit_nested(node.body)
+        if len(node.orelse) == 1 and isinstance(node.orelse[0], ast.If):
+            # elif keeps the nesting level of its if
+            self.visit(node.orelse[0])
+        else:
+            self._visit_nested(node.orelse)
+
+    def _visit_loop(self, node):
+        self._add_complexity(1)
+        for field in ('target', 'iter', 'test'):
+            child = getattr(node, field, None)
+            if child is not None:
+                self.visit(child)
+        self._visit_nested(node.body)
+        self._visit_nested(node.orelse)
+
+    visit_For = _visit_loop
+    visit_AsyncFor = _visit_loop
+    visit_While = _visit_loop
+
+    def _visit_with(self, node):
+        self._add_complexity(1)
+        for item in node.items:
+            self.visit(item)
+        self._visit_nested(node.body)
+
+    visit_With = _visit_with
+    visit_AsyncWith = _visit_with
+
+    def _visit_try(self, node):
+        self._visit_nested(node.body)
+        for handler in node.handlers:
+            self.visit(handler)
+        self._visit_nested(node.orelse)
+        self._visit_nested(node.finalbody)
+
+    visit_Try = _visit_try
+    visit_TryStar = _visit_try
+
+    def visit_ExceptHandler(self, node: ast.ExceptHandler):
+        self._add_complexity(1)
+        if node.type is not None:
+            self.visit(node.type)
+        self._visit_nested(node.body)
+
+
+class PythonAnalyzer:
+    """Python, analysed from its AST"""
+
+    language = 'Python'
+
+    def analyze(self, content: str) -> Dict:
+        """Return the file metrics of one source file's content"""
+        # Parse AST and collect function/class metrics in a single traversal
+        visitor = PythonMetricsVisitor()
+        visitor.visit(ast.parse(content))
+
+        # Line-based metrics (comments, smells, duplication blocks) in a single pass
+        line_metrics = self.scan_lines(content)
+
+        return {
+            'lines': line_metrics['lines'],
+            'complexity': sum(f['complexity'] for f in visitor.functions),
+            'function_count': len(visitor.functions),
+            'class_count': visitor.class_count,
+            'max_nesting': visitor.max_nesting,
+            'comment_lines': line_metrics['comment_lines'],
+            'debt_score': calculate_technical_debt(content),
+            'code_smells': line_metrics['code_smells'],
+            'functions': visitor.functions,
+            'code_blocks': line_metrics['code_blocks']
+        }
+
+    def scan_lines(self, content: str) -> Dict:
+        """Compute line count, comment lines, code smells and code blocks of Python source in one pass"""
+        line_count = 0
+        comment_lines = 0
+        smells = 0
+        blocks = []
+        current_block = []
+
+        for raw_line in content.splitlines():
+            line_count += 1
+            line = raw_line.strip()
+
+            if line.startswith('#'):
+                comment_lines += 1
+
+            # Long lines
+            if len(line) > LONG_LINE_LENGTH:
+                smells += 1
+            # Too many parameters (simplified check)
+            if 'def ' in line:
+                if line.count(',') > 5:
+                    smells += 1
+            # Magic numbers
+            elif _MAGIC_NUMBER_RE.search(line):
+                smells += 1
+
+            # Blocks of 5+ consecutive non-empty, non-comment lines
+            if line and not line.startswith('#') and not line.startswith('//'):
+                current_block.append(line)
+            else:
+                if len(current_block) >= 5:
+                    blocks.append('\n'.join(current_block))
+                current_block = []
+
+        if len(current_block) >= 5:
+            blocks.append('\n'.join(current_block))
+
+        return {
+            'lines': line_count,
+            'comment_lines': comment_lines,
+            'code_smells': smells,
+            'code_blocks': blocks
+        }
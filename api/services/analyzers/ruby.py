@@ -0,0 +1,13 @@
+from services.analyzers.base import RegexAnalyzer
+
+
+class RubyAnalyzer(RegexAnalyzer):
+    """Ruby (simplified analysis)"""
+
+    language = 'Ruby'
+    comment_patterns = (r'(?m)^\s*#.*', r'(?ms)^=begin.*?^=end')
+    function_patterns = (r'\bdef\s+[\w.]+[?!=]?',)
+    class_pattern = r'\b(?:class|module)\s+[A-Z]\w*'
+    complexity_keywords = ('if', 'elsif', 'else', 'unless', 'while', 'until', 'for', 'when', 'rescue')
+    # Debug output
+    smell_patterns = (r'^(?:puts|p|pp)\s', r'\bbinding\.pry\b')
@@ -0,0 +1,13 @@
+from services.analyzers.base import RegexAnalyzer
+
+
+class RustAnalyzer(RegexAnalyzer):
+    """Rust (simplified analysis)"""
+
+    language = 'Rust'
+    function_patterns = (r'\bfn\s+\w+',)
+    # Structs, enums and traits play the role of classes
+    class_pattern = r'\b(?:struct|enum|trait)\s+\w+'
+    complexity_keywords = ('if', 'else', 'for', 'while', 'loop', 'match')
+    # Debug output and unchecked unwrapping
+    smell_patterns = (r'\b(?:println|dbg)!', r'\.unwrap\(\)')
@@ -0,0 +1,189 @@
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import BinaryIO, Dict, Iterable, Optional
+
+# Cache location and byte budget; a budget of 0 disables the cache
+DEFAULT_ARCHIVE_CACHE_DIR = os.environ.get(
+    'ARCHIVE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'healthyenv-archives'))
+DEFAULT_ARCHIVE_CACHE_MAX_BYTES = int(os.environ.get('ARCHIVE_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+
+_COMMIT_SHA_RE = re.compile(r'^[0-9a-f]{40}$')
+ARCHIVE_SUFFIX = '.zip'
+PARTIAL_SUFFIX = '.part'
+
+# Partial files older than this were left behind by an interrupted writer
+STALE_PARTIAL_SECONDS = 3600
+
+
+class ArchiveCache:
+    """Content-addressed cache of repository archives on local disk
+
+    Entries are keyed by owner/repo@sha, so an entry never goes stale. Writes
+    go to a temporary file in the cache directory that is renamed into place,
+    so readers (in this or other processes) never see a partial archive. The
+    modification time of an entry records its last use, and the least recently
+    used entries are evicted once the directory exceeds its byte budget.
+
+    get and store hand back an open file rather than a path: another process
+    may evict the entry at any time, and an open file stays readable after its
+    entry is removed.
+    """
+
+    def __init__(self, directory: str = DEFAULT_ARCHIVE_CACHE_DIR, max_bytes: int = DEFAULT_ARCHIVE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def is_cacheable(sha: Optional[str]) -> bool:
+        """Only full commit SHAs identify immutable content"""
+        return bool(sha and _COMMIT_SHA_RE.match(sha))
+
+    def path_for(self, owner: str, repo: str, sha: str) -> str:
+        # GitHub owner and repository names are case-insensitive
+        key = f"{owner}/{repo}@{sha}".lower()
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest() + ARCHIVE_SUFFIX)
+
+    def get(self, owner: str, repo: str, sha: str) -> Optional[BinaryIO]:
+        """Open the cached archive of owner/repo@sha for reading, or return None on a miss
+
+        The caller closes the file.
+        """
+        path = self.path_for(owner, repo, sha)
+        try:
+            archive = open(path, 'rb')
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            # Mark the entry as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted since it was opened; the open file is still complete
+            pass
+        with self._lock:
+            self.hits += 1
+        return archive
+
+    def store(self, owner: str, repo: str, sha: str, chunks: Iterable[bytes]) -> BinaryIO:
+        """Write the archive of owner/repo@sha from chunks atomically and return it open for reading
+
+        The caller closes the file.
+        """
+        path = self.path_for(owner, repo, sha)
+        fd, partial_path = tempfile.mkstemp(dir=self.directory, suffix=PARTIAL_SUFFIX)
+        archive = None
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            # Opened before it is published, so an eviction right after cannot take it away
+            archive = open(partial_path, 'rb')
+            os.replace(partial_path, path)
+        except BaseException:
+            if archive:
+                archive.close()
+            try:
+                os.remove(partial_path)
+            except OSError:
+                pass
+            raise
+        self.evict(keep=path)
+        return archive
+
+    def evict(self, keep: Optional[str] = None):
+        """Remove least recently used entries until the cache fits its byte budget
+
+        keep is never evicted, so an archive just stored stays readable even
+        when it alone exceeds the budget; it is evicted by the next store.
+        """
+        entries = []
+        total = 0
+        now = time.time()
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.endswith(PARTIAL_SUFFIX):
+                    if now - stat.st_mtime > STALE_PARTIAL_SECONDS:
+                        self._remove(entry.path)
+                    continue
+                if entry.name.endswith(ARCHIVE_SUFFIX):
+                    entries.append((stat.st_mtime, entry.path, stat.st_size))
+                    total += stat.st_size
+
+        for _, path, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            if self._remove(path):
+                total -= size
+                with self._lock:
+                    self.evictions += 1
+
+    def _remove(self, path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            logging.warning(f"Could not remove cached archive {path}: {str(e)}")
+            return False
+
+    def stats(self) -> Dict:
+        """Hit rate of this process and current disk usage of the cache"""
+        entries = 0
+        size = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(ARCHIVE_SUFFIX):
+                    try:
+                        size += entry.stat().st_size
+                        entries += 1
+                    except FileNotFoundError:
+                        continue
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'directory': self.directory,
+                'max_bytes': self.max_bytes,
+                'bytes': size,
+                'entries': entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_archive_cache() -> Optional[ArchiveCache]:
+    """Process-wide cache configured from the environment, or None when disabled"""
+    global _default_cache
+    if DEFAULT_ARCHIVE_CACHE_MAX_BYTES <= 0:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            try:
+                _default_cache = ArchiveCache()
+            except OSError as e:
+                logging.warning(f"Archive cache disabled, cannot use {DEFAULT_ARCHIVE_CACHE_DIR}: {str(e)}")
+                return None
+        return _default_cache
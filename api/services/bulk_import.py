@@ -0,0 +1,156 @@
+"""
+Bulk import of repositories into a dataset
+
+A list of repositories (pasted, or an uploaded text, CSV or JSON file) is
+validated and normalised to https://github.com/owner/repo, repositories already
+in the dataset are skipped with a single query, and the rest are queued as one
+import batch: an analysis request and an add_repository job each, which the
+worker pool runs at most JOB_BATCH_CONCURRENCY at a time. The batch report
+gathers the outcome of every entry and the throughput of the batch.
+"""
+
+import csv
+import json
+import os
+from collections import Counter
+from typing import Dict, Iterable, List
+
+from nanoid import generate
+
+from db import db
+from middleware.validation import normalize_github_url
+from model.analysis_request import AnalysisRequestModel
+from model.import_batch import ImportBatchModel
+from model.job import JobModel, ACTIVE_STATUSES
+from model.repository import RepositoryModel
+from services.job_queue import enqueue_repository
+
+# Largest number of entries accepted in one import
+IMPORT_MAX_REPOS = int(os.environ.get('IMPORT_MAX_REPOS', '1000'))
+
+_URL_COLUMNS = ('repo_url', 'url', 'repository')
+
+
+class InvalidImport(ValueError):
+    """An import that cannot be queued as submitted, e.g. an empty or oversized list"""
+
+
+def parse_repo_list(text: str) -> List[str]:
+    """Repository entries of a pasted list or an uploaded file
+
+    Accepts a JSON array (of strings, or of objects with a repo_url or url
+    field), a CSV file with a repo_url, url or repository column, or entries
+    separated by newlines or commas. Blank lines and # comments are ignored.
+    """
+    text = text.strip()
+    if text.startswith('['):
+        try:
+            items = json.loads(text)
+        except ValueError as e:
+            raise InvalidImport(f'Invalid JSON list: {str(e)}')
+        return [
+            next((item.get(column) for column in _URL_COLUMNS if item.get(column)), '') if isinstance(item, dict) else str(item)
+            for item in items
+        ]
+
+    lines = [line for line in text.splitlines() if line.strip() and not line.lstrip().startswith('#')]
+    if not lines:
+        return []
+    header = [cell.strip().lower() for cell in next(csv.reader([lines[0]]))]
+    column = next((name for name in _URL_COLUMNS if name in header), None)
+    if column is not None:
+        index = header.index(column)
+        return [row[index] if index < len(row) else '' for row in csv.reader(lines[1:])]
+
+    return [entry.strip() for line in lines for entry in line.split(',') if entry.strip()]
+
+
+def import_repositories(dataset_id: str, entries: Iterable[str], submitter_name: str,
+                        email: str, author: str = None) -> ImportBatchModel:
+    """Queue the repositories of entries for addition to a dataset as one import batch
+
+    Entries that are not GitHub repositories, repeat an earlier entry or are
+    already in the dataset are recorded on the batch as skipped. The batch, its
+    analysis requests and jobs are committed together.
+    """
+    entries = list(entries)
+    if not entries:
+        raise InvalidImport('No repositories to import')
+    if len(entries) > IMPORT_MAX_REPOS:
+        raise InvalidImport(f'At most {IMPORT_MAX_REPOS} repositories can be imported at once, got {len(entries)}')
+
+    skipped = []
+    queued: Dict[str, str] = {}
+    for entry in entries:
+        url = normalize_github_url(entry)
+        if url is None:
+            skipped.append({'repo_url': entry, 'outcome': 'invalid', 'reason': 'Not a GitHub repository URL'})
+            continue
+        name = url[len('https://github.com/'):].lower()
+        if name in queued:
+            skipped.append({'repo_url': url, 'outcome': 'duplicate', 'reason': 'Listed more than once'})
+            continue
+        queued[name] = url
+
+    existing = RepositoryModel.find_existing_names(dataset_id, queued)
+    for name in existing:
+        skipped.append({'repo_url': queued.pop(name), 'outcome': 'exists', 'reason': 'Already in the dataset'})
+
+    batch = ImportBatchModel(generate(size=10), dataset_id, author, len(queued), skipped)
+    db.session.add(batch)
+    for url in queued.values():
+        analysis_request = AnalysisRequestModel(generate(size=10), dataset_id, submitter_name, email, url)
+        db.session.add(analysis_request)
+        enqueue_repository(analysis_request, id_import_batch=batch.id)
+    db.session.commit()
+    return batch
+
+
+def batch_report(batch: ImportBatchModel) -> dict:
+    """Outcome of every entry of an import batch, with counts and throughput
+
+    Queued entries report their job's status and stage; throughput counts the
+    repositories added per minute between the first job starting and the last
+    one finishing.
+    """
+    jobs = JobModel.find_by_import_batch(batch.id)
+    repositories = []
+    for job in jobs:
+        result = job.get_result() or {}
+        repositories.append({
+            'repo_url': job.get_payload().get('repo_url'),
+            'outcome': job.status.value.lower(),
+            'stage': job.stage,
+            'job_id': job.id,
+            'request_id': job.id_analysis_request,
+            'repository_id': result.get('repository_id'),
+            'attempts': job.attempts,
+            'error': job.error,
+        })
+    skipped = batch.get_skipped()
+    repositories.extend(skipped)
+
+    counts = Counter(repository['outcome'] for repository in repositories)
+    started = [job.started_at for job in jobs if job.started_at]
+    finished = [job.finished_at for job in jobs if job.finished_at]
+    elapsed = (max(finished) - min(started)).total_seconds() if started and finished else None
+    succeeded = counts.get('succeeded', 0)
+
+    return {
+        'id': batch.id,
+        'dataset_id': batch.dataset_id,
+        'author': batch.author,
+        'created_at': batch.created_at.isoformat() if batch.created_at else None,
+        'finished': not any(job.status in ACTIVE_STATUSES for job in jobs),
+        'summary': {
+            'entries': len(jobs) + len(skipped),
+            'queued': len(jobs),
+            'skipped': len(skipped),
+            'counts': dict(counts),
+        },
+        'throughput': {
+            'elapsed_seconds': round(elapsed, 1) if elapsed is not None else None,
+            'repos_per_minute': round(succeeded * 60 / elapsed, 2) if elapsed else None,
+        },
+        'repositories': repositories,
+    }
@@ -1,30 +1,81 @@
-import ast
 import os
 import re
 import tempfile
 import shutil
-import requests
+import subprocess
+import tarfile
+import tracemalloc
 import zipfile
-from collections import defaultdict, Counter
-from typing import Dict, List, Tuple, Optional
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Dict, Iterator, List, Tuple, Optional, Union
 import logging
+from services import analyzers
+from services.archive_cache import ArchiveCache
+from services.github_client import get_github_client
+from services.analysis_sampling import StratifiedSample, file_values
+from services.instrumentation import StageTimer, emit_stages, memory_tracing
+from services.metrics_aggregate import MetricsAggregate
+
+# Analysis limits; files beyond them are skipped and reported instead of analysed
+DEFAULT_MAX_FILE_BYTES = int(os.environ.get('CODE_ANALYSIS_MAX_FILE_BYTES', str(1024 * 1024)))
+DEFAULT_MAX_LINE_LENGTH = int(os.environ.get('CODE_ANALYSIS_MAX_LINE_LENGTH', '1000'))
+DEFAULT_MAX_FILES = int(os.environ.get('CODE_ANALYSIS_MAX_FILES', '20000'))
+
+# Repositories with more source files than the threshold are sampled (0 disables sampling)
+DEFAULT_SAMPLE_THRESHOLD_FILES = int(os.environ.get('CODE_ANALYSIS_SAMPLE_THRESHOLD_FILES', '5000'))
+DEFAULT_SAMPLE_SIZE = int(os.environ.get('CODE_ANALYSIS_SAMPLE_SIZE', '1500'))
+
+# Only the head of a file is read to decide whether it is minified or generated
+SNIFF_BYTES = 8192
+GENERATED_MARKER_WINDOW = 2048
+MINIFIED_AVG_LINE_LENGTH = 300
+
+# Well-known names of minified bundles and generated sources
+_SKIPPED_NAME_RE = re.compile(
+    r'(\.min\.js|[.-]bundle\.js|_pb2(_grpc)?\.py|\.pb\.(go|cc|h|c)|\.pb-c\.c|'
+    r'\.g\.cs|\.designer\.cs|\.generated\.\w+)$',
+    re.IGNORECASE
+)
+_GENERATED_MARKER_RE = re.compile(
+    r'code generated .{0,80}do not edit|@generated\b|generated by the protocol buffer compiler|'
+    r'^\W*(this (file|code) (is|was|has been) )?(auto-?generated|automatically generated)\b',
+    re.IGNORECASE | re.MULTILINE
+)
+
+# Test files are recognised by name or by living under a test directory
+_TEST_FILE_RE = re.compile(
+    r'(^test.*\.(py|java)|_test\.(py|go|rb)|_spec\.rb|\.(test|spec)\.(js|jsx|ts|tsx)|tests?\.(java|kt|php))$',
+    re.IGNORECASE
+)
+_TEST_DIR_RE = re.compile(r'(^|/)(tests|__tests__|src/test)(/|$)', re.IGNORECASE)
+
+# Rough estimation: assume each test file covers this many source files
+SOURCE_FILES_PER_TEST = 5
 
 class CodeAnalysisService:
     """Service for analyzing code quality metrics from repository source code"""
     
-    def __init__(self):
-        self.supported_extensions = {
-            '.py': self._analyze_python_file,
-            '.js': self._analyze_javascript_file,
-            '.ts': self._analyze_typescript_file,
-            '.java': self._analyze_java_file,
-            '.cpp': self._analyze_cpp_file,
-            '.c': self._analyze_c_file,
-            '.cs': self._analyze_csharp_file,
-            '.go': self._analyze_go_file
-        }
-        
-    def analyze_repository(self, owner: str, repo: str, github_token: str = None) -> Dict:
+    def __init__(self, measure_memory: bool = False, max_file_bytes: int = DEFAULT_MAX_FILE_BYTES,
+                 max_line_length: int = DEFAULT_MAX_LINE_LENGTH, max_files: int = DEFAULT_MAX_FILES,
+                 sample_threshold_files: int = DEFAULT_SAMPLE_THRESHOLD_FILES,
+                 sample_size: int = DEFAULT_SAMPLE_SIZE, sample_seed: Optional[int] = None,
+                 archive_cache: Optional[ArchiveCache] = None):
+        # Tracing allocations slows analysis down, so peak memory is opt-in
+        self.measure_memory = measure_memory
+        self.max_file_bytes = max_file_bytes
+        self.max_line_length = max_line_length
+        self.max_files = max_files
+        self.sample_threshold_files = sample_threshold_files
+        self.sample_size = sample_size
+        self.sample_seed = sample_seed
+        # Downloaded archives are reused for the same commit when a cache is given
+        self.archive_cache = archive_cache
+        # Analysers are plugins loaded on first use; see services.analyzers
+        self.supported_extensions = analyzers.supported_extensions()
+        
+    def analyze_repository(self, owner: str, repo: str, github_token: str = None,
+                           timer: Optional[StageTimer] = None, commit_sha: Optional[str] = None) -> Dict:
         """
         Analyze a GitHub repository for code quality metrics
         
@@ -32,534 +83,448 @@ class CodeAnalysisService:
             owner: Repository owner
             repo: Repository name
             github_token: GitHub token for API access
+            timer: StageTimer of an enclosing operation to record the stages in; when
+                omitted the stages are emitted to the metrics sink here
+            commit_sha: Commit to analyze instead of the default branch; a full SHA
+                lets the archive be served from and stored in the archive cache
             
         Returns:
-            Dictionary with code quality metrics
+            Dictionary with code quality metrics and per-stage measurements under 'stages'
         """
+        own_timer = timer is None
+        timer = timer or StageTimer()
+        temp_dir = tempfile.mkdtemp()
         try:
-            # Download repository source code
-            temp_dir = self._download_repository(owner, repo, github_token)
+            with memory_tracing(self.measure_memory):
+                # Download repository source code, unless this commit is cached
+                with timer.stage('download') as record:
+                    archive, cached = self._fetch_archive(owner, repo, temp_dir, github_token, commit_sha, timer)
+                    record['cache_hit'] = cached
+                    if not cached:
+                        record['bytes'] += self._safe_size(archive)
+                        record['files'] += 1
+                
+                with timer.stage('extract') as record:
+                    record['bytes'] += self._safe_size(archive)
+                    if isinstance(archive, str):
+                        repo_path, record['files'] = self._extract_archive(archive, temp_dir)
+                        os.remove(archive)
+                    else:
+                        # Archives of the cache stay there for the next analysis of this commit
+                        with archive:
+                            repo_path, record['files'] = self._extract_archive(archive, temp_dir)
+                
+                # Analyze code metrics
+                metrics = self._analyze_codebase(repo_path, timer=timer)
             
-            # Analyze code metrics
-            metrics = self._analyze_codebase(temp_dir)
+            metrics['stages'] = timer.as_dict()
+            return metrics
             
+        except Exception as e:
+            logging.error(f"Error analyzing repository {owner}/{repo}: {str(e)}")
+            metrics = self._get_default_metrics()
+            metrics['analysis_failed'] = True
+            metrics['stages'] = timer.as_dict()
+            return metrics
+        finally:
             # Cleanup
             shutil.rmtree(temp_dir, ignore_errors=True)
+            if own_timer:
+                emit_stages(f"{owner}/{repo}", timer.as_dict())
+    
+    def analyze_path(self, path: str, workers: int = 1) -> Dict:
+        """
+        Analyze a local directory, git checkout or .zip/.tar.gz archive without network access
+        
+        Args:
+            path: Directory or archive to analyze
+            workers: Number of processes to analyze directory shards in parallel
             
-            return metrics
+        Returns:
+            Dictionary with code quality metrics, the checkout's commit SHA when
+            available and per-stage measurements under 'stages'
             
-        except Exception as e:
-            logging.error(f"Error analyzing repository {owner}/{repo}: {str(e)}")
-            return self._get_default_metrics()
+        Raises:
+            ValueError: If the path is neither a directory nor a supported archive
+        """
+        timer = StageTimer()
+        temp_dir = None
+        try:
+            with memory_tracing(self.measure_memory):
+                if os.path.isdir(path):
+                    repo_path = path
+                    commit_sha = self._local_commit_sha(path)
+                elif zipfile.is_zipfile(path) or (os.path.isfile(path) and tarfile.is_tarfile(path)):
+                    temp_dir = tempfile.mkdtemp()
+                    with timer.stage('extract') as record:
+                        record['bytes'] += self._safe_size(path)
+                        repo_path, record['files'] = self._extract_archive(path, temp_dir)
+                    commit_sha = None
+                else:
+                    raise ValueError(f"{path} is not a directory or a .zip/.tar.gz archive")
+                
+                metrics = self._analyze_codebase(repo_path, workers, timer)
+            
+            metrics['commit_sha'] = commit_sha
+            metrics['stages'] = timer.as_dict()
+            return metrics
+        finally:
+            if temp_dir:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    def _local_commit_sha(self, path: str) -> Optional[str]:
+        """Return HEAD of a local git checkout, or None when path is not one"""
+        if not os.path.exists(os.path.join(path, '.git')):
+            return None
+        try:
+            result = subprocess.run(['git', '-C', path, 'rev-parse', 'HEAD'],
+                                    capture_output=True, text=True, timeout=10)
+        except (OSError, subprocess.SubprocessError):
+            return None
+        if result.returncode != 0:
+            return None
+        return result.stdout.strip() or None
     
-    def _download_repository(self, owner: str, repo: str, github_token: str = None) -> str:
-        """Download repository source code to temporary directory"""
+    def _fetch_archive(self, owner: str, repo: str, temp_dir: str, github_token: str = None,
+                       commit_sha: Optional[str] = None, timer: Optional[StageTimer] = None
+                       ) -> Tuple[Union[str, BinaryIO], bool]:
+        """Return the repository archive and whether it came from the archive cache
+        
+        Archives of full commit SHAs are looked up in and stored to the archive
+        cache and returned as an open file, which the caller closes; anything else
+        is downloaded into temp_dir and its path returned.
+        """
+        if not self.archive_cache or not ArchiveCache.is_cacheable(commit_sha):
+            return self._download_repository(owner, repo, temp_dir, github_token, commit_sha, timer), False
+        
+        cached = self.archive_cache.get(owner, repo, commit_sha)
+        if cached:
+            return cached, True
+        
+        response = self._request_archive(owner, repo, github_token, commit_sha)
+        return self.archive_cache.store(owner, repo, commit_sha, self._iter_archive(response, timer)), False
+    
+    def _request_archive(self, owner: str, repo: str, github_token: str = None, ref: Optional[str] = None):
+        """Start a streaming download of the repository ZIP archive at ref (default branch when None)"""
         headers = {}
         if github_token:
             headers['Authorization'] = f'token {github_token}'
-            
-        # Download repository as ZIP
+        
         download_url = f"https://api.github.com/repos/{owner}/{repo}/zipball"
-        response = requests.get(download_url, headers=headers, stream=True)
+        if ref:
+            download_url += f"/{ref}"
+        response = get_github_client().get(download_url, headers=headers, stream=True)
         
         if response.status_code != 200:
             raise ValueError(f"Failed to download repository: {response.status_code}")
-        
-        # Create temporary directory
-        temp_dir = tempfile.mkdtemp()
+        return response
+    
+    def _iter_archive(self, response, timer: Optional[StageTimer] = None) -> Iterator[bytes]:
+        """Stream an archive download, reporting the bytes received as download progress"""
+        # Archives are often sent chunked, without a total
+        total = int(response.headers.get('Content-Length') or 0) or None
+        received = 0
+        for chunk in response.iter_content(chunk_size=8192):
+            received += len(chunk)
+            if timer is not None:
+                timer.report('download', bytes_received=received, bytes_total=total)
+            yield chunk
+    
+    def _download_repository(self, owner: str, repo: str, temp_dir: str, github_token: str = None,
+                             ref: Optional[str] = None, timer: Optional[StageTimer] = None) -> str:
+        """Download repository source code as a ZIP archive into temp_dir and return its path"""
+        response = self._request_archive(owner, repo, github_token, ref)
         zip_path = os.path.join(temp_dir, "repo.zip")
         
         # Save ZIP file
         with open(zip_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
+            for chunk in self._iter_archive(response, timer):
                 f.write(chunk)
         
-        # Extract ZIP
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_dir)
-        
-        # Remove ZIP file
-        os.remove(zip_path)
-        
-        # Find the extracted directory (GitHub creates a folder with commit hash)
-        extracted_dirs = [d for d in os.listdir(temp_dir) if os.path.isdir(os.path.join(temp_dir, d))]
-        if not extracted_dirs:
-            raise ValueError("No directory found in extracted ZIP")
-            
-        return os.path.join(temp_dir, extracted_dirs[0])
+        return zip_path
     
-    def _analyze_codebase(self, repo_path: str) -> Dict:
-        """Analyze entire codebase for quality metrics"""
-        metrics = {
-            'cyclomatic_complexity': 0,
-            'code_duplication': 0,
-            'technical_debt': 0,
-            'test_coverage': 0,
-            'maintainability_index': 0,
-            'code_smells': 0,
-            'total_files': 0,
-            'total_lines': 0,
-            'comment_ratio': 0,
-            'function_count': 0,
-            'class_count': 0,
-            'avg_function_length': 0,
-            'max_function_complexity': 0
-        }
+    def _extract_archive(self, archive: Union[str, BinaryIO], temp_dir: str) -> Tuple[str, int]:
+        """Extract a .zip or .tar(.gz) archive, given by path or as an open file, into temp_dir
         
-        file_metrics = []
-        all_functions = []
-        all_code_blocks = []
+        Returns:
+            Tuple of (source root, number of archive members)
+        """
+        extract_dir = os.path.join(temp_dir, 'src')
+        if zipfile.is_zipfile(archive):
+            with zipfile.ZipFile(archive, 'r') as zip_ref:
+                member_count = len(zip_ref.infolist())
+                zip_ref.extractall(extract_dir)
+        else:
+            if isinstance(archive, str):
+                tar_ref = tarfile.open(archive, 'r:*')
+            else:
+                # is_zipfile moved the file's position
+                archive.seek(0)
+                tar_ref = tarfile.open(fileobj=archive, mode='r:*')
+            with tar_ref:
+                member_count = len(tar_ref.getmembers())
+                if hasattr(tarfile, 'data_filter'):
+                    tar_ref.extractall(extract_dir, filter='data')
+                else:
+                    tar_ref.extractall(extract_dir)
+        
+        # GitHub archives (and most release tarballs) wrap everything in one top-level folder
+        entries = os.listdir(extract_dir)
+        if len(entries) == 1 and os.path.isdir(os.path.join(extract_dir, entries[0])):
+            return os.path.join(extract_dir, entries[0]), member_count
+        return extract_dir, member_count
+    
+    def _analyze_codebase(self, repo_path: str, workers: int = 1, timer: Optional[StageTimer] = None) -> Dict:
+        """Analyze entire codebase for quality metrics
         
-        # Walk through all files
-        for root, dirs, files in os.walk(repo_path):
-            # Skip common non-source directories
-            dirs[:] = [d for d in dirs if not d.startswith('.') and d not in 
-                      ['node_modules', '__pycache__', 'venv', 'env', 'build', 'dist', 'target']]
-            
-            for file in files:
-                file_path = os.path.join(root, file)
-                file_ext = os.path.splitext(file)[1].lower()
+        Files are folded into a MetricsAggregate as soon as they are analysed, so
+        memory use does not grow with the number of files or functions. With
+        workers > 1 the files are split into directory shards analysed in
+        separate processes and their aggregates merged.
+        """
+        timer = timer or StageTimer()
+        with memory_tracing(self.measure_memory):
+            with timer.stage('parse') as record:
+                # Work items are (sampling stratum, file index, source file)
+                work = ((None, index, source_file) for index, source_file in enumerate(self._iter_source_files(repo_path)))
                 
-                if file_ext in self.supported_extensions:
-                    try:
-                        file_metric = self.supported_extensions[file_ext](file_path)
-                        if file_metric:
-                            file_metrics.append(file_metric)
-                            all_functions.extend(file_metric.get('functions', []))
-                            all_code_blocks.extend(file_metric.get('code_blocks', []))
-                            metrics['total_files'] += 1
-                            metrics['total_lines'] += file_metric.get('lines', 0)
-                            metrics['function_count'] += file_metric.get('function_count', 0)
-                            metrics['class_count'] += file_metric.get('class_count', 0)
-                    except Exception as e:
-                        logging.warning(f"Error analyzing file {file_path}: {str(e)}")
-        
-        # Calculate aggregate metrics
-        if file_metrics:
-            metrics['cyclomatic_complexity'] = sum(f.get('complexity', 0) for f in file_metrics)
-            metrics['technical_debt'] = sum(f.get('debt_score', 0) for f in file_metrics)
-            metrics['code_smells'] = sum(f.get('code_smells', 0) for f in file_metrics)
-            
-            total_comments = sum(f.get('comment_lines', 0) for f in file_metrics)
-            metrics['comment_ratio'] = (total_comments / metrics['total_lines']) * 100 if metrics['total_lines'] > 0 else 0
-            
-            if all_functions:
-                function_lengths = [f.get('length', 0) for f in all_functions]
-                function_complexities = [f.get('complexity', 0) for f in all_functions]
-                metrics['avg_function_length'] = sum(function_lengths) / len(function_lengths)
-                metrics['max_function_complexity'] = max(function_complexities) if function_complexities else 0
-            
-            # Calculate code duplication
-            metrics['code_duplication'] = self._calculate_duplication(all_code_blocks)
+                # Very large repositories are analysed through a stratified sample
+                sample = None
+                if self.sample_threshold_files:
+                    work = list(work)
+                    if len(work) > self.sample_threshold_files:
+                        # The sample takes the place of the first max_files files, so it is capped instead
+                        sample = StratifiedSample(
+                            [(self._stratum_of(repo_path, item[2]), item) for item in work],
+                            min(self.sample_size, self.max_files),
+                            self.sample_seed
+                        )
+                        logging.info(f"Sampling {len(sample.selected)} of {sample.population} source files in {repo_path}")
+                        # Sampled files are numbered by their position in the sample for the max_files check
+                        work = [(stratum, index, source_file)
+                                for index, (stratum, (_, _, source_file)) in enumerate(sample.selected)]
+                
+                # The total is known once the file list is materialised for sampling
+                files_total = len(work) if isinstance(work, list) else None
+                if workers > 1:
+                    aggregate, sampled_values = self._analyze_in_processes(list(work), workers, timer)
+                else:
+                    aggregate, sampled_values = self._analyze_files(work, timer, files_total)
+                
+                record['files'] += aggregate.total_files + aggregate.skipped_files
+                record['bytes'] += aggregate.analyzed_bytes + aggregate.skipped_bytes
+            
+            metrics = self.finalize_aggregate(aggregate, timer)
+            if sample:
+                for stratum, values in sampled_values:
+                    sample.record(stratum, values)
+                sample.apply(metrics)
+                # Maintainability and test coverage depend on the extrapolated totals
+                metrics['maintainability_index'] = self._calculate_maintainability_index(metrics)
+                metrics['test_coverage'] = self._estimate_test_coverage(metrics)
+            
+            if self.measure_memory:
+                peaks = [stage.get('peak_memory_bytes', 0) for stage in timer.stages.values()]
+                metrics['peak_memory_bytes'] = max(peaks + [tracemalloc.get_traced_memory()[1]])
             
+            return metrics
+    
+    def finalize_aggregate(self, aggregate: MetricsAggregate, timer: Optional[StageTimer] = None) -> Dict:
+        """Turn a (possibly merged) MetricsAggregate into the final metrics dictionary"""
+        timer = timer or StageTimer()
+        with timer.stage('duplication') as record:
+            metrics = aggregate.finalize()
+            record['files'] += aggregate.total_files
+        
+        # Calculate derived metrics
+        if aggregate.total_files:
             # Calculate maintainability index (simplified version)
             metrics['maintainability_index'] = self._calculate_maintainability_index(metrics)
             
             # Estimate test coverage based on test files
-            metrics['test_coverage'] = self._estimate_test_coverage(repo_path)
+            metrics['test_coverage'] = self._estimate_test_coverage(metrics)
         
         return metrics
     
-    def _analyze_python_file(self, file_path: str) -> Optional[Dict]:
-        """Analyze Python file for quality metrics"""
-        try:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-            
-            # Parse AST
-            tree = ast.parse(content)
-            
-            metrics = {
-                'lines': len(content.splitlines()),
-                'complexity': 0,
-                'function_count': 0,
-                'class_count': 0,
-                'comment_lines': 0,
-                'debt_score': 0,
-                'code_smells': 0,
-                'functions': [],
-                'code_blocks': []
-            }
-            
-            # Count comments
-            metrics['comment_lines'] = len([line for line in content.splitlines() 
-                                          if line.strip().startswith('#')])
-            
-            # Analyze AST nodes
-            for node in ast.walk(tree):
-                if isinstance(node, ast.FunctionDef):
-                    func_complexity = self._calculate_function_complexity(node)
-                    func_length = node.end_lineno - node.lineno if hasattr(node, 'end_lineno') else 10
-                    
-                    metrics['functions'].append({
-                        'name': node.name,
-                        'complexity': func_complexity,
-                        'length': func_length
-                    })
-                    
-                    metrics['function_count'] += 1
-                    metrics['complexity'] += func_complexity
-                    
-                elif isinstance(node, ast.ClassDef):
-                    metrics['class_count'] += 1
-            
-            # Detect code smells
-            metrics['code_smells'] = self._detect_python_code_smells(content)
-            
-            # Calculate technical debt
-            metrics['debt_score'] = self._calculate_technical_debt(content)
-            
-            # Extract code blocks for duplication analysis
-            metrics['code_blocks'] = self._extract_code_blocks(content)
-            
-            return metrics
-            
-        except Exception as e:
-            logging.warning(f"Error analyzing Python file {file_path}: {str(e)}")
-            return None
+    def analyze_shard(self, repo_path: str, shard_index: int, shard_count: int) -> MetricsAggregate:
+        """Analyze one of shard_count deterministic directory shards of a source tree
+        
+        Shards of the same tree can run as separate jobs; merging their aggregates
+        and calling finalize_aggregate gives the metrics of a full analysis.
+        Sampling is not applied to shards.
+        """
+        if not 0 <= shard_index < shard_count:
+            raise ValueError(f"Shard index {shard_index} is out of range for {shard_count} shards")
+        work = [(None, index, source_file) for index, source_file in enumerate(self._iter_source_files(repo_path))]
+        aggregate, _ = self._analyze_files(self._partition_work(work, shard_count)[shard_index])
+        return aggregate
     
-    def _analyze_javascript_file(self, file_path: str) -> Optional[Dict]:
-        """Analyze JavaScript/TypeScript file (simplified analysis)"""
-        try:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-            
-            metrics = {
-                'lines': len(content.splitlines()),
-                'complexity': 0,
-                'function_count': 0,
-                'class_count': 0,
-                'comment_lines': 0,
-                'debt_score': 0,
-                'code_smells': 0,
-                'functions': [],
-                'code_blocks': []
-            }
-            
-            # Count comments (single line and multi-line)
-            single_comments = len(re.findall(r'//.*', content))
-            multi_comments = len(re.findall(r'/\*.*?\*/', content, re.DOTALL))
-            metrics['comment_lines'] = single_comments + multi_comments
-            
-            # Count functions (simplified regex)
-            function_patterns = [
-                r'function\s+\w+\s*\(',
-                r'\w+\s*:\s*function\s*\(',
-                r'\w+\s*=>\s*{',
-                r'const\s+\w+\s*=\s*\('
-            ]
-            
-            for pattern in function_patterns:
-                metrics['function_count'] += len(re.findall(pattern, content))
-            
-            # Count classes
-            metrics['class_count'] = len(re.findall(r'class\s+\w+', content))
-            
-            # Estimate complexity based on control structures
-            complexity_patterns = [
-                r'\bif\b', r'\belse\b', r'\bfor\b', r'\bwhile\b',
-                r'\bswitch\b', r'\bcatch\b', r'\btry\b'
-            ]
-            
-            for pattern in complexity_patterns:
-                metrics['complexity'] += len(re.findall(pattern, content))
-            
-            # Detect code smells
-            metrics['code_smells'] = self._detect_js_code_smells(content)
-            
-            # Calculate technical debt
-            metrics['debt_score'] = self._calculate_technical_debt(content)
-            
-            # Extract code blocks
-            metrics['code_blocks'] = self._extract_code_blocks(content)
-            
-            return metrics
-            
-        except Exception as e:
-            logging.warning(f"Error analyzing JavaScript file {file_path}: {str(e)}")
-            return None
+    def _analyze_files(self, work, timer: Optional[StageTimer] = None,
+                       files_total: Optional[int] = None) -> Tuple[MetricsAggregate, List]:
+        """Analyze work items into a fresh aggregate, reporting each file as parse progress to timer
+        
+        Returns:
+            Tuple of (aggregate, [(stratum, file values)] for sampled work items)
+        """
+        aggregate = MetricsAggregate()
+        sampled_values = []
+        
+        for stratum, index, (file_name, file_path, file_ext, is_test) in work:
+            aggregate.count_source_file(is_test)
+            try:
+                file_metric, skip_reason, file_size = self._analyze_source_file(file_name, file_path, file_ext, index)
+            except Exception as e:
+                logging.warning(f"Error analyzing file {file_path}: {str(e)}")
+                file_metric, skip_reason, file_size = None, None, 0
+            
+            if skip_reason:
+                aggregate.skip_file(skip_reason, file_size)
+            elif file_metric:
+                aggregate.add_file(file_metric, file_size)
+            if stratum is not None:
+                sampled_values.append((stratum, file_values(file_metric, skip_reason, file_size, is_test)))
+            if timer is not None:
+                timer.report('parse', files_done=aggregate.source_files, files_total=files_total)
+        
+        return aggregate, sampled_values
+    
+    def _analyze_in_processes(self, work: List, workers: int,
+                              timer: Optional[StageTimer] = None) -> Tuple[MetricsAggregate, List]:
+        """Analyze directory shards in a process pool and merge their aggregates, reporting each shard"""
+        shards = [shard for shard in self._partition_work(work, workers) if shard]
+        aggregate = MetricsAggregate()
+        sampled_values = []
+        if not shards:
+            return aggregate, sampled_values
+        
+        with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+            for shard_aggregate, shard_values in pool.map(_analyze_shard_work, [self._config()] * len(shards), shards):
+                aggregate.merge(shard_aggregate)
+                sampled_values.extend(shard_values)
+                if timer is not None:
+                    timer.report('parse', files_done=aggregate.source_files, files_total=len(work))
+        return aggregate, sampled_values
     
-    def _analyze_typescript_file(self, file_path: str) -> Optional[Dict]:
-        """Analyze TypeScript file (uses JavaScript analysis)"""
-        return self._analyze_javascript_file(file_path)
+    def _partition_work(self, work: List, shard_count: int) -> List[List]:
+        """Split work items into shard_count shards of whole directories with balanced cost
+        
+        The cost of a file is its size weighted by the cost class of its analyser.
+        Directories are assigned costliest first to the currently lightest shard, so
+        the partition only depends on the tree itself.
+        """
+        directories = defaultdict(list)
+        for item in work:
+            directories[os.path.dirname(item[2][1])].append(item)
+        
+        costs = {}
+        for directory, items in directories.items():
+            costs[directory] = sum(self._safe_size(item[2][1]) * analyzers.cost_weight(item[2][2]) for item in items)
+        
+        shards = [[] for _ in range(shard_count)]
+        shard_costs = [0] * shard_count
+        for directory in sorted(directories, key=lambda d: (-costs[d], d)):
+            lightest = shard_costs.index(min(shard_costs))
+            shards[lightest].extend(directories[directory])
+            shard_costs[lightest] += costs[directory]
+        return shards
     
-    def _analyze_java_file(self, file_path: str) -> Optional[Dict]:
-        """Analyze Java file (simplified analysis)"""
+    def _safe_size(self, file: Union[str, BinaryIO]) -> int:
         try:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-            
-            metrics = {
-                'lines': len(content.splitlines()),
-                'complexity': 0,
-                'function_count': 0,
-                'class_count': 0,
-                'comment_lines': 0,
-                'debt_score': 0,
-                'code_smells': 0,
-                'functions': [],
-                'code_blocks': []
-            }
-            
-            # Count comments
-            single_comments = len(re.findall(r'//.*', content))
-            multi_comments = len(re.findall(r'/\*.*?\*/', content, re.DOTALL))
-            metrics['comment_lines'] = single_comments + multi_comments
-            
-            # Count methods and classes
-            metrics['function_count'] = len(re.findall(r'(public|private|protected)?\s*(static)?\s*\w+\s+\w+\s*\(', content))
-            metrics['class_count'] = len(re.findall(r'class\s+\w+', content))
-            
-            # Estimate complexity
-            complexity_patterns = [
-                r'\bif\b', r'\belse\b', r'\bfor\b', r'\bwhile\b',
-                r'\bswitch\b', r'\bcatch\b', r'\btry\b'
-            ]
-            
-            for pattern in complexity_patterns:
-                metrics['complexity'] += len(re.findall(pattern, content))
-            
-            metrics['code_smells'] = self._detect_java_code_smells(content)
-            metrics['debt_score'] = self._calculate_technical_debt(content)
-            metrics['code_blocks'] = self._extract_code_blocks(content)
-            
-            return metrics
-            
-        except Exception as e:
-            logging.warning(f"Error analyzing Java file {file_path}: {str(e)}")
-            return None
+            return os.path.getsize(file) if isinstance(file, str) else os.fstat(file.fileno()).st_size
+        except OSError:
+            return 0
     
-    def _analyze_cpp_file(self, file_path: str) -> Optional[Dict]:
-        """Analyze C++ file (simplified analysis)"""
-        return self._analyze_c_file(file_path)
+    def _config(self) -> Dict:
+        """Constructor arguments, used to rebuild an equivalent service in worker processes"""
+        return {
+            'max_file_bytes': self.max_file_bytes,
+            'max_line_length': self.max_line_length,
+            'max_files': self.max_files,
+            'sample_threshold_files': 0
+        }
     
-    def _analyze_c_file(self, file_path: str) -> Optional[Dict]:
-        """Analyze C file (simplified analysis)"""
-        try:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-            
-            metrics = {
-                'lines': len(content.splitlines()),
-                'complexity': 0,
-                'function_count': 0,
-                'class_count': 0,
-                'comment_lines': 0,
-                'debt_score': 0,
-                'code_smells': 0,
-                'functions': [],
-                'code_blocks': []
-            }
-            
-            # Count comments
-            single_comments = len(re.findall(r'//.*', content))
-            multi_comments = len(re.findall(r'/\*.*?\*/', content, re.DOTALL))
-            metrics['comment_lines'] = single_comments + multi_comments
-            
-            # Count functions
-            metrics['function_count'] = len(re.findall(r'\w+\s+\w+\s*\([^)]*\)\s*{', content))
-            
-            # Estimate complexity
-            complexity_patterns = [
-                r'\bif\b', r'\belse\b', r'\bfor\b', r'\bwhile\b',
-                r'\bswitch\b', r'\bgoto\b'
-            ]
-            
-            for pattern in complexity_patterns:
-                metrics['complexity'] += len(re.findall(pattern, content))
-            
-            metrics['debt_score'] = self._calculate_technical_debt(content)
-            metrics['code_blocks'] = self._extract_code_blocks(content)
+    def _iter_source_files(self, repo_path: str) -> Iterator[Tuple[str, str, str, bool]]:
+        """Yield (file name, file path, extension, is test file) for every supported source file, in a stable order"""
+        for root, dirs, files in os.walk(repo_path):
+            # Skip common non-source directories
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.') and d not in 
+                             ['node_modules', '__pycache__', 'venv', 'env', 'build', 'dist', 'target'])
             
-            return metrics
+            relative_root = os.path.relpath(root, repo_path).replace(os.sep, '/')
+            in_test_dir = bool(_TEST_DIR_RE.search(relative_root))
             
-        except Exception as e:
-            logging.warning(f"Error analyzing C/C++ file {file_path}: {str(e)}")
-            return None
+            for file in sorted(files):
+                file_ext = os.path.splitext(file)[1].lower()
+                if file_ext in self.supported_extensions:
+                    yield file, os.path.join(root, file), file_ext, in_test_dir or bool(_TEST_FILE_RE.search(file))
     
-    def _analyze_csharp_file(self, file_path: str) -> Optional[Dict]:
-        """Analyze C# file (simplified analysis)"""
-        return self._analyze_java_file(file_path)  # Similar syntax
+    def _stratum_of(self, repo_path: str, source_file: Tuple[str, str, str, bool]) -> Tuple[str, str]:
+        """Sampling stratum of a source file: its language and top-level directory"""
+        relative_path = os.path.relpath(source_file[1], repo_path)
+        top_dir = relative_path.split(os.sep, 1)[0] if os.sep in relative_path else '.'
+        return source_file[2], top_dir
     
-    def _analyze_go_file(self, file_path: str) -> Optional[Dict]:
-        """Analyze Go file (simplified analysis)"""
+    def _analyze_source_file(self, file_name: str, file_path: str, file_ext: str,
+                             file_index: int) -> Tuple[Optional[Dict], Optional[str], int]:
+        """Analyze one source file unless a size or content guard rejects it
+        
+        Returns:
+            Tuple of (file metrics or None, skip reason or None, file size in bytes)
+        """
+        skip_reason, file_size = self._check_source_file(file_name, file_path, file_index)
+        if skip_reason:
+            return None, skip_reason, file_size
+        return self._analyze_file(file_path, file_ext), None, file_size
+    
+    def _analyze_file(self, file_path: str, file_ext: str) -> Optional[Dict]:
+        """Analyze one source file with the analyser registered for its extension"""
+        analyzer = analyzers.get_analyzer(file_ext)
         try:
             with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
                 content = f.read()
-            
-            metrics = {
-                'lines': len(content.splitlines()),
-                'complexity': 0,
-                'function_count': 0,
-                'class_count': 0,
-                'comment_lines': 0,
-                'debt_score': 0,
-                'code_smells': 0,
-                'functions': [],
-                'code_blocks': []
-            }
-            
-            # Count comments
-            single_comments = len(re.findall(r'//.*', content))
-            multi_comments = len(re.findall(r'/\*.*?\*/', content, re.DOTALL))
-            metrics['comment_lines'] = single_comments + multi_comments
-            
-            # Count functions
-            metrics['function_count'] = len(re.findall(r'func\s+\w+\s*\(', content))
-            
-            # Count structs (Go's equivalent to classes)
-            metrics['class_count'] = len(re.findall(r'type\s+\w+\s+struct', content))
-            
-            # Estimate complexity
-            complexity_patterns = [
-                r'\bif\b', r'\belse\b', r'\bfor\b', r'\bswitch\b',
-                r'\bselect\b', r'\bgo\b'
-            ]
-            
-            for pattern in complexity_patterns:
-                metrics['complexity'] += len(re.findall(pattern, content))
-            
-            metrics['debt_score'] = self._calculate_technical_debt(content)
-            metrics['code_blocks'] = self._extract_code_blocks(content)
-            
-            return metrics
-            
+            return analyzer.analyze(content)
         except Exception as e:
-            logging.warning(f"Error analyzing Go file {file_path}: {str(e)}")
+            logging.warning(f"Error analyzing {analyzer.language} file {file_path}: {str(e)}")
             return None
     
-    def _calculate_function_complexity(self, node: ast.FunctionDef) -> int:
-        """Calculate cyclomatic complexity of a Python function"""
-        complexity = 1  # Base complexity
-        
-        for child in ast.walk(node):
-            if isinstance(child, (ast.If, ast.While, ast.For, ast.AsyncFor)):
-                complexity += 1
-            elif isinstance(child, ast.ExceptHandler):
-                complexity += 1
-            elif isinstance(child, ast.With, ast.AsyncWith):
-                complexity += 1
-            elif isinstance(child, ast.BoolOp):
-                complexity += len(child.values) - 1
-        
-        return complexity
-    
-    def _detect_python_code_smells(self, content: str) -> int:
-        """Detect code smells in Python code"""
-        smells = 0
-        lines = content.splitlines()
-        
-        for line in lines:
-            line = line.strip()
-            # Long lines
-            if len(line) > 120:
-                smells += 1
-            # Too many parameters (simplified check)
-            if 'def ' in line and line.count(',') > 5:
-                smells += 1
-            # Magic numbers
-            if re.search(r'\b\d{2,}\b', line) and 'def ' not in line:
-                smells += 1
-        
-        return smells
-    
-    def _detect_js_code_smells(self, content: str) -> int:
-        """Detect code smells in JavaScript code"""
-        smells = 0
-        lines = content.splitlines()
-        
-        for line in lines:
-            line = line.strip()
-            # Long lines
-            if len(line) > 120:
-                smells += 1
-            # Console.log statements
-            if 'console.log' in line:
-                smells += 1
-            # var usage (should use let/const)
-            if re.match(r'^\s*var\s+', line):
-                smells += 1
-        
-        return smells
-    
-    def _detect_java_code_smells(self, content: str) -> int:
-        """Detect code smells in Java code"""
-        smells = 0
-        lines = content.splitlines()
-        
-        for line in lines:
-            line = line.strip()
-            # Long lines
-            if len(line) > 120:
-                smells += 1
-            # System.out.println statements
-            if 'System.out.println' in line:
-                smells += 1
-        
-        return smells
-    
-    def _calculate_technical_debt(self, content: str) -> int:
-        """Calculate technical debt score based on TODO/FIXME comments"""
-        debt_patterns = [
-            r'TODO', r'FIXME', r'HACK', r'XXX', r'BUG'
-        ]
-        
-        debt_score = 0
-        for pattern in debt_patterns:
-            debt_score += len(re.findall(pattern, content, re.IGNORECASE))
-        
-        return debt_score
-    
-    def _extract_code_blocks(self, content: str) -> List[str]:
-        """Extract code blocks for duplication analysis"""
-        lines = content.splitlines()
-        blocks = []
-        
-        # Extract blocks of 5+ consecutive non-empty lines
-        current_block = []
-        for line in lines:
-            line = line.strip()
-            if line and not line.startswith('#') and not line.startswith('//'):
-                current_block.append(line)
-            else:
-                if len(current_block) >= 5:
-                    blocks.append('\n'.join(current_block))
-                current_block = []
+    def _check_source_file(self, file_name: str, file_path: str, file_index: int) -> Tuple[Optional[str], int]:
+        """Decide whether a source file should be skipped, reading at most SNIFF_BYTES of it
         
-        if len(current_block) >= 5:
-            blocks.append('\n'.join(current_block))
-        
-        return blocks
-    
-    def _calculate_duplication(self, code_blocks: List[str]) -> float:
-        """Calculate code duplication percentage"""
-        if len(code_blocks) < 2:
-            return 0.0
-        
-        duplicates = 0
-        total_comparisons = 0
-        
-        for i in range(len(code_blocks)):
-            for j in range(i + 1, len(code_blocks)):
-                total_comparisons += 1
-                similarity = self._calculate_similarity(code_blocks[i], code_blocks[j])
-                if similarity > 0.8:  # 80% similarity threshold
-                    duplicates += 1
-        
-        return (duplicates / total_comparisons) * 100 if total_comparisons > 0 else 0.0
-    
-    def _calculate_similarity(self, block1: str, block2: str) -> float:
-        """Calculate similarity between two code blocks"""
-        lines1 = set(block1.splitlines())
-        lines2 = set(block2.splitlines())
-        
-        if not lines1 or not lines2:
-            return 0.0
-        
-        intersection = len(lines1.intersection(lines2))
-        union = len(lines1.union(lines2))
-        
-        return intersection / union if union > 0 else 0.0
+        Returns:
+            Tuple of (skip reason or None, file size in bytes)
+        """
+        file_size = os.path.getsize(file_path)
+        
+        # file_index is the position in the stable source file order, so the limit
+        # selects the same files however the work is sharded
+        if file_index >= self.max_files:
+            return 'max_files', file_size
+        if file_size > self.max_file_bytes:
+            return 'too_large', file_size
+        if _SKIPPED_NAME_RE.search(file_name):
+            return 'generated_name', file_size
+        
+        with open(file_path, 'rb') as f:
+            head = f.read(SNIFF_BYTES)
+        
+        if b'\0' in head:
+            return 'binary', file_size
+        
+        text = head.decode('utf-8', errors='ignore')
+        if _GENERATED_MARKER_RE.search(text, 0, GENERATED_MARKER_WINDOW):
+            return 'generated', file_size
+        
+        # A full sniff window without a line break, very long lines or a high average
+        # line length are typical of minified bundles and embedded data blobs
+        lines = text.splitlines()
+        if len(head) == SNIFF_BYTES and len(lines) <= 1:
+            return 'minified', file_size
+        if any(len(line) > self.max_line_length for line in lines):
+            return 'minified', file_size
+        if len(head) == SNIFF_BYTES and len(text) / len(lines) > MINIFIED_AVG_LINE_LENGTH:
+            return 'minified', file_size
+        
+        return None, file_size
     
     def _calculate_maintainability_index(self, metrics: Dict) -> float:
         """Calculate maintainability index (simplified version)"""
@@ -578,31 +543,12 @@ class CodeAnalysisService:
         
         return min(100, mi)
     
-    def _estimate_test_coverage(self, repo_path: str) -> float:
-        """Estimate test coverage based on test files presence"""
-        test_patterns = [
-            r'test.*\.py$', r'.*_test\.py$', r'.*\.test\.js$', r'.*\.spec\.js$',
-            r'.*Test\.java$', r'test.*\.java$', r'.*_test\.go$'
-        ]
-        
-        total_files = 0
-        test_files = 0
-        
-        for root, dirs, files in os.walk(repo_path):
-            dirs[:] = [d for d in dirs if not d.startswith('.')]
-            
-            for file in files:
-                if any(file.endswith(ext) for ext in ['.py', '.js', '.ts', '.java', '.go']):
-                    total_files += 1
-                    
-                    for pattern in test_patterns:
-                        if re.match(pattern, file, re.IGNORECASE):
-                            test_files += 1
-                            break
-        
-        # Rough estimation: assume each test file covers 5 source files
-        estimated_coverage = min(100, (test_files * 5 / max(total_files, 1)) * 100)
-        return estimated_coverage
+    def _estimate_test_coverage(self, metrics: Dict) -> float:
+        """Estimate test coverage from the share of test files among the source files"""
+        source_files = metrics.get('source_files', 0)
+        if not source_files:
+            return 0
+        return min(100, (metrics.get('test_files', 0) * SOURCE_FILES_PER_TEST / source_files) * 100)
     
     def _get_default_metrics(self) -> Dict:
         """Return default metrics when analysis fails"""
@@ -619,5 +565,16 @@ class CodeAnalysisService:
             'function_count': 0,
             'class_count': 0,
             'avg_function_length': 0,
-            'max_function_complexity': 0
+            'max_function_complexity': 0,
+            'skipped_files': 0,
+            'skipped_bytes': 0,
+            'skipped_by_reason': {},
+            'source_files': 0,
+            'test_files': 0,
+            'sampled': False
         }
+
+
+def _analyze_shard_work(config: Dict, work: List) -> Tuple[MetricsAggregate, List]:
+    """Process pool entry point: analyze one shard of work items"""
+    return CodeAnalysisService(**config)._analyze_files(work)
@@ -0,0 +1,210 @@
+import logging
+import os
+import random
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+from typing import Optional, Sequence
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from services.http_cache import ConditionalCache, default_conditional_cache
+from services.rate_limit import TokenPool, default_token_pool, resource_for
+
+# Connection pool and timeouts (seconds) shared by every GitHub call of a process
+DEFAULT_POOL_SIZE = int(os.environ.get('GITHUB_HTTP_POOL_SIZE', '16'))
+DEFAULT_CONNECT_TIMEOUT = float(os.environ.get('GITHUB_CONNECT_TIMEOUT', '5'))
+DEFAULT_READ_TIMEOUT = float(os.environ.get('GITHUB_READ_TIMEOUT', '30'))
+
+# Bounded retries with full-jitter exponential backoff
+DEFAULT_MAX_RETRIES = int(os.environ.get('GITHUB_MAX_RETRIES', '3'))
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_CAP = 8.0
+# Longer Retry-After waits are not slept through; the response is returned instead
+MAX_RETRY_AFTER = 60.0
+
+RETRYABLE_STATUSES = frozenset({500, 502, 503, 504})
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+# Hosts whose unauthenticated requests are sent with a token from the pool
+POOLED_HOSTS = ('api.github.com',)
+
+
+def is_primary_rate_limit(response: requests.Response) -> bool:
+    return response.status_code in (403, 429) and response.headers.get('X-RateLimit-Remaining') == '0'
+
+
+def is_secondary_rate_limit(response: requests.Response) -> bool:
+    """GitHub signals secondary (abuse) rate limits with 403/429 and Retry-After or a message"""
+    if response.status_code not in (403, 429):
+        return False
+    if response.headers.get('Retry-After'):
+        return True
+    if response.headers.get('X-RateLimit-Remaining') == '0':
+        # Primary rate limit: rescheduled by the token pool, otherwise the caller's decision
+        return False
+    try:
+        return 'secondary rate limit' in response.text.lower()
+    except Exception:
+        return False
+
+
+class GitHubClient:
+    """Thread-safe HTTP client for GitHub on one pooled, keep-alive requests.Session
+
+    Every request gets connect/read timeouts. Server errors and secondary rate
+    limits are retried a bounded number of times with jittered backoff (server
+    errors and connection failures only for idempotent methods). Cookies are
+    never stored, so requests made with different users' tokens share nothing
+    but connections.
+    
+    GETs made with conditional=True revalidate a persistent copy of the response
+    with If-None-Match / If-Modified-Since; GitHub answers unchanged resources
+    with a 304 that does not count against the rate limit, and the stored body
+    is returned instead.
+    
+    With a token pool, requests to POOLED_HOSTS that carry no Authorization
+    header are authenticated with the pool token that has the most quota left
+    and paced by its token bucket. A primary rate limit response exhausts that
+    token and the request moves to the next one, waiting for a reset only when
+    the whole pool is exhausted. Pooled requests share conditional cache
+    entries, as the cache key is computed before a token is chosen.
+    """
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE, connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT, max_retries: int = DEFAULT_MAX_RETRIES,
+                 backoff_base: float = DEFAULT_BACKOFF_BASE, backoff_cap: float = DEFAULT_BACKOFF_CAP,
+                 conditional_cache: Optional[ConditionalCache] = None, token_pool: Optional[TokenPool] = None,
+                 pooled_hosts: Sequence[str] = POOLED_HOSTS):
+        self.timeout = (connect_timeout, read_timeout)
+        self.conditional_cache = conditional_cache
+        self.token_pool = token_pool
+        self.pooled_hosts = frozenset(pooled_hosts)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.session = requests.Session()
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=False)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method: str, url: str, idempotent: Optional[bool] = None, **kwargs) -> requests.Response:
+        """Send a request, retrying transient failures; raises requests exceptions after the last attempt
+        
+        idempotent overrides the method's default, e.g. for read-only GraphQL POSTs.
+        """
+        method = method.upper()
+        kwargs.setdefault('timeout', self.timeout)
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        pooled = self._is_pooled(url, kwargs.get('headers'))
+        resource = resource_for(url)
+        headers = kwargs.pop('headers', None)
+        attempt = 0
+        rate_limited = 0
+        while True:
+            token = None
+            if pooled:
+                token = self.token_pool.acquire(resource)
+                headers = dict(headers or {}, Authorization=f'token {token}')
+            try:
+                response = self.session.request(method, url, headers=headers, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logging.warning(f"GitHub {method} {url} failed ({str(e)}), retrying in {delay:.2f}s")
+            else:
+                if token:
+                    self.token_pool.update(token, response, resource)
+                    if is_primary_rate_limit(response) and rate_limited < len(self.token_pool):
+                        # Another token, or the reset of the whole pool, takes the request
+                        self.token_pool.exhaust(token, resource, self._rate_limit_reset(response))
+                        logging.warning(f"GitHub token ...{token[-4:]} exhausted for {resource}, rescheduling")
+                        response.close()
+                        rate_limited += 1
+                        continue
+                delay = self._retry_delay(response, attempt, idempotent)
+                if delay is None:
+                    return response
+                logging.warning(f"GitHub {method} {url} returned {response.status_code}, retrying in {delay:.2f}s")
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+    
+    def _is_pooled(self, url: str, headers: Optional[dict]) -> bool:
+        if self.token_pool is None or urlparse(url).hostname not in self.pooled_hosts:
+            return False
+        return not any(name.lower() == 'authorization' for name in (headers or {}))
+
+    def get(self, url: str, conditional: bool = False, **kwargs) -> requests.Response:
+        if conditional and self.conditional_cache and not kwargs.get('stream'):
+            return self._conditional_get(url, **kwargs)
+        return self.request('GET', url, **kwargs)
+    
+    def _conditional_get(self, url: str, headers: Optional[dict] = None, params=None, **kwargs) -> requests.Response:
+        full_url = requests.Request('GET', url, params=params).prepare().url
+        headers = dict(headers or {})
+        key = self.conditional_cache.key(full_url, headers)
+        validators = self.conditional_cache.validators(key)
+        
+        response = self.request('GET', full_url, headers=dict(headers, **validators), **kwargs)
+        if response.status_code == 304 and validators:
+            cached = self.conditional_cache.cached_response(key, full_url)
+            if cached is not None:
+                return cached
+            # The entry was pruned meanwhile; fetch the body unconditionally
+            response = self.request('GET', full_url, headers=headers, **kwargs)
+        
+        self.conditional_cache.store(key, response)
+        return response
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def _retry_delay(self, response: requests.Response, attempt: int, idempotent: bool) -> Optional[float]:
+        """Seconds to wait before retrying response, or None when it should be returned"""
+        if attempt >= self.max_retries:
+            return None
+        if is_secondary_rate_limit(response):
+            retry_after = self._retry_after(response)
+            if retry_after is None:
+                return self._backoff(attempt)
+            # Jitter keeps throttled workers from retrying in lockstep
+            return retry_after + random.uniform(0, self.backoff_base) if retry_after <= MAX_RETRY_AFTER else None
+        if idempotent and response.status_code in RETRYABLE_STATUSES:
+            return self._backoff(attempt)
+        return None
+
+    def _rate_limit_reset(self, response: requests.Response) -> Optional[float]:
+        try:
+            return float(response.headers['X-RateLimit-Reset'])
+        except (KeyError, ValueError):
+            return None
+
+    def _retry_after(self, response: requests.Response) -> Optional[float]:
+        try:
+            return max(0.0, float(response.headers['Retry-After']))
+        except (KeyError, ValueError):
+            return None
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_github_client() -> GitHubClient:
+    """Process-wide shared client; a forked process builds its own, as sockets must not be shared"""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = GitHubClient(conditional_cache=default_conditional_cache(), token_pool=default_token_pool())
+            _client_pid = os.getpid()
+        return _client
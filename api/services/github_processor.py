@@ -1,21 +1,197 @@
-import requests
 import json
 import os
+import threading
+import time
 from model.repository import RepositoryModel
 from model.metric import MetricModel
 from model.metric_repo import MetricRepoModel
 from db import db
 from nanoid import generate
 import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+from flask import current_app, has_app_context
+from services.archive_cache import default_archive_cache
 from services.code_analysis_service import CodeAnalysisService
+from services.github_client import get_github_client
+from services.instrumentation import StageTimer, emit_stages
+from services.single_flight import SharedAnalyses, SingleFlight
+
+# Code quality metrics produced by CodeAnalysisService and stored as a
+# per-repository snapshot alongside the last analysed commit SHA
+CODE_METRIC_KEYS = (
+    'cyclomatic_complexity',
+    'code_duplication',
+    'technical_debt',
+    'test_coverage',
+    'maintainability_index',
+    'code_smells',
+    'comment_ratio',
+    'avg_function_length',
+    'max_function_complexity'
+)
+
+# Concurrent metadata requests plus the overlapping code analysis
+METADATA_WORKERS = 6
+
+# Repositories per GraphQL metadata query; each costs about one point of the rate limit
+GRAPHQL_URL = 'https://api.github.com/graphql'
+GRAPHQL_BATCH_SIZE = int(os.environ.get('GITHUB_GRAPHQL_BATCH_SIZE', '50'))
+
+_REPOSITORY_FIELDS = """
+    stargazerCount
+    forkCount
+    description
+    createdAt
+    updatedAt
+    pushedAt
+    primaryLanguage { name }
+    issues(states: OPEN) { totalCount }
+    pullRequests(states: OPEN) { totalCount }
+    languages(first: 100, orderBy: {field: SIZE, direction: DESC}) {
+      totalSize
+      edges { size node { name } }
+    }
+    defaultBranchRef {
+      target { ... on Commit { oid history { totalCount } } }
+    }
+"""
+
+
+def _build_metadata_query(repos):
+    """GraphQL query with one aliased repository field (r0, r1, ...) per (owner, repo) pair"""
+    declarations = []
+    fields = []
+    variables = {}
+    for index, (owner, repo) in enumerate(repos):
+        declarations.append(f"$o{index}: String!, $n{index}: String!")
+        fields.append(f"r{index}: repository(owner: $o{index}, name: $n{index}) {{{_REPOSITORY_FIELDS}}}")
+        variables[f"o{index}"] = owner
+        variables[f"n{index}"] = repo
+    query = f"query({', '.join(declarations)}) {{\n" + "\n".join(fields) + "\n}"
+    return query, variables
+
+
+def parse_github_time(value):
+    """Local naive datetime, like the ones stored elsewhere, of a GitHub ISO 8601 UTC timestamp, or None"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).astimezone().replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def _metadata_from_graphql(node):
+    """Repository metadata in the shape of the REST path from one GraphQL repository node"""
+    target = (node.get('defaultBranchRef') or {}).get('target') or {}
+    languages = node.get('languages') or {}
+    return {
+        'language': (node.get('primaryLanguage') or {}).get('name'),
+        'languages': {edge['node']['name']: edge['size'] for edge in languages.get('edges', [])},
+        'loc': languages.get('totalSize', 0),
+        'stars': node.get('stargazerCount', 0),
+        'forks': node.get('forkCount', 0),
+        # Like the REST open_issues_count, open pull requests count as issues
+        'open_issues': node['issues']['totalCount'] + node['pullRequests']['totalCount'],
+        'commits': (target.get('history') or {}).get('totalCount', 0),
+        'description': node.get('description') or '',
+        'created_at': node.get('createdAt', ''),
+        'updated_at': node.get('updatedAt', ''),
+        'pushed_at': node.get('pushedAt', ''),
+        'head_sha': target.get('oid')
+    }
+
+# Metric name keyword -> key of get_repo_metrics' result stored for the metric;
+# the first keyword found in a metric's lower-cased name wins, others store 0
+METRIC_FIELDS = (
+    ('stars', 'stars'),
+    ('forks', 'forks'),
+    ('open issues', 'open_issues'),
+    ('contributors', 'contributors'),
+    ('commits', 'commits'),
+    ('cyclomatic complexity', 'cyclomatic_complexity'),
+    ('code duplication', 'code_duplication'),
+    ('technical debt', 'technical_debt'),
+    ('test coverage', 'test_coverage'),
+    ('maintainability index', 'maintainability_index'),
+    ('code smells', 'code_smells'),
+    ('comment ratio', 'comment_ratio'),
+    ('average function length', 'avg_function_length'),
+    ('maximum function complexity', 'max_function_complexity')
+)
+
+# The metric table changes only when scripts add metrics; its mapping is reloaded this often
+METRIC_MAPPING_CACHE_SECONDS = float(os.environ.get('METRIC_MAPPING_CACHE_SECONDS', '300'))
+
+
+class MetricFieldMapping:
+    """(metric id, field) of every metric of the metric table, resolved once and cached
+
+    field is the key of get_repo_metrics' result whose value the metric stores,
+    or None for metrics nothing is collected for.
+    """
+
+    def __init__(self, ttl: float = METRIC_MAPPING_CACHE_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._mapping = None
+        self._loaded = 0.0
+
+    @staticmethod
+    def field_for(metric_name: str):
+        name = metric_name.lower()
+        return next((field for keyword, field in METRIC_FIELDS if keyword in name), None)
+
+    def get(self):
+        with self._lock:
+            if self._mapping is None or time.monotonic() - self._loaded > self.ttl:
+                self._mapping = [(metric.id, self.field_for(metric.name)) for metric in MetricModel.get_all_metrics()]
+                self._loaded = time.monotonic()
+            return self._mapping
+
+    def invalidate(self):
+        with self._lock:
+            self._mapping = None
+
+
+# Shared by every processor of the process
+_metric_fields = MetricFieldMapping()
+
+
+def metric_values(metrics, collected_only=False):
+    """(metric id, value) of every metric of the metric table for a get_repo_metrics result
+
+    Metrics nothing is collected for get 0, or are left out with collected_only.
+    """
+    return [
+        (metric_id, float(metrics[field]) if field else 0.0)
+        for metric_id, field in _metric_fields.get()
+        if field or not collected_only
+    ]
+
+# Concurrent additions of one repository to one dataset in this process
+_additions = SingleFlight()
 
 class GitHubProcessor:
-    def __init__(self):
+    def __init__(self, client=None, use_graphql=None):
         self.github_token = os.environ.get('GITHUB_TOKEN', '')
+        # Any object with get/post like GitHubClient, e.g. a recorded-response stub
+        self.client = client or get_github_client()
+        # With a token pool the client authenticates every request itself, spreading them over the tokens
+        self.pooled = getattr(self.client, 'token_pool', None) is not None
+        self.authenticated = self.pooled or bool(self.github_token)
         self.headers = {}
-        if self.github_token:
+        if self.github_token and not self.pooled:
             self.headers['Authorization'] = f'token {self.github_token}'
-        self.code_analyzer = CodeAnalysisService()
+        if use_graphql is None:
+            # GraphQL needs a token, and is used whenever one is configured unless turned off
+            use_graphql = os.environ.get('GITHUB_USE_GRAPHQL', '').lower() != 'false'
+        self.use_graphql = use_graphql and self.authenticated
+        self.code_analyzer = CodeAnalysisService(archive_cache=default_archive_cache())
+        # Analyses of a commit are shared through the database when there is an app to reach it
+        self.analyses = SharedAnalyses(current_app._get_current_object() if has_app_context() else None)
         
     def extract_repo_info(self, repo_url):
         """Extract owner and repo name from GitHub URL"""
@@ -32,73 +208,233 @@ class GitHubProcessor:
         
         return owner, repo
     
-    def get_repo_metrics(self, owner, repo):
-        """Fetch repository metrics from GitHub API"""
+    def _get(self, url, timer=None, stage='metadata', **kwargs):
+        """Conditional GET of url with the API headers, counting requests and bytes into a timer stage
+        
+        Unchanged resources are served from the client's ETag cache after a 304,
+        which is counted as not_modified instead of bytes.
+        """
+        kwargs.setdefault('headers', self.headers)
+        response = self.client.get(url, conditional=True, **kwargs)
+        if timer is not None:
+            if getattr(response, 'from_cache', False):
+                timer.add(stage, requests=1, not_modified=1)
+            else:
+                timer.add(stage, requests=1, bytes=len(response.content))
+        return response
+    
+    def get_head_sha(self, owner, repo, ref='HEAD', timer=None):
+        """Return the commit SHA that ref points to, or None if it cannot be resolved.
+        
+        Uses the `application/vnd.github.sha` media type so GitHub answers with the
+        bare 40-character SHA instead of the full commit payload. The default ref
+        HEAD resolves to the head of the default branch.
+        """
+        sha_url = f"https://api.github.com/repos/{owner}/{repo}/commits/{ref}"
+        headers = dict(self.headers, Accept='application/vnd.github.sha')
+        response = self._get(sha_url, timer, headers=headers)
+        if response.status_code != 200:
+            return None
+        return response.text.strip() or None
+    
+    def _count_listing(self, response):
+        """Total number of items of a per_page=1 listing: the number of its last page"""
+        if response.status_code != 200:
+            return 0
+        last = response.links.get('last')
+        if last:
+            page = parse_qs(urlparse(last['url']).query).get('page')
+            if page:
+                return int(page[0])
+        return len(response.json() or [])
+    
+    def _fetch_rest_metadata(self, owner, repo, timer, pool, on_head_sha, head_sha=None):
+        """Fetch repository metadata through concurrent REST calls
+        
+        on_head_sha(sha) is called as soon as the head commit is resolved, before
+        the remaining calls complete; with sha None (e.g. an empty repository)
+        only once the repository is known to exist. A head_sha the caller already
+        resolved is used instead of requesting it again.
+        """
+        api_url = f"https://api.github.com/repos/{owner}/{repo}"
+        head_future = None if head_sha else pool.submit(self.get_head_sha, owner, repo, 'HEAD', timer)
+        repo_future = pool.submit(self._get, api_url, timer)
+        languages_future = pool.submit(self._get, f"{api_url}/languages", timer)
+        commits_future = pool.submit(self._get, f"{api_url}/commits", timer, params={'per_page': 1})
+        
+        if head_future:
+            head_sha = head_future.result()
+        if head_sha:
+            on_head_sha(head_sha)
+        
+        # Get basic repository info
+        response = repo_future.result()
+        if response.status_code == 404:
+            raise ValueError(f"Repository {owner}/{repo} not found")
+        elif response.status_code != 200:
+            raise ValueError(f"GitHub API error: {response.status_code}")
+        repo_data = response.json()
+        
+        if not head_sha:
+            on_head_sha(None)
+        
+        languages_response = languages_future.result()
+        languages = languages_response.json() if languages_response.status_code == 200 else {}
+        
+        return {
+            'language': repo_data.get('language', 'Unknown'),
+            'languages': languages,
+            'loc': sum(languages.values()) if languages else 0,
+            'stars': repo_data.get('stargazers_count', 0),
+            'forks': repo_data.get('forks_count', 0),
+            'open_issues': repo_data.get('open_issues_count', 0),
+            # The number of the last page of a per_page=1 listing is the commit count
+            'commits': self._count_listing(commits_future.result()),
+            'description': repo_data.get('description', ''),
+            'created_at': repo_data.get('created_at', ''),
+            'updated_at': repo_data.get('updated_at', ''),
+            'pushed_at': repo_data.get('pushed_at', ''),
+            'head_sha': head_sha
+        }
+    
+    def get_contributors_count(self, owner, repo, timer=None):
+        """Number of contributors, from the last page of a per_page=1 listing"""
+        contributors_url = f"https://api.github.com/repos/{owner}/{repo}/contributors"
+        return self._count_listing(self._get(contributors_url, timer, params={'per_page': 1}))
+    
+    def fetch_metadata_batch(self, repos, timer=None):
+        """Fetch metadata of many repositories through GitHub GraphQL, GRAPHQL_BATCH_SIZE per query
+        
+        Args:
+            repos: Iterable of (owner, repo) pairs
+            timer: Optional StageTimer whose 'metadata' stage counts the requests
+            
+        Returns:
+            Dictionary keyed by lower-case "owner/repo" with the metadata of each
+            repository found, in the shape get_repo_metrics accepts as metadata.
+            Repositories that do not exist or are not visible are left out.
+            
+        Raises:
+            ValueError: If no token is configured (GraphQL requires one) or the API fails
+        """
+        if not self.authenticated:
+            raise ValueError("GitHub GraphQL API requires GITHUB_TOKEN or GITHUB_TOKENS")
+        
+        repos = list(repos)
+        results = {}
+        for start in range(0, len(repos), GRAPHQL_BATCH_SIZE):
+            batch = repos[start:start + GRAPHQL_BATCH_SIZE]
+            query, variables = _build_metadata_query(batch)
+            response = self.client.post(GRAPHQL_URL, headers=self.headers,
+                                        json={'query': query, 'variables': variables}, idempotent=True)
+            if timer is not None:
+                timer.add('metadata', requests=1, bytes=len(response.content))
+            if response.status_code != 200:
+                raise ValueError(f"GitHub GraphQL error: {response.status_code}")
+            
+            payload = response.json()
+            data = payload.get('data') or {}
+            for error in payload.get('errors') or []:
+                if error.get('type') != 'NOT_FOUND':
+                    raise ValueError(f"GitHub GraphQL error: {error.get('message')}")
+            
+            for index, (owner, repo) in enumerate(batch):
+                node = data.get(f"r{index}")
+                if node:
+                    results[f"{owner}/{repo}".lower()] = _metadata_from_graphql(node)
+        return results
+    
+    def _analyze_code(self, owner, repo, head_sha, timer):
+        """Run the code analysis of owner/repo at head_sha, never raising"""
+        try:
+            code_metrics = self.code_analyzer.analyze_repository(
+                owner, repo, None if self.pooled else self.github_token, timer=timer, commit_sha=head_sha)
+            logging.info(f"Code analysis completed for {owner}/{repo}")
+        except Exception as e:
+            logging.warning(f"Code analysis failed for {owner}/{repo}: {str(e)}")
+            code_metrics = self.code_analyzer._get_default_metrics()
+            code_metrics['analysis_failed'] = True
+        return code_metrics
+    
+    def _analyze_shared(self, owner, repo, head_sha, timer):
+        """Code metrics of owner/repo at head_sha and whether they come from another caller's analysis"""
+        return self.analyses.analyze(owner, repo, head_sha, lambda: self._analyze_code(owner, repo, head_sha, timer))
+    
+    def get_repo_metrics(self, owner, repo, last_commit_sha=None, cached_code_metrics=None, metadata=None,
+                         progress=None, head_sha=None):
+        """Fetch repository metrics from GitHub API
+        
+        Metadata comes from, in order of preference, the metadata argument (one
+        entry of fetch_metadata_batch), a GraphQL query when use_graphql is set,
+        or concurrent REST calls. The code analysis (zipball download included)
+        starts as soon as the head commit is known, overlapping the remaining
+        metadata calls. head_sha, when the caller already resolved it with
+        get_head_sha, saves the REST path that request.
+        
+        When the head of the default branch still matches last_commit_sha and a
+        cached_code_metrics snapshot is given, the snapshot is reused instead of
+        downloading and analysing the source again. Otherwise concurrent callers
+        analysing the same commit share one analysis, and a commit analysed
+        before, for any dataset, reuses its stored metrics (see SharedAnalyses).
+        
+        Wall time, bytes and request counts of the API calls and of each analysis
+        stage are returned under 'stages' and emitted to the metrics sink.
+        progress(stage, details) is called as stages start and advance (see
+        StageTimer).
+        """
+        timer = StageTimer(on_progress=progress)
         try:
-            # Get basic repository info
-            repo_url = f"https://api.github.com/repos/{owner}/{repo}"
-            response = requests.get(repo_url, headers=self.headers)
-            
-            if response.status_code == 404:
-                raise ValueError(f"Repository {owner}/{repo} not found")
-            elif response.status_code != 200:
-                raise ValueError(f"GitHub API error: {response.status_code}")
-            
-            repo_data = response.json()
-            
-            # Get languages data
-            languages_url = f"https://api.github.com/repos/{owner}/{repo}/languages"
-            languages_response = requests.get(languages_url, headers=self.headers)
-            languages_data = languages_response.json() if languages_response.status_code == 200 else {}
-            
-            # Calculate lines of code (sum of all languages)
-            loc = sum(languages_data.values()) if languages_data else 0
-            
-            # Get primary language
-            primary_language = repo_data.get('language', 'Unknown')
-            
-            # Get contributors count
-            contributors_url = f"https://api.github.com/repos/{owner}/{repo}/contributors"
-            contributors_response = requests.get(contributors_url, headers=self.headers)
-            contributors_count = len(contributors_response.json()) if contributors_response.status_code == 200 else 0
-            
-            # Get commits count (approximate from default branch)
-            commits_url = f"https://api.github.com/repos/{owner}/{repo}/commits"
-            commits_response = requests.get(commits_url, headers=self.headers, params={'per_page': 1})
-            commits_count = 0
-            if commits_response.status_code == 200:
-                # Try to get total count from Link header
-                link_header = commits_response.headers.get('Link', '')
-                if 'last' in link_header:
-                    try:
-                        last_page = link_header.split('page=')[-1].split('&')[0].split('>')[0]
-                        commits_count = int(last_page) * 30  # Approximate
-                    except:
-                        commits_count = 100  # Default estimate
+            with ThreadPoolExecutor(max_workers=METADATA_WORKERS) as pool:
+                analysis = {}
+                
+                def start_analysis(head_sha):
+                    analysis['head_sha'] = head_sha
+                    # Unchanged repositories reuse their snapshot instead
+                    if not (head_sha and head_sha == last_commit_sha and cached_code_metrics):
+                        analysis['future'] = pool.submit(self._analyze_shared, owner, repo, head_sha, timer)
+                
+                with timer.stage('metadata'):
+                    # GraphQL has no contributor count, so this stays a REST call
+                    contributors_future = pool.submit(self.get_contributors_count, owner, repo, timer)
+                    
+                    if metadata is None and self.use_graphql and self.authenticated:
+                        metadata = self.fetch_metadata_batch([(owner, repo)], timer).get(f"{owner}/{repo}".lower())
+                        if metadata is None:
+                            raise ValueError(f"Repository {owner}/{repo} not found")
+                    
+                    if metadata is not None:
+                        start_analysis(metadata['head_sha'])
+                    else:
+                        metadata = self._fetch_rest_metadata(owner, repo, timer, pool, start_analysis, head_sha)
+                    
+                    contributors_count = contributors_future.result()
+                
+                # Get advanced code quality metrics
+                head_sha = analysis['head_sha']
+                code_metrics_reused = 'future' not in analysis
+                if code_metrics_reused:
+                    code_metrics = cached_code_metrics
+                    logging.info(f"Commit {head_sha} of {owner}/{repo} already analysed, reusing code metrics")
                 else:
-                    commits_count = len(commits_response.json()) if commits_response.json() else 0
+                    code_metrics, code_metrics_reused = analysis['future'].result()
             
-            # Get advanced code quality metrics
-            try:
-                code_metrics = self.code_analyzer.analyze_repository(owner, repo, self.github_token)
-                logging.info(f"Code analysis completed for {owner}/{repo}")
-            except Exception as e:
-                logging.warning(f"Code analysis failed for {owner}/{repo}: {str(e)}")
-                code_metrics = self.code_analyzer._get_default_metrics()
+            # Only remember the commit when its metrics are worth reusing
+            analysis_ok = not code_metrics.get('analysis_failed')
             
             # Combine basic and advanced metrics
             metrics = {
                 'name': f"{owner}/{repo}",
-                'language': primary_language,
-                'loc': loc,
-                'stars': repo_data.get('stargazers_count', 0),
-                'forks': repo_data.get('forks_count', 0),
-                'open_issues': repo_data.get('open_issues_count', 0),
+                'language': metadata['language'],
+                'loc': metadata['loc'],
+                'stars': metadata['stars'],
+                'forks': metadata['forks'],
+                'open_issues': metadata['open_issues'],
                 'contributors': contributors_count,
-                'commits': commits_count,
-                'description': repo_data.get('description', ''),
-                'created_at': repo_data.get('created_at', ''),
-                'updated_at': repo_data.get('updated_at', ''),
+                'commits': metadata['commits'],
+                'description': metadata['description'],
+                'created_at': metadata['created_at'],
+                'updated_at': metadata['updated_at'],
+                'pushed_at': metadata.get('pushed_at', ''),
                 # Advanced metrics
                 'cyclomatic_complexity': code_metrics.get('cyclomatic_complexity', 0),
                 'code_duplication': code_metrics.get('code_duplication', 0),
@@ -108,7 +444,12 @@ class GitHubProcessor:
                 'code_smells': code_metrics.get('code_smells', 0),
                 'comment_ratio': code_metrics.get('comment_ratio', 0),
                 'avg_function_length': code_metrics.get('avg_function_length', 0),
-                'max_function_complexity': code_metrics.get('max_function_complexity', 0)
+                'max_function_complexity': code_metrics.get('max_function_complexity', 0),
+                # Snapshot used to skip analysis when the commit has not changed
+                'commit_sha': head_sha if analysis_ok else None,
+                'code_metrics': {key: code_metrics.get(key, 0) for key in CODE_METRIC_KEYS} if analysis_ok else None,
+                'code_metrics_reused': code_metrics_reused,
+                'stages': timer.as_dict()
             }
             
             return metrics
@@ -116,13 +457,31 @@ class GitHubProcessor:
         except Exception as e:
             logging.error(f"Error fetching metrics for {owner}/{repo}: {str(e)}")
             raise
+        finally:
+            emit_stages(f"{owner}/{repo}", timer.as_dict())
     
-    def add_repository_to_dataset(self, dataset_id, repo_url, submitter_name):
-        """Process and add repository to dataset"""
+    def add_repository_to_dataset(self, dataset_id, repo_url, submitter_name, progress=None, metadata=None):
+        """Process and add repository to dataset
+        
+        Concurrent additions of the same repository to the same dataset in this
+        process run once, and the other callers get the repository it created.
+        progress(stage, details) follows the collection of metrics (see
+        get_repo_metrics) and then the 'persist' stage. metadata, one entry of
+        fetch_metadata_batch, saves the metadata requests.
+        """
+        # Extract repository info
+        owner, repo = self.extract_repo_info(repo_url)
+        name = f"{owner}/{repo}"
+        
+        repository, shared = _additions.do(f"{dataset_id}:{name}".lower(),
+                                           lambda: self._add_repository(dataset_id, owner, repo, progress, metadata))
+        if shared:
+            # The instance belongs to the session of the caller that created it
+            return RepositoryModel.find_repository_by_name(dataset_id, name)
+        return repository
+    
+    def _add_repository(self, dataset_id, owner, repo, progress=None, metadata=None):
         try:
-            # Extract repository info
-            owner, repo = self.extract_repo_info(repo_url)
-            
             # Check if repository already exists
             existing_repo = RepositoryModel.find_repository_by_name(dataset_id, f"{owner}/{repo}")
             if existing_repo:
@@ -130,7 +489,16 @@ class GitHubProcessor:
                 return existing_repo
             
             # Get metrics from GitHub
-            metrics = self.get_repo_metrics(owner, repo)
+            metrics = self.get_repo_metrics(owner, repo, metadata=metadata, progress=progress)
+            
+            # Another process may have added it while the metrics were collected
+            existing_repo = RepositoryModel.find_repository_by_name(dataset_id, f"{owner}/{repo}")
+            if existing_repo:
+                logging.info(f"Repository {owner}/{repo} was added to dataset {dataset_id} concurrently")
+                return existing_repo
+            
+            if progress:
+                progress('persist', {})
             
             # Create repository record
             repo_id = generate(size=10)
@@ -146,50 +514,19 @@ class GitHubProcessor:
                 contributors=metrics['contributors'],
                 commits=metrics['commits']
             )
+            repository.last_commit_sha = metrics['commit_sha']
+            repository.set_code_metrics(metrics['code_metrics'])
+            repository.pushed_at = parse_github_time(metrics['pushed_at'])
+            repository.last_refreshed_at = datetime.now()
             
             # Save repository
             db.session.add(repository)
             db.session.flush()  # Ensure repo is saved before metrics
             
-            # Get all available metrics
-            available_metrics = MetricModel.get_all_metrics()
-            
-            # Create metric records for all available metrics
-            metric_mapping = {
-                'stars': metrics['stars'],
-                'forks': metrics['forks'], 
-                'open issues': metrics['open_issues'],
-                'contributors': metrics['contributors'],
-                'commits': metrics['commits'],
-                'cyclomatic complexity': metrics['cyclomatic_complexity'],
-                'code duplication': metrics['code_duplication'],
-                'technical debt': metrics['technical_debt'],
-                'test coverage': metrics['test_coverage'],
-                'maintainability index': metrics['maintainability_index'],
-                'code smells': metrics['code_smells'],
-                'comment ratio': metrics['comment_ratio'],
-                'average function length': metrics['avg_function_length'],
-                'maximum function complexity': metrics['max_function_complexity']
-            }
-            
-            for metric in available_metrics:
-                metric_name_lower = metric.name.lower()
-                value = 0
-                
-                # Map the metrics we can extract from GitHub and code analysis
-                for key, val in metric_mapping.items():
-                    if key in metric_name_lower:
-                        value = val
-                        break
-                
-                # Create metric record
-                metric_repo = MetricRepoModel(
-                    id=generate(size=10),
-                    id_metric=metric.id,
-                    id_repo=repo_id,
-                    value=float(value)
-                )
-                db.session.add(metric_repo)
+            # One row per metric of the metric table, written in a single executemany
+            MetricRepoModel.bulk_insert([
+                (metric_id, repo_id, value) for metric_id, value in metric_values(metrics)
+            ])
             
             # Commit all changes
             db.session.commit()
@@ -0,0 +1,40 @@
+import logging
+import threading
+from typing import Callable
+
+from db import db
+
+
+class Heartbeat:
+    """Calls beat() every interval seconds from a background thread until the block exits
+
+    beat runs inside its own app context and database session, so a lease
+    (a running job, an in-flight analysis) stays fresh while the owning thread
+    is busy with slow work.
+    """
+
+    def __init__(self, app, interval: float, beat: Callable[[], None], name: str = 'heartbeat'):
+        self.app = app
+        self.interval = interval
+        self.beat = beat
+        self.name = name
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name=name)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        with self.app.app_context():
+            while not self._stop.wait(self.interval):
+                try:
+                    self.beat()
+                except Exception as e:
+                    db.session.rollback()
+                    logging.warning(f"{self.name} failed: {str(e)}")
+            db.session.remove()
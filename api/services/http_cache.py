@@ -0,0 +1,128 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+
+# Location of the validator cache and how long unused entries are kept; an empty path disables it
+DEFAULT_ETAG_CACHE_PATH = os.environ.get(
+    'GITHUB_ETAG_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'healthyenv-github-etags.sqlite3'))
+DEFAULT_ETAG_CACHE_MAX_AGE_DAYS = int(os.environ.get('GITHUB_ETAG_CACHE_MAX_AGE_DAYS', '30'))
+
+# Response headers kept with a cached body; Link carries the pagination counts are read from
+_STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Link')
+
+
+class ConditionalCache:
+    """Persistent store of GitHub GET responses and their validators (ETag / Last-Modified)
+
+    The cache key covers the URL with its query, the Accept header and a hash of
+    the Authorization header, so responses are never shared across tokens that
+    may see different content. Entries unused for max_age_days are pruned when
+    the cache is opened. SQLite makes the file safe to share between processes.
+    """
+
+    def __init__(self, path: str = DEFAULT_ETAG_CACHE_PATH, max_age_days: int = DEFAULT_ETAG_CACHE_MAX_AGE_DAYS):
+        self.path = path
+        self.not_modified = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            ' key TEXT PRIMARY KEY, url TEXT NOT NULL, etag TEXT, last_modified TEXT,'
+            ' headers TEXT NOT NULL, body BLOB NOT NULL, used_at REAL NOT NULL)'
+        )
+        self._connection.execute('DELETE FROM responses WHERE used_at < ?', (time.time() - max_age_days * 86400,))
+
+    @staticmethod
+    def key(url: str, headers: Dict) -> str:
+        authorization = headers.get('Authorization', '')
+        parts = (
+            url,
+            headers.get('Accept', ''),
+            hashlib.sha256(authorization.encode('utf-8')).hexdigest() if authorization else ''
+        )
+        return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+    def validators(self, key: str) -> Dict:
+        """Conditional request headers for a cached entry, empty when there is none"""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT etag, last_modified FROM responses WHERE key = ?', (key,)).fetchone()
+        if not row:
+            return {}
+        etag, last_modified = row
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def cached_response(self, key: str, url: str) -> Optional[requests.Response]:
+        """Rebuild the cached 200 response after a 304, marking the entry as used"""
+        with self._lock:
+            row = self._connection.execute('SELECT headers, body FROM responses WHERE key = ?', (key,)).fetchone()
+            if row:
+                self._connection.execute('UPDATE responses SET used_at = ? WHERE key = ?', (time.time(), key))
+        if not row:
+            return None
+        with self._lock:
+            self.not_modified += 1
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.headers.update(json.loads(row[0]))
+        response._content = row[1]
+        response.from_cache = True
+        return response
+
+    def store(self, key: str, response: requests.Response):
+        """Keep a 200 response that carries a validator"""
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        with self._lock:
+            self.misses += 1
+        if response.status_code != 200 or not (etag or last_modified):
+            return
+        headers = {name: response.headers[name] for name in _STORED_HEADERS if name in response.headers}
+        try:
+            with self._lock:
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO responses (key, url, etag, last_modified, headers, body, used_at)'
+                    ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (key, response.url, etag, last_modified, json.dumps(headers), response.content, time.time())
+                )
+        except sqlite3.Error as e:
+            logging.warning(f"Could not cache response of {response.url}: {str(e)}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = self._connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+            requests_made = self.not_modified + self.misses
+            return {
+                'path': self.path,
+                'entries': entries,
+                'not_modified': self.not_modified,
+                'misses': self.misses,
+                'hit_rate': self.not_modified / requests_made if requests_made else 0.0
+            }
+
+
+def default_conditional_cache() -> Optional[ConditionalCache]:
+    """Validator cache configured from the environment, or None when disabled or unusable"""
+    if not DEFAULT_ETAG_CACHE_PATH:
+        return None
+    try:
+        return ConditionalCache()
+    except sqlite3.Error as e:
+        logging.warning(f"GitHub ETag cache disabled, cannot open {DEFAULT_ETAG_CACHE_PATH}: {str(e)}")
+        return None
@@ -0,0 +1,117 @@
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+# Receives (subject, stages) for every finished analysis; see set_metrics_sink
+_metrics_sink: Optional[Callable[[str, Dict], None]] = None
+
+
+def set_metrics_sink(sink: Optional[Callable[[str, Dict], None]]):
+    """Route stage metrics to sink(subject, stages) instead of the root logger"""
+    global _metrics_sink
+    _metrics_sink = sink
+
+
+def emit_stages(subject: str, stages: Dict):
+    """Publish the stage metrics of one analysis to the configured sink"""
+    if _metrics_sink:
+        try:
+            _metrics_sink(subject, stages)
+        except Exception as e:
+            logging.warning(f"Metrics sink failed for {subject}: {str(e)}")
+    else:
+        logging.info(f"Analysis stages for {subject}: {json.dumps(stages, sort_keys=True)}")
+
+
+@contextmanager
+def memory_tracing(enabled: bool):
+    """Trace allocations for the duration of the block, unless tracing is already on"""
+    started = enabled and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        yield
+    finally:
+        if started:
+            tracemalloc.stop()
+
+
+class StageTimer:
+    """Wall time, bytes, files and (when tracemalloc is on) peak memory of each stage of one analysis
+
+    Stages may nest; a stage entered more than once accumulates its totals.
+    Stages may run in several threads at once (nesting is tracked per thread),
+    but the tracemalloc peak is process-wide, so peaks of concurrent stages
+    overlap.
+
+    on_progress(stage, details) is called, from whichever thread does the work,
+    when a stage starts and whenever the pipeline reports progress within one
+    (bytes received, files analysed, ...); it must be cheap and thread-safe.
+    """
+
+    def __init__(self, on_progress: Optional[Callable[[str, Dict], None]] = None):
+        self.stages = {}
+        self.on_progress = on_progress
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def _open(self):
+        if not hasattr(self._local, 'open'):
+            self._local.open = []
+        return self._local.open
+
+    def _record(self, name: str) -> Dict:
+        with self._lock:
+            return self.stages.setdefault(name, {'seconds': 0.0, 'bytes': 0, 'files': 0})
+
+    @contextmanager
+    def stage(self, name: str):
+        record = self._record(name)
+        self.report(name)
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            # Keep the peak seen so far by enclosing stages before it is reset
+            self._record_peak(tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self._open.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            self._open.pop()
+            self.add(name, seconds=time.perf_counter() - start)
+            if tracing and tracemalloc.is_tracing():
+                peak = tracemalloc.get_traced_memory()[1]
+                with self._lock:
+                    record['peak_memory_bytes'] = max(record.get('peak_memory_bytes', 0), peak)
+                self._record_peak(peak)
+
+    def add(self, name: str, **amounts):
+        """Add amounts (bytes, files, requests, ...) to a stage; safe to call from any thread"""
+        record = self._record(name)
+        with self._lock:
+            for key, amount in amounts.items():
+                record[key] = record.get(key, 0) + amount
+
+    def report(self, stage: str, **details):
+        """Pass progress within a stage to the on_progress callback, if any"""
+        if self.on_progress is None:
+            return
+        try:
+            self.on_progress(stage, details)
+        except Exception as e:
+            logging.warning(f"Progress callback failed for stage {stage}: {str(e)}")
+
+    def _record_peak(self, peak: int):
+        with self._lock:
+            for record in self._open:
+                record['peak_memory_bytes'] = max(record.get('peak_memory_bytes', 0), peak)
+
+    def as_dict(self) -> Dict:
+        with self._lock:
+            return {name: dict(record) for name, record in self.stages.items()}
@@ -0,0 +1,79 @@
+import logging
+import queue
+import threading
+import time
+from typing import Dict, List, Optional
+
+from db import db
+from model.job import JobModel
+
+
+class JobEventHub:
+    """Watches the jobs that event streams follow and hands their changes to the streams
+
+    One background thread per process loads every watched job in a single query
+    each interval, and puts the job (as returned by to_dict) on the queue of each
+    subscriber whose job changed, or None once the job no longer exists. Streams
+    only wait on their queue, so the database sees one query per interval however
+    many streams are open.
+    """
+
+    def __init__(self, app, interval: float, name: str = 'job-events'):
+        self.app = app
+        self.interval = interval
+        self.name = name
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, List[queue.Queue]] = {}
+        # Last state sent per watched job, so only changes are handed out
+        self._states: Dict[str, dict] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, job_id: str) -> queue.Queue:
+        """Queue receiving each new state of job_id; call unsubscribe when done with it"""
+        subscriber = queue.Queue()
+        with self._lock:
+            self._subscribers.setdefault(job_id, []).append(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name=self.name)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, job_id: str, subscriber: queue.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(job_id, [])
+            if subscriber in subscribers:
+                subscribers.remove(subscriber)
+            if not subscribers:
+                self._subscribers.pop(job_id, None)
+                self._states.pop(job_id, None)
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                # Subscribers read the job themselves when subscribing, so the first poll can wait
+                time.sleep(self.interval)
+                try:
+                    self.poll()
+                except Exception as e:
+                    logging.warning(f"{self.name} failed: {str(e)}")
+                finally:
+                    # End the transaction so the workers' updates become visible, and give the connection back
+                    db.session.remove()
+
+    def poll(self):
+        """Load the watched jobs and hand out the ones that changed since the last poll"""
+        with self._lock:
+            job_ids = list(self._subscribers)
+        if not job_ids:
+            return
+        states = {job.id: job.to_dict() for job in JobModel.query.filter(JobModel.id.in_(job_ids)).all()}
+        with self._lock:
+            for job_id in job_ids:
+                state = states.get(job_id)
+                if job_id not in self._subscribers:
+                    continue
+                if job_id in self._states and state == self._states[job_id]:
+                    continue
+                self._states[job_id] = state
+                for subscriber in self._subscribers.get(job_id, ()):
+                    subscriber.put(state)
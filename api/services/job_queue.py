@@ -0,0 +1,325 @@
+"""
+Database-backed job queue for work too slow for an HTTP request
+
+Jobs are rows of the job table. Worker processes claim them one at a time,
+keep a heartbeat while running them and record the result, so queued work
+survives restarts and a job whose worker died is requeued once its lease
+expires. Jobs tied to an analysis request move the request through RECEIVED,
+IN PROGRESS and DONE as they are queued, run and finish. While a job runs, its
+stage and progress within the stage are kept on its row (see JobProgress).
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+from typing import Callable, Dict, Optional
+
+from flask import current_app
+from sqlalchemy import inspect
+
+from db import db
+from model.analysis_request import AnalysisRequestModel, AnalysisStatusEnum
+from model.job import JobModel, JobStatusEnum
+from services.heartbeat import Heartbeat
+from services.process_stats import start_stats_publisher
+
+# Idle polling interval and the heartbeat lease after which a running job is considered orphaned
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', '2'))
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', '120'))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '3'))
+# Base delay of the exponential backoff between attempts
+JOB_RETRY_SECONDS = float(os.environ.get('JOB_RETRY_SECONDS', '30'))
+# Jobs of one import batch running at once, leaving the other workers for single submissions (0: no limit)
+JOB_BATCH_CONCURRENCY = int(os.environ.get('JOB_BATCH_CONCURRENCY', '4'))
+# Progress of a running job is written at most this often, and whenever its stage changes
+JOB_PROGRESS_SECONDS = float(os.environ.get('JOB_PROGRESS_SECONDS', '1'))
+# Repository metadata prefetched for queued jobs of an import batch is used while younger than this
+IMPORT_METADATA_MAX_AGE_SECONDS = float(os.environ.get('IMPORT_METADATA_MAX_AGE_SECONDS', '900'))
+
+# Job stage reported to clients for each pipeline stage (see StageTimer), and the order they come in
+PROGRESS_STAGES = {
+    'metadata': 'metadata',
+    'download': 'downloading',
+    'extract': 'extracting',
+    'parse': 'analysing',
+    'persist': 'persisting'
+}
+_STAGE_ORDER = ('started', 'metadata', 'downloading', 'extracting', 'analysing', 'persisting')
+
+ADD_REPOSITORY = 'add_repository'
+
+_handlers: Dict[str, Callable] = {}
+
+
+class PermanentJobError(Exception):
+    """A failure that retrying cannot fix, e.g. an invalid repository URL"""
+
+
+class JobProgress:
+    """Pipeline progress callback that records a running job's stage and details on its row
+
+    Reports of a stage earlier than the current one are dropped (metadata calls
+    still finishing while the download runs), and writes within a stage are
+    throttled to one per interval.
+    """
+
+    def __init__(self, app, job_id: str, interval: float = JOB_PROGRESS_SECONDS):
+        self.app = app
+        self.job_id = job_id
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._order = 0
+        self._written = 0.0
+
+    def __call__(self, stage: str, details: dict):
+        name = PROGRESS_STAGES.get(stage)
+        if name is None:
+            return
+        order = _STAGE_ORDER.index(name)
+        with self._lock:
+            now = time.monotonic()
+            if order < self._order or (order == self._order and now - self._written < self.interval):
+                return
+            self._order = order
+            self._written = now
+            try:
+                with self.app.app_context():
+                    JobModel.set_progress(self.job_id, name, details)
+            except Exception as e:
+                logging.warning(f"Could not record progress of job {self.job_id}: {str(e)}")
+
+
+def register(kind: str, handler: Callable):
+    """Register handler(job, payload) -> JSON-serialisable result for jobs of kind"""
+    _handlers[kind] = handler
+
+
+def enqueue_repository(analysis_request: AnalysisRequestModel, id_import_batch: str = None) -> JobModel:
+    """Queue adding the repository of an analysis request to its dataset
+
+    An already queued or running job of the request is returned instead of a
+    second one. The job is added to the session; the caller commits.
+    """
+    # A request not yet flushed has no jobs, which spares bulk imports a query per request
+    if not inspect(analysis_request).pending:
+        active = JobModel.find_active_for_request(analysis_request.id)
+        if active:
+            return active
+    return JobModel.enqueue(ADD_REPOSITORY, {
+        'dataset_id': analysis_request.id_target_dataset,
+        'repo_url': analysis_request.repo_url,
+        'submitter_name': analysis_request.name
+    }, id_analysis_request=analysis_request.id, max_attempts=JOB_MAX_ATTEMPTS, id_import_batch=id_import_batch)
+
+
+def _fresh_metadata(payload: dict):
+    if payload.get('metadata') and time.time() - payload.get('metadata_fetched_at', 0) < IMPORT_METADATA_MAX_AGE_SECONDS:
+        return payload['metadata']
+    return None
+
+
+def _prefetch_batch_metadata(job: JobModel, payload: dict, processor, owner: str, repo: str):
+    """Metadata of the job's repository, fetched with that of the next queued jobs of its import batch
+
+    One GraphQL query covers the job and up to GRAPHQL_BATCH_SIZE - 1 of the
+    jobs queued after it; their metadata is stored in their payloads, so the
+    workers that claim them, in any process, skip the metadata requests.
+    Returns None when the job is not part of an import or GraphQL is not in use.
+    """
+    from services.github_processor import GRAPHQL_BATCH_SIZE
+    if not (job.id_import_batch and processor.use_graphql and processor.authenticated):
+        return None
+    metadata = _fresh_metadata(payload)
+    if metadata:
+        return metadata
+
+    # (job id, payload, owner, repo) of the jobs the query covers, this one first
+    targets = [(None, payload, owner, repo)]
+    for queued in JobModel.find_queued_in_batch(job.id_import_batch, job.created_at, 2 * GRAPHQL_BATCH_SIZE):
+        queued_payload = queued.get_payload()
+        if queued.id == job.id or _fresh_metadata(queued_payload):
+            continue
+        try:
+            targets.append((queued.id, queued_payload) + processor.extract_repo_info(queued_payload['repo_url']))
+        except ValueError:
+            continue
+        if len(targets) >= GRAPHQL_BATCH_SIZE:
+            break
+
+    try:
+        found = processor.fetch_metadata_batch([(target_owner, target_repo) for _, _, target_owner, target_repo in targets])
+    except Exception as e:
+        logging.warning(f"Could not prefetch metadata for import {job.id_import_batch}: {str(e)}")
+        return None
+    fetched_at = time.time()
+    payloads = {}
+    for job_id, target_payload, target_owner, target_repo in targets[1:]:
+        metadata = found.get(f"{target_owner}/{target_repo}".lower())
+        if metadata:
+            payloads[job_id] = dict(target_payload, metadata=metadata, metadata_fetched_at=fetched_at)
+    JobModel.set_queued_payloads(payloads)
+    db.session.commit()
+    return found.get(f"{owner}/{repo}".lower())
+
+
+def _add_repository(job: JobModel, payload: dict):
+    # Imported here so the queue can be used without loading the analysis stack
+    from services.github_processor import GitHubProcessor
+    processor = GitHubProcessor()
+    try:
+        owner, repo = processor.extract_repo_info(payload['repo_url'])
+    except ValueError as e:
+        raise PermanentJobError(str(e))
+    repository = processor.add_repository_to_dataset(
+        dataset_id=payload['dataset_id'],
+        repo_url=payload['repo_url'],
+        submitter_name=payload['submitter_name'],
+        progress=JobProgress(current_app._get_current_object(), job.id),
+        metadata=_prefetch_batch_metadata(job, payload, processor, owner, repo)
+    )
+    return {'repository_id': repository.id, 'repository_name': repository.name}
+
+
+register(ADD_REPOSITORY, _add_repository)
+
+
+def _set_request_status(job: JobModel, status: AnalysisStatusEnum):
+    if not job.id_analysis_request:
+        return
+    analysis_request = AnalysisRequestModel.get_by_id(job.id_analysis_request)
+    if analysis_request and analysis_request.status != status:
+        analysis_request.status = status
+        analysis_request.updated_at = job.updated_at
+
+
+def run_job(app, job: JobModel):
+    """Run a claimed job to completion and record its outcome"""
+    # The worker that claimed it, before a commit reloads the job
+    job_id = job.id
+    worker = job.worker
+    _set_request_status(job, AnalysisStatusEnum.IN_PROGRESS)
+    db.session.commit()
+
+    handler = _handlers.get(job.kind)
+    retry_delay = JOB_RETRY_SECONDS * (2 ** (job.attempts - 1))
+    try:
+        if handler is None:
+            raise PermanentJobError(f"No handler registered for job kind {job.kind}")
+        with Heartbeat(app, JOB_LEASE_SECONDS / 3, lambda: JobModel.heartbeat(job_id, worker), f'Heartbeat of job {job_id}'):
+            result = handler(job, job.get_payload())
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Job {job_id} ({job.kind}) attempt {job.attempts} failed: {str(e)}")
+        recorded = job.fail(''.join(traceback.format_exception_only(type(e), e)).strip(),
+                            retry_delay=None if isinstance(e, PermanentJobError) else retry_delay, worker=worker)
+    else:
+        recorded = job.succeed(result, worker=worker)
+        if recorded:
+            logging.info(f"Job {job_id} ({job.kind}) succeeded")
+    if not recorded:
+        # The lease expired meanwhile: the job was requeued and is another worker's now
+        db.session.rollback()
+        logging.warning(f"Job {job_id} no longer belongs to this worker, its outcome is dropped")
+        return
+
+    if job.status == JobStatusEnum.SUCCEEDED:
+        _set_request_status(job, AnalysisStatusEnum.DONE)
+    else:
+        # Queued for a retry, or failed for good: an admin can process the request again
+        _set_request_status(job, AnalysisStatusEnum.RECEIVED)
+    db.session.commit()
+
+
+def work(app, worker_name: str, stop: threading.Event, poll_seconds: float = JOB_POLL_SECONDS,
+         id_import_batch: Optional[str] = None):
+    """Claim and run jobs, only those of id_import_batch when given, until stop is set"""
+    with app.app_context():
+        last_reap = 0.0
+        while not stop.is_set():
+            try:
+                if time.monotonic() - last_reap > JOB_LEASE_SECONDS / 2:
+                    for job in JobModel.requeue_stale(JOB_LEASE_SECONDS):
+                        logging.warning(f"Job {job.id} lost its worker {job.worker}, now {job.status.value}")
+                        _set_request_status(job, AnalysisStatusEnum.RECEIVED)
+                    db.session.commit()
+                    last_reap = time.monotonic()
+                job = JobModel.claim_next(worker_name, batch_concurrency=JOB_BATCH_CONCURRENCY,
+                                          id_import_batch=id_import_batch)
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Worker {worker_name} cannot poll the job queue: {str(e)}")
+                job = None
+            if job is None:
+                stop.wait(poll_seconds)
+                continue
+            try:
+                run_job(app, job)
+            except Exception as e:
+                # The job stays RUNNING and is requeued once its lease expires
+                db.session.rollback()
+                logging.error(f"Worker {worker_name} could not record job {job.id}: {str(e)}")
+            db.session.remove()
+
+
+def worker_name(index: int) -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+
+def start_in_process_workers(app, count: int, id_import_batch: Optional[str] = None) -> threading.Event:
+    """Run count worker threads inside this process, a stand-in for the worker pool in development
+
+    With id_import_batch the threads only run the jobs of that import batch.
+    """
+    stop = threading.Event()
+    for index in range(count):
+        threading.Thread(target=work, args=(app, worker_name(index), stop),
+                         kwargs={'id_import_batch': id_import_batch}, daemon=True,
+                         name=f'job-worker-{index}').start()
+    return stop
+
+
+def _worker_process(app_factory, index: int):
+    app = app_factory()
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    with app.app_context():
+        # Connections inherited from the parent must not be shared
+        db.engine.dispose()
+    # The admin endpoints of the API report the cache and quota counters of this process
+    start_stats_publisher(app, 'worker')
+    work(app, worker_name(index), stop)
+
+
+def run_worker_pool(app_factory, processes: int):
+    """Run processes worker processes, restarting any that exit, until SIGTERM or SIGINT
+
+    app_factory returns the Flask app in each worker process.
+    """
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    def start(index):
+        process = multiprocessing.Process(target=_worker_process, args=(app_factory, index), daemon=False)
+        process.start()
+        return process
+
+    workers = [start(index) for index in range(processes)]
+    logging.info(f"Started {processes} job worker processes")
+    while not stop.wait(1.0):
+        for index, process in enumerate(workers):
+            if not process.is_alive():
+                logging.warning(f"Job worker {process.pid} exited with {process.exitcode}, restarting")
+                workers[index] = start(index)
+
+    for process in workers:
+        process.terminate()
+    for process in workers:
+        # Workers finish the job they are running; one cut short is requeued once its lease expires
+        process.join(JOB_LEASE_SECONDS)
@@ -0,0 +1,275 @@
+"""
+Concurrent, resumable refresh of the advanced metrics of a dataset's repositories
+
+A pool of worker threads fetches and analyses the repositories; the calling
+thread writes their results in batches. Each batch is one transaction: the
+metric values in one upsert (see MetricRepoModel.bulk_upsert), the analysed
+commits in one executemany UPDATE, and a checkpoint row per repository. A run
+stopped at any point resumes after its last written batch when run again with
+resume=True; repositories that failed are retried.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import update
+
+from db import db
+from model.metric import MetricModel
+from model.metric_repo import MetricRepoModel
+from model.refresh_checkpoint import RefreshCheckpointModel
+from model.repository import RepositoryModel
+from services.github_processor import GitHubProcessor, parse_github_time
+
+# Key of get_repo_metrics' result -> name of the metric storing it
+ADVANCED_METRICS = {
+    'cyclomatic_complexity': 'Cyclomatic Complexity',
+    'code_duplication': 'Code Duplication',
+    'maintainability_index': 'Maintainability Index',
+    'comment_ratio': 'Comment Ratio',
+    'avg_function_length': 'Average Function Length',
+    'max_function_complexity': 'Maximum Function Complexity',
+    'test_coverage': 'Test Coverage',
+    'technical_debt': 'Technical Debt',
+    'code_smells': 'Code Smells'
+}
+
+# Repositories refreshed at once, and how many results are written per transaction
+REFRESH_WORKERS = int(os.environ.get('REFRESH_WORKERS', '4'))
+REFRESH_BATCH_SIZE = int(os.environ.get('REFRESH_BATCH_SIZE', '20'))
+# Throughput and ETA are logged at most this often
+REFRESH_PROGRESS_SECONDS = float(os.environ.get('REFRESH_PROGRESS_SECONDS', '5'))
+
+
+class RefreshError(Exception):
+    """A refresh that cannot start, e.g. the advanced metrics are missing"""
+
+
+def get_advanced_metrics() -> Dict[str, MetricModel]:
+    """Advanced metrics present in the metric table, by key of get_repo_metrics' result"""
+    by_name = {metric.name: metric for metric in MetricModel.query.filter(
+        MetricModel.name.in_(ADVANCED_METRICS.values())).all()}
+    for name in ADVANCED_METRICS.values():
+        if name not in by_name:
+            logging.warning(f"Advanced metric '{name}' not found in database")
+    return {key: by_name[name] for key, name in ADVANCED_METRICS.items() if name in by_name}
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+
+class RefreshProgress:
+    """Counts of finished repositories by outcome, with throughput and ETA"""
+
+    def __init__(self, total: int, interval: float = REFRESH_PROGRESS_SECONDS):
+        self.total = total
+        self.interval = interval
+        self.counts = Counter()
+        self._started = time.monotonic()
+        self._logged = 0.0
+
+    @property
+    def done(self) -> int:
+        return sum(self.counts.values())
+
+    def add(self, outcome: str):
+        self.counts[outcome] += 1
+
+    def summary(self) -> str:
+        elapsed = time.monotonic() - self._started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        line = (f"{self.done}/{self.total} repositories ("
+                + ', '.join(f"{count} {outcome}" for outcome, count in sorted(self.counts.items()))
+                + f"), {rate * 60:.1f}/min, {_format_duration(elapsed)} elapsed")
+        if rate and self.done < self.total:
+            line += f", ETA {_format_duration((self.total - self.done) / rate)}"
+        return line
+
+    def log(self, force: bool = False):
+        now = time.monotonic()
+        if force or now - self._logged >= self.interval:
+            self._logged = now
+            logging.info(self.summary())
+
+
+class MetricRefresh:
+    """Refreshes the advanced metrics of a dataset's repositories with concurrent workers
+
+    Unless force is set, repositories that already have advanced metrics are
+    skipped when their head commit is the one last analysed, or when no commit
+    was recorded. processor_factory returns a GitHubProcessor; each worker
+    thread makes its own.
+    """
+
+    def __init__(self, app, dataset_id: str, workers: int = REFRESH_WORKERS,
+                 batch_size: int = REFRESH_BATCH_SIZE, force: bool = False,
+                 processor_factory: Optional[Callable] = None):
+        self.app = app
+        self.dataset_id = dataset_id
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.force = force
+        self.processor_factory = processor_factory or GitHubProcessor
+        # Metric id by key of get_repo_metrics' result, set by run
+        self.metrics: Dict[str, str] = {}
+        self._local = threading.local()
+        # Set on interrupt; workers check it before starting on a repository
+        self._stop = threading.Event()
+
+    def run(self, resume: bool = False, limit: Optional[int] = None) -> Counter:
+        """Refresh the dataset, continuing the previous run when resume is set
+
+        Returns:
+            Number of repositories per outcome: updated, skipped or failed
+        """
+        with self.app.app_context():
+            metrics = get_advanced_metrics()
+            if not metrics:
+                raise RefreshError('No advanced metrics found in database. Run add_advanced_metrics.py first.')
+            self.metrics = {key: metric.id for key, metric in metrics.items()}
+
+            if resume:
+                completed = RefreshCheckpointModel.completed_ids(self.dataset_id)
+                logging.info(f"Resuming: {len(completed)} repositories already refreshed")
+            else:
+                RefreshCheckpointModel.clear(self.dataset_id)
+                db.session.commit()
+                completed = set()
+
+            repos = self._load_repositories(completed)
+            if limit:
+                repos = repos[:limit]
+            logging.info(f"Refreshing {len(repos)} repositories with {self.workers} workers")
+
+            progress = RefreshProgress(len(repos))
+            pending = []
+            executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='refresh')
+            futures = [executor.submit(self._refresh, repo) for repo in repos]
+            try:
+                for future in as_completed(futures):
+                    result = future.result()
+                    progress.add(result['outcome'])
+                    if result['outcome'] == 'failed':
+                        logging.error(f"Failed to refresh {result['name']}: {result['message']}")
+                    pending.append(result)
+                    if len(pending) >= self.batch_size:
+                        batch, pending = pending, []
+                        self._write(batch)
+                    progress.log()
+            except KeyboardInterrupt:
+                self._stop.set()
+                executor.shutdown(wait=False, cancel_futures=True)
+                logging.warning("Interrupted; finished repositories are saved, run again with --resume to continue")
+                raise
+            finally:
+                # Results already received are kept however the run ends
+                self._write(pending)
+                executor.shutdown(wait=False)
+            progress.log(force=True)
+            return progress.counts
+
+    def _load_repositories(self, completed):
+        """The dataset's repositories not in completed, as plain dictionaries for the worker threads"""
+        with_metrics = {id_repo for (id_repo,) in db.session.query(MetricRepoModel.id_repo).join(
+            RepositoryModel, RepositoryModel.id == MetricRepoModel.id_repo
+        ).filter(
+            RepositoryModel.dataset_id == self.dataset_id,
+            MetricRepoModel.id_metric.in_(self.metrics.values())
+        ).distinct().all()}
+        return [{
+            'id': repo.id,
+            'name': repo.name,
+            'last_commit_sha': repo.last_commit_sha,
+            'code_metrics': repo.get_code_metrics(),
+            'has_metrics': repo.id in with_metrics
+        } for repo in RepositoryModel.query.filter_by(dataset_id=self.dataset_id).order_by(RepositoryModel.id)
+            if repo.id not in completed]
+
+    def _processor(self):
+        processor = getattr(self._local, 'processor', None)
+        if processor is None:
+            with self.app.app_context():
+                processor = self._local.processor = self.processor_factory()
+        return processor
+
+    def _refresh(self, repo: dict) -> dict:
+        """Fetch the metrics of one repository; runs in a worker thread and does not write to the database"""
+        result = {'id': repo['id'], 'name': repo['name'], 'outcome': 'failed', 'message': None}
+        if self._stop.is_set():
+            return dict(result, message='Interrupted')
+        if '/' not in repo['name']:
+            result['message'] = 'Invalid name format'
+            return result
+        owner, repo_name = repo['name'].split('/', 1)
+        try:
+            processor = self._processor()
+            head_sha = None
+            if not self.force and repo['has_metrics']:
+                if not repo['last_commit_sha']:
+                    return dict(result, outcome='skipped', message='Already has metrics')
+                head_sha = processor.get_head_sha(owner, repo_name)
+                if head_sha == repo['last_commit_sha']:
+                    return dict(result, outcome='skipped', message=f"Commit {repo['last_commit_sha']} unchanged")
+
+            # The download and analysis are the slow part; do not start them once interrupted
+            if self._stop.is_set():
+                return dict(result, message='Interrupted')
+            # The head commit resolved for the check above is not requested again
+            if self.force:
+                metrics_data = processor.get_repo_metrics(owner, repo_name)
+            else:
+                metrics_data = processor.get_repo_metrics(
+                    owner, repo_name,
+                    last_commit_sha=repo['last_commit_sha'],
+                    cached_code_metrics=repo['code_metrics'],
+                    head_sha=head_sha
+                )
+        except Exception as e:
+            result['message'] = str(e)
+            return result
+
+        result['rows'] = [
+            (repo['id'], metric_id, float(metrics_data[key]))
+            for key, metric_id in self.metrics.items() if key in metrics_data
+        ]
+        result['commit_sha'] = metrics_data.get('commit_sha')
+        result['code_metrics'] = metrics_data.get('code_metrics')
+        result['pushed_at'] = parse_github_time(metrics_data.get('pushed_at'))
+        return dict(result, outcome='updated', message=f"{len(result['rows'])} metrics written")
+
+    def _write(self, results):
+        """Write a batch of results and their checkpoints in one transaction"""
+        if not results:
+            return
+        try:
+            MetricRepoModel.bulk_upsert(row for result in results for row in result.get('rows', ()))
+            # Remember the analysed commit so unchanged repositories are skipped next time
+            now = datetime.now()
+            refreshed = []
+            for result in results:
+                if result['outcome'] != 'updated':
+                    continue
+                values = {'id': result['id'], 'pushed_at': result['pushed_at'], 'last_refreshed_at': now}
+                if result['commit_sha']:
+                    values['last_commit_sha'] = result['commit_sha']
+                    values['code_metrics'] = json.dumps(result['code_metrics']) if result['code_metrics'] else None
+                refreshed.append(values)
+            if refreshed:
+                db.session.execute(update(RepositoryModel), refreshed)
+            RefreshCheckpointModel.record(self.dataset_id, [
+                (result['id'], result['outcome'], result['message']) for result in results
+            ])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
@@ -0,0 +1,232 @@
+import random
+import sys
+import zlib
+from array import array
+from collections import Counter, defaultdict
+from typing import Dict
+
+# MinHash parameters: NUM_HASHES 16-bit minima per block, split into
+# BANDS bands of ROWS hashes for locality-sensitive candidate lookup
+NUM_HASHES = 32
+BANDS = 8
+ROWS = NUM_HASHES // BANDS
+SIMILARITY_THRESHOLD = 0.8
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_rng = random.Random(0x5EED)
+_HASH_PARAMS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+                for _ in range(NUM_HASHES)]
+
+
+class DuplicationIndex:
+    """Compact MinHash fingerprints of code blocks for duplication estimation
+
+    Each block is reduced to a 64-byte signature, identical signatures are
+    counted rather than stored twice, and block text is never kept.
+    """
+
+    def __init__(self):
+        self.signatures = Counter()
+        self.block_count = 0
+
+    def add_block(self, block: str):
+        line_hashes = {zlib.crc32(line.encode('utf-8')) for line in block.splitlines()}
+        if not line_hashes:
+            return
+        signature = array('H', (
+            min((a * h + b) % _MERSENNE_PRIME for h in line_hashes) & 0xFFFF
+            for a, b in _HASH_PARAMS
+        ))
+        # Signatures are stored little-endian so indexes built on different machines merge
+        if sys.byteorder == 'big':
+            signature.byteswap()
+        self.signatures[signature.tobytes()] += 1
+        self.block_count += 1
+
+    def merge(self, other: 'DuplicationIndex') -> 'DuplicationIndex':
+        """Fold another index into this one"""
+        self.signatures.update(other.signatures)
+        self.block_count += other.block_count
+        return self
+
+    def to_dict(self) -> Dict:
+        return {
+            'block_count': self.block_count,
+            'signatures': {signature.hex(): count for signature, count in self.signatures.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'DuplicationIndex':
+        index = cls()
+        index.block_count = data.get('block_count', 0)
+        index.signatures = Counter({bytes.fromhex(signature): count
+                                    for signature, count in data.get('signatures', {}).items()})
+        return index
+
+    def duplication_percentage(self) -> float:
+        """Percentage of block pairs whose estimated line-set similarity exceeds the threshold"""
+        total_pairs = self.block_count * (self.block_count - 1) // 2
+        if total_pairs == 0:
+            return 0.0
+
+        # Blocks with identical signatures are duplicates of each other
+        duplicates = sum(count * (count - 1) // 2 for count in self.signatures.values())
+
+        # Distinct signatures sharing at least one band are candidate pairs
+        signatures = list(self.signatures)
+        band_width = ROWS * 2
+        candidates = set()
+        for band in range(BANDS):
+            buckets = defaultdict(list)
+            for index, signature in enumerate(signatures):
+                buckets[signature[band * band_width:(band + 1) * band_width]].append(index)
+            for members in buckets.values():
+                for i in range(len(members)):
+                    for j in range(i + 1, len(members)):
+                        candidates.add((members[i], members[j]))
+
+        for i, j in candidates:
+            first = array('H', signatures[i])
+            second = array('H', signatures[j])
+            agreement = sum(1 for x, y in zip(first, second) if x == y) / NUM_HASHES
+            if agreement > SIMILARITY_THRESHOLD:
+                duplicates += self.signatures[signatures[i]] * self.signatures[signatures[j]]
+
+        return (duplicates / total_pairs) * 100
+
+
+# Plain counters of MetricsAggregate that merge by addition
+_SUMMED_FIELDS = (
+    'total_files',
+    'total_lines',
+    'analyzed_bytes',
+    'function_count',
+    'class_count',
+    'complexity',
+    'debt_score',
+    'code_smells',
+    'comment_lines',
+    'function_length_sum',
+    'function_length_count',
+    'skipped_files',
+    'skipped_bytes',
+    'source_files',
+    'test_files'
+)
+
+
+class MetricsAggregate:
+    """Running totals of per-file metrics, folded in as soon as each file is analysed
+
+    Aggregates of disjoint sets of files can be combined with merge(), which is
+    associative and commutative, so a repository can be analysed in shards
+    (processes, machines or separate jobs) and still produce the same metrics.
+    """
+
+    def __init__(self):
+        self.total_files = 0
+        self.total_lines = 0
+        self.analyzed_bytes = 0
+        self.function_count = 0
+        self.class_count = 0
+        self.complexity = 0
+        self.debt_score = 0
+        self.code_smells = 0
+        self.comment_lines = 0
+        self.function_length_sum = 0
+        self.function_length_count = 0
+        self.max_function_complexity = 0
+        self.skipped_files = 0
+        self.skipped_bytes = 0
+        self.skipped_by_reason = Counter()
+        self.source_files = 0
+        self.test_files = 0
+        self.duplication = DuplicationIndex()
+
+    def add_file(self, file_metric: Dict, size: int = 0):
+        """Fold one file's metrics into the running totals"""
+        self.total_files += 1
+        self.total_lines += file_metric.get('lines', 0)
+        self.analyzed_bytes += size
+        self.function_count += file_metric.get('function_count', 0)
+        self.class_count += file_metric.get('class_count', 0)
+        self.complexity += file_metric.get('complexity', 0)
+        self.debt_score += file_metric.get('debt_score', 0)
+        self.code_smells += file_metric.get('code_smells', 0)
+        self.comment_lines += file_metric.get('comment_lines', 0)
+
+        for function in file_metric.get('functions', []):
+            self.function_length_sum += function.get('length', 0)
+            self.function_length_count += 1
+            self.max_function_complexity = max(self.max_function_complexity, function.get('complexity', 0))
+
+        for block in file_metric.get('code_blocks', []):
+            self.duplication.add_block(block)
+
+    def count_source_file(self, is_test: bool):
+        """Count a source file found by the walk, analysed or not, for test coverage"""
+        self.source_files += 1
+        if is_test:
+            self.test_files += 1
+    
+    def skip_file(self, reason: str, size: int):
+        """Record a file that was not analysed"""
+        self.skipped_files += 1
+        self.skipped_bytes += size
+        self.skipped_by_reason[reason] += 1
+
+    def merge(self, other: 'MetricsAggregate') -> 'MetricsAggregate':
+        """Fold the totals of another aggregate into this one"""
+        for field in _SUMMED_FIELDS:
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+        self.max_function_complexity = max(self.max_function_complexity, other.max_function_complexity)
+        self.skipped_by_reason.update(other.skipped_by_reason)
+        self.duplication.merge(other.duplication)
+        return self
+
+    def to_dict(self) -> Dict:
+        """JSON-serialisable form, used to hand a shard's aggregate to another job"""
+        data = {field: getattr(self, field) for field in _SUMMED_FIELDS}
+        data['max_function_complexity'] = self.max_function_complexity
+        data['skipped_by_reason'] = dict(self.skipped_by_reason)
+        data['duplication'] = self.duplication.to_dict()
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'MetricsAggregate':
+        aggregate = cls()
+        for field in _SUMMED_FIELDS:
+            setattr(aggregate, field, data.get(field, 0))
+        aggregate.max_function_complexity = data.get('max_function_complexity', 0)
+        aggregate.skipped_by_reason = Counter(data.get('skipped_by_reason', {}))
+        aggregate.duplication = DuplicationIndex.from_dict(data.get('duplication', {}))
+        return aggregate
+
+    def finalize(self) -> Dict:
+        """Return the aggregate metrics in the shape produced by CodeAnalysisService"""
+        metrics = {
+            'cyclomatic_complexity': self.complexity,
+            'code_duplication': 0,
+            'technical_debt': self.debt_score,
+            'test_coverage': 0,
+            'maintainability_index': 0,
+            'code_smells': self.code_smells,
+            'total_files': self.total_files,
+            'total_lines': self.total_lines,
+            'comment_ratio': (self.comment_lines / self.total_lines) * 100 if self.total_lines > 0 else 0,
+            'function_count': self.function_count,
+            'class_count': self.class_count,
+            'avg_function_length': 0,
+            'max_function_complexity': self.max_function_complexity,
+            'skipped_files': self.skipped_files,
+            'skipped_bytes': self.skipped_bytes,
+            'skipped_by_reason': dict(self.skipped_by_reason),
+            'source_files': self.source_files,
+            'test_files': self.test_files,
+            'sampled': False
+        }
+        if self.function_length_count:
+            metrics['avg_function_length'] = self.function_length_sum / self.function_length_count
+        if self.total_files:
+            metrics['code_duplication'] = self.duplication.duplication_percentage()
+        return metrics
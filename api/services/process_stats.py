@@ -0,0 +1,128 @@
+"""
+Counters of the archive cache, the ETag cache and the GitHub token pool across processes
+
+Each of them counts hits, revalidations and remaining quota in the memory of
+the process using it, and most of the use is in the job workers and the
+scheduler rather than the API. Those processes publish their counters to the
+process_stats table every PROCESS_STATS_SECONDS (start_stats_publisher); the
+admin endpoints report the API's own counters summed with those published
+within PROCESS_STATS_MAX_AGE_SECONDS (combined_stats). Counters start at zero
+when a process starts, so the totals cover the processes running now.
+"""
+
+import logging
+import os
+import socket
+import threading
+from datetime import datetime
+from typing import Dict
+
+from db import db
+from model.process_stats import ProcessStatsModel
+from services.archive_cache import default_archive_cache
+from services.github_client import get_github_client
+
+PROCESS_STATS_SECONDS = float(os.environ.get('PROCESS_STATS_SECONDS', '30'))
+# Counters older than this belong to a process that stopped
+PROCESS_STATS_MAX_AGE_SECONDS = float(os.environ.get('PROCESS_STATS_MAX_AGE_SECONDS', '120'))
+
+ARCHIVE_CACHE = 'archive_cache'
+ETAG_CACHE = 'etag_cache'
+RATE_LIMIT = 'rate_limit'
+
+# Counter of each kind, in this process, or None when it is disabled
+_SOURCES = {
+    ARCHIVE_CACHE: default_archive_cache,
+    ETAG_CACHE: lambda: get_github_client().conditional_cache,
+    RATE_LIMIT: lambda: get_github_client().token_pool,
+}
+# Counters summed over processes, and the (hits, misses) each hit rate is computed from
+SUMMED = {
+    ARCHIVE_CACHE: ('hits', 'misses', 'evictions'),
+    ETAG_CACHE: ('not_modified', 'misses'),
+    RATE_LIMIT: ('requests', 'paced_seconds', 'reset_waits'),
+}
+HIT_RATES = {
+    ARCHIVE_CACHE: ('hits', 'misses'),
+    ETAG_CACHE: ('not_modified', 'misses'),
+}
+
+
+def process_name(role: str) -> str:
+    return f"{role}@{socket.gethostname()}:{os.getpid()}"
+
+
+def collect() -> Dict[str, Dict]:
+    """Stats of this process by kind, for the counters it has enabled"""
+    stats = {}
+    for kind, source in _SOURCES.items():
+        counter = source()
+        if counter is not None:
+            stats[kind] = counter.stats()
+    return stats
+
+
+def publish(process: str):
+    """Write the stats of this process under the name process, and drop those of stopped processes"""
+    ProcessStatsModel.publish(process, collect())
+    ProcessStatsModel.prune(PROCESS_STATS_MAX_AGE_SECONDS)
+    db.session.commit()
+
+
+def start_stats_publisher(app, role: str) -> threading.Event:
+    """Publish the stats of this process every PROCESS_STATS_SECONDS from a daemon thread until the event is set"""
+    stop = threading.Event()
+    process = process_name(role)
+
+    def run():
+        with app.app_context():
+            while not stop.wait(PROCESS_STATS_SECONDS):
+                try:
+                    publish(process)
+                except Exception as e:
+                    db.session.rollback()
+                    logging.warning(f"Could not publish the stats of {process}: {str(e)}")
+                finally:
+                    db.session.remove()
+
+    threading.Thread(target=run, daemon=True, name='process-stats').start()
+    return stop
+
+
+def _merge_tokens(token_lists):
+    """Quota per token and resource as last seen by any process: the lowest remaining of the latest window"""
+    merged = {}
+    for tokens in token_lists:
+        for token in tokens:
+            quotas = merged.setdefault(token['token'], {})
+            for resource, quota in token['quotas'].items():
+                seen = quotas.get(resource)
+                if seen is None or (quota['reset_at'], -quota['remaining']) > (seen['reset_at'], -seen['remaining']):
+                    quotas[resource] = quota
+    return [{'token': token, 'quotas': quotas} for token, quotas in merged.items()]
+
+
+def combined_stats(kind: str, own: Dict, role: str = 'api') -> Dict:
+    """own, the live stats of kind in this process, with its counters summed over every running process
+
+    Values that are not counters (sizes, paths) are those of this process.
+    'processes' lists the counters of each process and when it published them.
+    """
+    processes = {name: (stats, updated_at.isoformat())
+                 for name, stats, updated_at in ProcessStatsModel.recent(kind, PROCESS_STATS_MAX_AGE_SECONDS)}
+    processes[process_name(role)] = (own, datetime.now().isoformat())
+
+    result = dict(own)
+    for key in SUMMED[kind]:
+        result[key] = sum(stats.get(key, 0) for stats, _ in processes.values())
+    if kind == RATE_LIMIT:
+        result['paced_seconds'] = round(result['paced_seconds'], 3)
+        result['tokens'] = _merge_tokens(stats.get('tokens', []) for stats, _ in processes.values())
+    if kind in HIT_RATES:
+        hits, misses = (result[key] for key in HIT_RATES[kind])
+        result['hit_rate'] = hits / (hits + misses) if hits + misses else 0.0
+    result['processes'] = [
+        dict({key: stats.get(key, 0) for key in SUMMED[kind]}, process=name, updated_at=updated_at)
+        for name, (stats, updated_at) in sorted(processes.items())
+    ]
+    return result
@@ -0,0 +1,235 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+import requests
+
+# Tokens requests are spread across: comma-separated GITHUB_TOKENS, falling back to GITHUB_TOKEN
+DEFAULT_TOKENS = [
+    token.strip()
+    for token in (os.environ.get('GITHUB_TOKENS') or os.environ.get('GITHUB_TOKEN', '')).split(',')
+    if token.strip()
+]
+
+# Per-token pacing (requests per second and burst) that keeps clear of GitHub's
+# secondary rate limits; a rate of 0 disables pacing
+DEFAULT_TOKEN_RATE = float(os.environ.get('GITHUB_TOKEN_RATE', '10'))
+DEFAULT_TOKEN_BURST = int(os.environ.get('GITHUB_TOKEN_BURST', '20'))
+
+# Longest wait (seconds) for a quota reset before giving up with RateLimitExhausted
+DEFAULT_MAX_RESET_WAIT = float(os.environ.get('GITHUB_RATE_LIMIT_MAX_WAIT', '3600'))
+
+# Quota assumed for a resource before the first response reports it
+DEFAULT_QUOTAS = {
+    'core': 5000,
+    'graphql': 5000,
+    'search': 30
+}
+
+# Seconds added to a reset time, as GitHub's clock and ours may disagree slightly
+RESET_MARGIN = 1.0
+
+
+class RateLimitExhausted(requests.RequestException):
+    """Every token's quota for a resource is used up until after the allowed wait"""
+
+    def __init__(self, resource: str, reset_at: float):
+        self.resource = resource
+        self.reset_at = reset_at
+        super().__init__(f"GitHub {resource} rate limit exhausted until {time.ctime(reset_at)}")
+
+
+def resource_for(url: str) -> str:
+    """GitHub rate limit resource a request to url is counted against"""
+    if url.rstrip('/').endswith('/graphql'):
+        return 'graphql'
+    if '/search/' in url:
+        return 'search'
+    return 'core'
+
+
+class TokenBucket:
+    """Paces calls to rate per second, allowing bursts of up to capacity"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self, now: float) -> bool:
+        if self.rate <= 0:
+            return True
+        self._refill(now)
+        return self.tokens >= 1
+
+    def take(self, now: float) -> float:
+        """Take one token, returning the seconds the caller must wait before using it"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class _Quota:
+    __slots__ = ('limit', 'remaining', 'reset_at')
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.remaining = limit
+        self.reset_at = 0.0
+
+
+class _TokenState:
+    def __init__(self, token: str, rate: float, burst: int):
+        self.token = token
+        self.bucket = TokenBucket(rate, burst)
+        self.quotas: Dict[str, _Quota] = {}
+
+    def quota(self, resource: str) -> _Quota:
+        quota = self.quotas.get(resource)
+        if quota is None:
+            quota = self.quotas[resource] = _Quota(DEFAULT_QUOTAS.get(resource, DEFAULT_QUOTAS['core']))
+        return quota
+
+
+class TokenPool:
+    """Schedules GitHub requests across a pool of tokens by their remaining quota
+
+    The quota of each token and resource is tracked from the X-RateLimit-*
+    headers of its responses, and reserved when a request is scheduled so
+    concurrent callers spread over the tokens. Each request goes to the token
+    with the most quota left, paced by that token's bucket; callers only sleep
+    for a reset when every token is exhausted.
+    """
+
+    def __init__(self, tokens: Sequence[str], rate: float = DEFAULT_TOKEN_RATE, burst: int = DEFAULT_TOKEN_BURST,
+                 max_reset_wait: float = DEFAULT_MAX_RESET_WAIT):
+        if not tokens:
+            raise ValueError("A token pool needs at least one token")
+        self.max_reset_wait = max_reset_wait
+        self._states = {token: _TokenState(token, rate, burst) for token in tokens}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.paced_seconds = 0.0
+        self.reset_waits = 0
+
+    def __len__(self):
+        return len(self._states)
+
+    def acquire(self, resource: str = 'core') -> str:
+        """Return the token to send the next request with, waiting for pacing or a reset if needed
+
+        Raises:
+            RateLimitExhausted: If every token stays exhausted for longer than max_reset_wait
+        """
+        while True:
+            with self._lock:
+                now_wall = time.time()
+                now = time.monotonic()
+                candidates: List[_TokenState] = []
+                reset_at = None
+                for state in self._states.values():
+                    quota = state.quota(resource)
+                    if quota.reset_at and now_wall >= quota.reset_at:
+                        quota.remaining = quota.limit
+                        quota.reset_at = 0.0
+                    if quota.remaining > 0:
+                        candidates.append(state)
+                    elif reset_at is None or quota.reset_at < reset_at:
+                        reset_at = quota.reset_at
+                if candidates:
+                    state = max(candidates, key=lambda s: (s.bucket.available(now), s.quota(resource).remaining))
+                    state.quota(resource).remaining -= 1
+                    delay = state.bucket.take(now)
+                    self.requests += 1
+                    self.paced_seconds += delay
+                else:
+                    # Exhausted without a known reset: GitHub windows last an hour at most
+                    reset_at = reset_at or now_wall + 3600
+                    self.reset_waits += 1
+            if candidates:
+                if delay:
+                    time.sleep(delay)
+                return state.token
+            wait = reset_at + RESET_MARGIN - time.time()
+            if wait > self.max_reset_wait:
+                raise RateLimitExhausted(resource, reset_at)
+            logging.warning(f"All {len(self)} GitHub tokens exhausted for {resource}, waiting {wait:.0f}s for reset")
+            time.sleep(max(0.0, wait))
+
+    def update(self, token: str, response: requests.Response, resource: str = 'core'):
+        """Record the quota a response reports for token
+
+        A 304 Not Modified is not charged by GitHub, so the request reserved for
+        it by acquire is given back.
+        """
+        state = self._states.get(token)
+        if state is None:
+            return
+        headers = response.headers
+        refund = 1 if response.status_code == 304 else 0
+        try:
+            remaining = int(headers['X-RateLimit-Remaining']) if 'X-RateLimit-Remaining' in headers else None
+            reset_at = float(headers.get('X-RateLimit-Reset', 0))
+            limit = int(headers.get('X-RateLimit-Limit', 0))
+        except ValueError:
+            remaining = None
+        if remaining is None:
+            if refund:
+                with self._lock:
+                    quota = state.quota(resource)
+                    quota.remaining = min(quota.remaining + refund, quota.limit)
+            return
+        resource = headers.get('X-RateLimit-Resource', resource)
+        with self._lock:
+            quota = state.quota(resource)
+            if limit:
+                quota.limit = limit
+            if reset_at == quota.reset_at:
+                # Responses of one window may arrive out of order; the lowest count is the latest
+                quota.remaining = min(quota.remaining + refund, remaining)
+            elif reset_at > quota.reset_at:
+                quota.remaining = remaining
+                quota.reset_at = reset_at
+
+    def exhaust(self, token: str, resource: str, reset_at: Optional[float] = None):
+        """Mark token as out of quota, e.g. after a primary rate limit response"""
+        state = self._states.get(token)
+        if state is None:
+            return
+        with self._lock:
+            quota = state.quota(resource)
+            quota.remaining = 0
+            quota.reset_at = max(quota.reset_at, reset_at or time.time() + 60)
+
+    def stats(self) -> Dict:
+        """Remaining quota per token (identified by its last characters) and scheduling counters"""
+        with self._lock:
+            return {
+                'tokens': [
+                    {
+                        'token': '...' + state.token[-4:],
+                        'quotas': {
+                            resource: {'limit': quota.limit, 'remaining': quota.remaining, 'reset_at': quota.reset_at}
+                            for resource, quota in state.quotas.items()
+                        }
+                    }
+                    for state in self._states.values()
+                ],
+                'requests': self.requests,
+                'paced_seconds': round(self.paced_seconds, 3),
+                'reset_waits': self.reset_waits
+            }
+
+
+def default_token_pool() -> Optional[TokenPool]:
+    """Pool of the configured server tokens, or None when no token is configured"""
+    return TokenPool(DEFAULT_TOKENS) if DEFAULT_TOKENS else None
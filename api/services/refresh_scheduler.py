@@ -0,0 +1,326 @@
+"""
+Staleness-driven incremental refresh of repository metrics
+
+Each pass of the scheduler checks the repositories' upstream state with
+batched GraphQL metadata queries (one request per GRAPHQL_BATCH_SIZE
+repositories), records GitHub's pushed_at, and refreshes only repositories
+whose default branch moved since their last analysis: a new head commit, or a
+push after last_refreshed_at when no commit was recorded. Changed repositories
+are refreshed stalest and most popular first, while the hourly API request and
+analysis time budget lasts, so the cost of a pass follows what changed rather
+than the size of the datasets.
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Callable, Optional
+
+from sqlalchemy import update
+
+from db import db
+from model.metric_repo import MetricRepoModel
+from model.repository import RepositoryModel
+from services.github_processor import GRAPHQL_BATCH_SIZE, GitHubProcessor, metric_values, parse_github_time
+
+# Hourly budget of GitHub requests and of analysis (download, extract and parse) seconds; 0 means unlimited
+REFRESH_API_BUDGET_PER_HOUR = int(os.environ.get('REFRESH_API_BUDGET_PER_HOUR', '2000'))
+REFRESH_CPU_BUDGET_PER_HOUR = float(os.environ.get('REFRESH_CPU_BUDGET_PER_HOUR', '1800'))
+# Time between passes, and repositories refreshed at once within a pass
+REFRESH_SCHEDULER_INTERVAL_SECONDS = float(os.environ.get('REFRESH_SCHEDULER_INTERVAL_SECONDS', '900'))
+REFRESH_SCHEDULER_WORKERS = int(os.environ.get('REFRESH_SCHEDULER_WORKERS', '2'))
+# Refreshed repositories written per transaction, their metric values in one upsert
+REFRESH_SCHEDULER_BATCH_SIZE = int(os.environ.get('REFRESH_SCHEDULER_BATCH_SIZE', '20'))
+
+# Stages whose wall time is charged to the analysis budget
+_ANALYSIS_STAGES = ('download', 'extract', 'parse')
+
+
+class RefreshBudget:
+    """API requests and analysis seconds spent over the last hour, against hourly limits
+
+    Thread-safe. A limit of 0 leaves that resource unlimited.
+    """
+
+    def __init__(self, api_per_hour: int = REFRESH_API_BUDGET_PER_HOUR,
+                 cpu_seconds_per_hour: float = REFRESH_CPU_BUDGET_PER_HOUR,
+                 window: float = 3600.0, clock: Callable[[], float] = time.monotonic):
+        self.api_per_hour = api_per_hour
+        self.cpu_seconds_per_hour = cpu_seconds_per_hour
+        self.window = window
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._spent = deque()
+
+    def _trim(self, now):
+        while self._spent and self._spent[0][0] <= now - self.window:
+            self._spent.popleft()
+
+    def spent(self):
+        """(API requests, analysis seconds) spent within the window"""
+        with self._lock:
+            self._trim(self.clock())
+            return sum(api for _, api, _ in self._spent), sum(cpu for _, _, cpu in self._spent)
+
+    def allows(self, api: float = 0, cpu: float = 0.0) -> bool:
+        spent_api, spent_cpu = self.spent()
+        return ((not self.api_per_hour or spent_api + api <= self.api_per_hour)
+                and (not self.cpu_seconds_per_hour or spent_cpu + cpu <= self.cpu_seconds_per_hour))
+
+    def spend(self, api: float = 0, cpu: float = 0.0):
+        with self._lock:
+            self._spent.append((self.clock(), api, cpu))
+
+    def stats(self):
+        api, cpu = self.spent()
+        return {
+            'api_requests': api,
+            'api_per_hour': self.api_per_hour,
+            'analysis_seconds': round(cpu, 1),
+            'analysis_seconds_per_hour': self.cpu_seconds_per_hour
+        }
+
+
+def refresh_cost(stages: dict):
+    """(API requests, analysis seconds) of one get_repo_metrics call from its stage timings"""
+    api = sum(stage.get('requests', 0) for stage in stages.values())
+    if 'download' in stages:
+        # The archive download is not counted by the metadata requests
+        api += 1
+    cpu = sum(stages[name]['seconds'] for name in _ANALYSIS_STAGES if name in stages)
+    return api, cpu
+
+
+def is_changed(repo: RepositoryModel, head_sha: Optional[str], pushed_at: Optional[datetime]) -> bool:
+    """Whether the upstream repository moved since its metrics were last collected"""
+    if repo.last_refreshed_at is None:
+        return True
+    if repo.last_commit_sha and head_sha:
+        return head_sha != repo.last_commit_sha
+    # Without a recorded commit (e.g. a failed analysis) only a new push counts
+    return pushed_at is not None and pushed_at > repo.last_refreshed_at
+
+
+def priority(repo: RepositoryModel, now: datetime) -> float:
+    """Hours the repository's metrics are out of date, weighted by its popularity"""
+    since = repo.last_refreshed_at or datetime.min
+    stale_hours = max((now - since).total_seconds() / 3600.0, 0.0)
+    return stale_hours * (1.0 + math.log10(1 + (repo.stars or 0)))
+
+
+class RefreshScheduler:
+    """Refreshes changed repositories of one dataset, or of all, within a RefreshBudget
+
+    Cost estimates of a refresh, used to decide whether the next one fits the
+    budget, start from the given defaults and follow the observed costs.
+    """
+
+    def __init__(self, app, budget: Optional[RefreshBudget] = None, dataset_id: Optional[str] = None,
+                 workers: int = REFRESH_SCHEDULER_WORKERS, processor_factory: Optional[Callable] = None,
+                 estimated_api: float = 6, estimated_cpu: float = 30.0,
+                 batch_size: int = REFRESH_SCHEDULER_BATCH_SIZE):
+        self.app = app
+        self.budget = budget or RefreshBudget()
+        self.dataset_id = dataset_id
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.processor_factory = processor_factory or GitHubProcessor
+        self.estimated_api = estimated_api
+        self.estimated_cpu = estimated_cpu
+        self._local = threading.local()
+
+    def run(self, stop: threading.Event, interval: float = REFRESH_SCHEDULER_INTERVAL_SECONDS):
+        """Run a pass every interval seconds until stop is set"""
+        while not stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logging.error(f"Refresh pass failed: {str(e)}")
+            stop.wait(interval)
+
+    def run_once(self) -> Counter:
+        """One pass: check every repository upstream, then refresh the changed ones by priority
+
+        Returns:
+            Number of repositories per outcome: unchanged, refreshed, failed,
+            missing (not found upstream), deferred (over budget) or unchecked
+            (over budget before its check, or its check failed)
+        """
+        counts = Counter()
+        with self.app.app_context():
+            changed = self._find_changed(counts)
+            changed.sort(key=lambda item: item['priority'], reverse=True)
+            self._refresh_all(changed, counts)
+            logging.info("Refresh pass: " + ', '.join(f"{count} {outcome}" for outcome, count in sorted(counts.items()))
+                         + f"; budget used {self.budget.stats()}")
+        return counts
+
+    def _find_changed(self, counts: Counter):
+        """Changed repositories as plain dictionaries with their metadata and priority
+
+        The pushed_at of every checked repository is recorded on the way.
+        """
+        query = RepositoryModel.query
+        if self.dataset_id:
+            query = query.filter_by(dataset_id=self.dataset_id)
+        # Stalest first, so a short budget goes to the repositories refreshed longest ago
+        repos = [repo for repo in query.order_by(RepositoryModel.last_refreshed_at).all() if '/' in (repo.name or '')]
+        repos.sort(key=lambda repo: repo.last_refreshed_at is not None)
+
+        processor = self._processor()
+        now = datetime.now()
+        changed = []
+        pushes = []
+        try:
+            for start in range(0, len(repos), GRAPHQL_BATCH_SIZE):
+                batch = repos[start:start + GRAPHQL_BATCH_SIZE]
+                if not self.budget.allows(api=1):
+                    counts['unchecked'] += len(repos) - start
+                    break
+                # A repository shared by several datasets is checked once
+                names = list({repo.name.lower(): tuple(repo.name.split('/', 1)) for repo in batch}.values())
+                try:
+                    metadata = processor.fetch_metadata_batch(names)
+                except Exception as e:
+                    # A rate limit, timeout or GraphQL error costs this batch, not the pass
+                    logging.warning(f"Could not check {len(batch)} repositories starting at {batch[0].name}: {str(e)}")
+                    counts['unchecked'] += len(batch)
+                    continue
+                finally:
+                    self.budget.spend(api=1)
+
+                for repo in batch:
+                    meta = metadata.get(repo.name.lower())
+                    if meta is None:
+                        counts['missing'] += 1
+                        continue
+                    pushed_at = parse_github_time(meta.get('pushed_at'))
+                    if pushed_at != repo.pushed_at:
+                        pushes.append({'id': repo.id, 'pushed_at': pushed_at})
+                    if is_changed(repo, meta.get('head_sha'), pushed_at):
+                        changed.append({
+                            'id': repo.id,
+                            'name': repo.name,
+                            'last_commit_sha': repo.last_commit_sha,
+                            'code_metrics': repo.get_code_metrics(),
+                            'metadata': meta,
+                            'priority': priority(repo, now)
+                        })
+                    else:
+                        counts['unchanged'] += 1
+        finally:
+            # One commit at the end, as committing expires the repositories still to check;
+            # the pushes recorded so far are kept even when the pass is cut short
+            if pushes:
+                db.session.execute(update(RepositoryModel), pushes)
+            db.session.commit()
+        return changed
+
+    def _refresh_all(self, changed, counts: Counter):
+        """Refresh changed repositories in order, up to workers at a time, while the budget allows
+
+        Results are written batch_size repositories at a time, and the rest when the pass ends.
+        """
+        queue = deque(changed)
+        in_flight = {}
+        pending = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='scheduled-refresh') as executor:
+                while queue or in_flight:
+                    # Running refreshes are charged their estimate until their actual cost is known
+                    reserved_api = self.estimated_api * len(in_flight)
+                    reserved_cpu = self.estimated_cpu * len(in_flight)
+                    while queue and len(in_flight) < self.workers and self.budget.allows(
+                            reserved_api + self.estimated_api, reserved_cpu + self.estimated_cpu):
+                        repo = queue.popleft()
+                        in_flight[executor.submit(self._refresh, repo)] = repo
+                        reserved_api += self.estimated_api
+                        reserved_cpu += self.estimated_cpu
+                    if not in_flight:
+                        counts['deferred'] += len(queue)
+                        logging.info(f"Refresh budget exhausted, {len(queue)} changed repositories deferred to a later pass")
+                        return
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._finish(in_flight.pop(future), future, pending, counts)
+                    if len(pending) >= self.batch_size:
+                        self._write(pending, counts)
+                        pending = []
+        finally:
+            self._write(pending, counts)
+
+    def _processor(self):
+        processor = getattr(self._local, 'processor', None)
+        if processor is None:
+            with self.app.app_context():
+                processor = self._local.processor = self.processor_factory()
+        return processor
+
+    def _refresh(self, repo: dict):
+        """Collect the metrics of one repository; runs in a worker thread and does not write to the database"""
+        owner, name = repo['name'].split('/', 1)
+        return self._processor().get_repo_metrics(
+            owner, name,
+            last_commit_sha=repo['last_commit_sha'],
+            cached_code_metrics=repo['code_metrics'],
+            metadata=repo['metadata']
+        )
+
+    def _finish(self, repo: dict, future, pending: list, counts: Counter):
+        """Charge the budget for a finished refresh and queue its result for writing"""
+        try:
+            metrics = future.result()
+        except Exception as e:
+            # The metadata requests were made; charge the estimate
+            self.budget.spend(api=self.estimated_api)
+            counts['failed'] += 1
+            logging.error(f"Scheduled refresh of {repo['name']} failed: {str(e)}")
+            return
+
+        api, cpu = refresh_cost(metrics.get('stages', {}))
+        self.budget.spend(api=api, cpu=cpu)
+        # Follow the observed costs so the next decisions use realistic estimates
+        self.estimated_api = 0.8 * self.estimated_api + 0.2 * api
+        self.estimated_cpu = 0.8 * self.estimated_cpu + 0.2 * cpu
+        pending.append((repo, metrics))
+
+    def _write(self, results, counts: Counter):
+        """Write the metrics of refreshed repositories in one transaction"""
+        if not results:
+            return
+        try:
+            now = datetime.now()
+            rows = []
+            refreshed = []
+            for repo, metrics in results:
+                rows.extend((repo['id'], metric_id, value) for metric_id, value in metric_values(metrics, collected_only=True))
+                values = {
+                    'id': repo['id'],
+                    'language': metrics['language'],
+                    'loc': metrics['loc'],
+                    'stars': metrics['stars'],
+                    'forks': metrics['forks'],
+                    'open_issues': metrics['open_issues'],
+                    'contributors': metrics['contributors'],
+                    'commits': metrics['commits'],
+                    'pushed_at': parse_github_time(metrics.get('pushed_at')),
+                    'last_refreshed_at': now
+                }
+                if metrics.get('commit_sha'):
+                    values['last_commit_sha'] = metrics['commit_sha']
+                    values['code_metrics'] = json.dumps(metrics['code_metrics']) if metrics['code_metrics'] else None
+                refreshed.append(values)
+            MetricRepoModel.bulk_upsert(rows)
+            db.session.execute(update(RepositoryModel), refreshed)
+            db.session.commit()
+            counts['refreshed'] += len(results)
+        except Exception as e:
+            db.session.rollback()
+            counts['failed'] += len(results)
+            logging.error(f"Could not save refreshed metrics of {', '.join(repo['name'] for repo, _ in results)}: {str(e)}")
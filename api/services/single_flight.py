@@ -0,0 +1,134 @@
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Tuple
+
+from db import db
+from model.analysis_snapshot import AnalysisSnapshotModel, SnapshotStatusEnum
+from services.archive_cache import ArchiveCache
+from services.heartbeat import Heartbeat
+
+# How often a process waiting on another one's analysis checks for the result,
+# and how long a claim survives without heartbeats before it is taken over
+SNAPSHOT_POLL_SECONDS = float(os.environ.get('ANALYSIS_SNAPSHOT_POLL_SECONDS', '2'))
+SNAPSHOT_LEASE_SECONDS = float(os.environ.get('ANALYSIS_SNAPSHOT_LEASE_SECONDS', '120'))
+
+
+def snapshot_key(owner: str, repo: str, sha: str) -> str:
+    # GitHub owner and repository names are case-insensitive
+    return f"{owner}/{repo}@{sha}".lower()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key in this process onto one execution
+
+    The first caller runs the function; callers arriving while it runs wait for
+    it and get the same result, or the same exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+
+    def do(self, key: str, fn: Callable) -> Tuple[object, bool]:
+        """Return (result, shared), shared being True for callers that waited on another's call"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+        if not leader:
+            return call.result(), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+# Shared by every processor of the process, so concurrent jobs coalesce too
+_analyses = SingleFlight()
+
+
+class SharedAnalyses:
+    """Runs each code analysis of owner/repo@sha once, across threads, processes and datasets
+
+    Threads of this process coalesce on a SingleFlight. Across processes the
+    analysis_snapshot table holds a claim on the commit while one process
+    analyses it and the resulting metrics afterwards, so other processes wait
+    for the claim holder instead of downloading the same archive, and any later
+    dataset adding the same commit reuses its metrics. Without an app (no
+    database) only threads of this process are coalesced.
+    """
+
+    def __init__(self, app=None, poll_seconds: float = SNAPSHOT_POLL_SECONDS,
+                 lease_seconds: float = SNAPSHOT_LEASE_SECONDS):
+        self.app = app
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+
+    def analyze(self, owner: str, repo: str, sha: Optional[str], analyze: Callable[[], Dict]) -> Tuple[Dict, bool]:
+        """Return (code_metrics, reused) for owner/repo@sha, calling analyze only if no one else does
+
+        reused is True when the metrics come from another caller's analysis.
+        """
+        if not ArchiveCache.is_cacheable(sha):
+            # Without a full commit SHA there is nothing stable to share
+            return analyze(), False
+        key = snapshot_key(owner, repo, sha)
+        (code_metrics, reused), shared = _analyses.do(key, lambda: self._analyze_once(key, owner, repo, sha, analyze))
+        return code_metrics, reused or shared
+
+    def _analyze_once(self, key, owner, repo, sha, analyze):
+        if self.app is None:
+            return analyze(), False
+
+        worker = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        waited = False
+        while True:
+            with self.app.app_context():
+                snapshot = AnalysisSnapshotModel.get(key)
+                if snapshot and snapshot.status == SnapshotStatusEnum.DONE:
+                    if waited:
+                        logging.info(f"Analysis of {key} finished by {snapshot.worker}, reusing it")
+                    return snapshot.get_code_metrics(), True
+                if AnalysisSnapshotModel.claim(key, f"{owner}/{repo}", sha, worker, self.lease_seconds):
+                    break
+                holder = AnalysisSnapshotModel.get(key)
+                holder_worker = holder.worker if holder else 'another process'
+            if not waited:
+                logging.info(f"Analysis of {key} in progress in {holder_worker}, waiting")
+                waited = True
+            time.sleep(self.poll_seconds)
+
+        try:
+            with Heartbeat(self.app, self.lease_seconds / 3,
+                           lambda: AnalysisSnapshotModel.heartbeat(key, worker), f'Heartbeat of analysis {key}'):
+                code_metrics = analyze()
+        except BaseException:
+            self._finish(key, worker, None)
+            raise
+        # A failed analysis is not worth sharing; a waiting process retries it
+        self._finish(key, worker, None if code_metrics.get('analysis_failed') else code_metrics)
+        return code_metrics, False
+
+    def _finish(self, key, worker, code_metrics):
+        with self.app.app_context():
+            try:
+                if code_metrics is None:
+                    AnalysisSnapshotModel.release(key, worker)
+                else:
+                    AnalysisSnapshotModel.publish(key, worker, code_metrics)
+            except Exception as e:
+                db.session.rollback()
+                logging.warning(f"Could not record analysis of {key}: {str(e)}")
@@ -57,6 +57,15 @@ class ErrorResponses:
       }, indent=2), status=400, mimetype='application/json'
     )
 
+  @staticmethod
+  def service_unavailable(description: str, retry_after: int):
+    return Response(
+      json.dumps({
+        'message': 'Service unavailable', 
+        'description': description
+      }, indent=2), status=503, mimetype='application/json', headers={'Retry-After': str(retry_after)}
+    )
+
   def invalid_n(repos_count: int):
     return Response(
       json.dumps({
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Run the pool of background workers that process queued jobs, e.g. repositories
+submitted for analysis
+
+Usage:
+    python worker.py [--processes N]
+"""
+
+import argparse
+import logging
+import os
+
+
+def load_app():
+    """Flask app with its database configuration, imported in each worker process"""
+    from app import app
+    return app
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Run background job workers')
+    parser.add_argument('--processes', type=int, default=int(os.environ.get('JOB_WORKER_PROCESSES', '2')),
+                        help='Number of worker processes')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(processName)s: %(message)s')
+
+    from app import create_db
+    from services.job_queue import run_worker_pool
+
+    # The API creates tables on its first request; workers may start first
+    create_db()
+    run_worker_pool(load_app, args.processes)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -1,4 +1,4 @@
-import { useEffect, useMemo, useState } from 'react';
+import { useEffect, useMemo, useRef, useState } from 'react';
 import { useRouter } from 'next/router';
 import axios from 'axios';
 import { Dots } from 'react-activity';
@@ -24,6 +24,10 @@ const SubmitRepositoryPage = () => {
   const [newDsName, setNewDsName] = useState('');
   const [newDsDesc, setNewDsDesc] = useState('');
   const [searchTerm, setSearchTerm] = useState('');
+  const jobEvents = useRef<AbortController | null>(null);
+
+  // Stop following a job's progress when leaving the page
+  useEffect(() => () => jobEvents.current?.abort(), []);
 
   useEffect(() => {
     if (!router.isReady) return;
@@ -169,6 +173,9 @@ const SubmitRepositoryPage = () => {
           type: 'success', 
           text: 'Repository submitted successfully! Processing has started.' 
         });
+        if (response.data?.job?.id) {
+          followJob(response.data.job.id);
+        }
         // Refresh the repos list to reflect the submission
         await loadGithubRepos();
       }
@@ -182,6 +189,97 @@ const SubmitRepositoryPage = () => {
     }
   }
 
+  function describeProgress(job: any) {
+    const progress = job.progress || {};
+    switch (job.stage) {
+      case 'queued':
+        return 'Waiting for a worker...';
+      case 'metadata':
+        return 'Fetching repository metadata...';
+      case 'downloading':
+        return progress.bytes_received
+          ? `Downloading source code (${(progress.bytes_received / 1048576).toFixed(1)} MB${progress.bytes_total ? ` of ${(progress.bytes_total / 1048576).toFixed(1)} MB` : ''})...`
+          : 'Downloading source code...';
+      case 'extracting':
+        return 'Extracting source code...';
+      case 'analysing':
+        return progress.files_done
+          ? `Analysing files (${progress.files_done}${progress.files_total ? ` of ${progress.files_total}` : ''})...`
+          : 'Analysing files...';
+      case 'persisting':
+        return 'Saving metrics...';
+      case 'done':
+        return 'Repository analysed and added to the dataset.';
+      default:
+        return 'Processing has started.';
+    }
+  }
+
+  function showJob(job: any) {
+    if (job.status === 'FAILED') {
+      setSubmitNotice({ type: 'error', text: 'Processing failed. An administrator can retry the request.' });
+    } else {
+      setSubmitNotice({ type: 'success', text: describeProgress(job) });
+    }
+  }
+
+  // Show each event of a job's stream; true once the job has finished
+  async function readJobEvents(body: ReadableStream<Uint8Array>) {
+    const reader = body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) return false;
+      buffer += decoder.decode(value, { stream: true });
+      let end;
+      while ((end = buffer.indexOf('\n\n')) >= 0) {
+        const lines = buffer.slice(0, end).split('\n');
+        buffer = buffer.slice(end + 2);
+        const type = lines.find((line) => line.startsWith('event:'))?.slice(6).trim();
+        const data = lines.filter((line) => line.startsWith('data:')).map((line) => line.slice(5).trim()).join('\n');
+        if (!data) continue;
+        const job = JSON.parse(data);
+        if (type === 'end') {
+          reader.cancel();
+          showJob(job);
+          return true;
+        }
+        // A failed job is reported by its 'end' event
+        if (type === 'progress' && job.status !== 'FAILED') showJob(job);
+      }
+    }
+  }
+
+  // Follow a job over Server-Sent Events, read with fetch so a 503 (too many open
+  // streams) is retried after its Retry-After instead of ending the updates
+  async function followJob(jobId: string) {
+    jobEvents.current?.abort();
+    const controller = new AbortController();
+    jobEvents.current = controller;
+    let retryAfter = 5;
+    try {
+      const response = await fetch(`${Constants.baseUrl}/jobs/${jobId}/events`, {
+        credentials: 'include',
+        headers: { Accept: 'text/event-stream' },
+        signal: controller.signal
+      });
+      if (response.status === 503) {
+        retryAfter = Number(response.headers.get('Retry-After')) || retryAfter;
+      } else if (!response.ok || !response.body || await readJobEvents(response.body)) {
+        // Finished, or the job is gone; the request list still shows its status
+        return;
+      }
+    } catch {
+      // Left the page, or the connection failed; the submission itself succeeded
+      return;
+    }
+    // Refused or timed out: reconnect unless another job is followed by then
+    setTimeout(() => {
+      if (jobEvents.current === controller && !controller.signal.aborted) followJob(jobId);
+    }, retryAfter * 1000);
+  }
+
   if (isLoading) {
     return (
       <div className="flex items-center justify-center min-h-screen">